@@ -1,8 +1,8 @@
 import streamlit as st
 import os
-import json
 from datetime import datetime
 from fpdf import FPDF
+from running_numbers import allocate_running_number
 
 # Directories
 DATA_DIR = "data"
@@ -38,18 +38,10 @@ def get_next_file_reference(mode, route=None):
     # Determine prefix
     prefix = road_freight_routes.get(route, mode[:2].upper())
 
-    # Load running numbers
+    # Allocate under a file lock (counter resets when a new month starts)
     data_file = os.path.join(DATA_DIR, "running_numbers.json")
-    running_numbers = json.load(open(data_file)) if os.path.exists(data_file) else {}
-
-    # Reset counter if new month starts
     key = f"{prefix}/{month_year}"
-    running_numbers[key] = running_numbers.get(key, 0) + 1
-    new_number = str(running_numbers[key]).zfill(3)
-
-    # Save updated numbers
-    with open(data_file, "w") as file:
-        json.dump(running_numbers, file)
+    new_number = str(allocate_running_number(key, data_file)).zfill(3)
 
     return f"{prefix}{new_number}/{month_year}"
 
@@ -1,8 +1,30 @@
 import streamlit as st
 import os
-import json
-from datetime import datetime
-from fpdf import FPDF
+import time
+from references import get_next_file_reference, reserve_file_references
+from documents import charge_sheet_output_path, sales_estimate_output_path, document_on_disk, save_document_in_background
+from document_cache import document_cache, render_document
+from reference_data import load_reference_data
+from charges import compile_schema
+from rerun_profiler import RerunProfiler, ProfileSwitch
+from metrics import observe, start_file_dump
+from document_catalog import get_catalog
+from image_variants import is_image, preview_path
+from search_index import get_search_index
+from ledger import get_ledger
+from client_registry import get_client_registry
+
+# Per-session rerun timings (see "Rerun timings" at the bottom of the page)
+profiler = st.session_state.setdefault("rerun_profiler", RerunProfiler())
+profiler.start()
+
+# Admin-only cProfile + flame graph captures of the next reruns or button actions, armed by
+# ?profile=N|<action>&token=$PROFILE_TOKEN or $APP_PROFILE; written to data/profiles/
+profiles = st.session_state.setdefault("profile_switch", ProfileSwitch())
+if profiles.arm_from_query(st.query_params):
+    for param in ("profile", "token"):
+        st.query_params.pop(param, None)
+profiles.start_rerun()
 
 # Directories
 DATA_DIR = "data"
@@ -10,66 +32,65 @@ UPLOAD_FOLDER = "uploads"
 CHARGE_SHEETS_FOLDER = "charge_sheets"
 INVOICES_FOLDER = "invoices"
 
-# Ensure directories exist
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(CHARGE_SHEETS_FOLDER, exist_ok=True)
-os.makedirs(INVOICES_FOLDER, exist_ok=True)
-
-# Modes for selection
-# modes = ["Air Freight", "Road Freight", "Sea Freight", "Bond", "Export"]
-modes = {
-    "Air Freight": "AA", 
-    "Road Freight": "", 
-    "Sea Freight": "SA", 
-    "Bond": "KB", 
-    "Export": "KE",
-    "Transit": "SE"
-}
-
-# Road Freight routes with specific prefixes
-road_freight_routes = {
-    "Beitbridge": "KA",
-    "Mutare": "KX",
-    "Plumtree": "KAA",
-    "Chirundu": "KAA"
-}
-
-# Sample registered clients (Load from file if needed)
-# registered_clients = ["ABC Logistics", "XYZ Traders", "Global Cargo Ltd"]
-registered_clients = {
-    "ABC Logistics": "TSLC0001",
-    "XYZ Traders": "TSLC0002",
-    "Global Cargo Ltd": "TSLC0003"
-}
-
-# Function to get next file reference
-def get_next_file_reference(mode, route=None):
-    today = datetime.today()
-    month_year = today.strftime("%m/%Y")
-    
-    # Determine prefix
-    # prefix = road_freight_routes.get(route, mode[:2].upper())
-    prefix = road_freight_routes.get(route, modes.get(mode))
-
-    # Load running numbers
-    data_file = os.path.join(DATA_DIR, "running_numbers.json")
-    running_numbers = json.load(open(data_file)) if os.path.exists(data_file) else {}
-
-    # Reset counter if new month starts
-    key = f"{prefix}/{month_year}"
-    running_numbers[key] = running_numbers.get(key, 0) + 1
-    new_number = str(running_numbers[key]).zfill(3)
-
-    # Save updated numbers
-    with open(data_file, "w") as file:
-        json.dump(running_numbers, file)
-
-    return f"{prefix}{new_number}/{month_year}"
+# Ensure directories exist (once per process, not on every rerun)
+@st.cache_resource
+def ensure_directories():
+    for directory in (DATA_DIR, UPLOAD_FOLDER, CHARGE_SHEETS_FOLDER, INVOICES_FOLDER):
+        os.makedirs(directory, exist_ok=True)
+    return True
+
+# Reference tables (modes, routes, clients, charge lines), reloaded only when invalidated
+@st.cache_data
+def cached_reference_data():
+    return load_reference_data()
+
+# Shared PostgreSQL pool, created on first use only
+@st.cache_resource
+def get_db_pool():
+    from file_reference import get_pool
+    return get_pool()
+
+ensure_directories()
+start_file_dump()  # data/metrics.prom every 15s, for the Prometheus textfile collector
+reference_data = cached_reference_data()
+modes = reference_data["modes"]
+road_freight_routes = reference_data["road_freight_routes"]
+charge_fields = reference_data["charge_fields"]
+
+# Admin: explicit invalidation of cached resources
+with st.sidebar.expander("Caches"):
+    if st.button("Reload reference data"):
+        cached_reference_data.clear()
+        st.rerun()
+    if st.button("Clear document cache"):
+        document_cache.clear()
+    if st.button("Reset database pool"):
+        from file_reference import close_pool
+        close_pool()
+        get_db_pool.clear()
+    if st.button("Rescan uploads"):
+        summary = get_catalog(UPLOAD_FOLDER).sync()
+        st.caption(f"{summary['added']} added, {summary['updated']} updated, {summary['removed']} removed")
+    if st.button("Update search index"):
+        summary = get_search_index().update()
+        st.caption(f"{summary['indexed']} indexed, {summary['removed']} removed")
+
+profiler.lap("setup")
 
 # Streamlit UI
 st.title("File Management System")
 
+# Full-text search over uploaded and generated PDFs (container numbers, AWBs, invoice numbers...)
+search_query = st.text_input("Search Documents", placeholder="Container number, AWB, invoice number...")
+if search_query:
+    search_started = time.perf_counter()
+    hits = get_search_index().search(search_query)
+    st.caption(f"{len(hits)} results in {(time.perf_counter() - search_started) * 1000:.0f} ms")
+    for hit in hits:
+        st.markdown(f"**{hit.reference}** · `{hit.path}`  \n{hit.snippet}")
+
+profiler.lap("search")
+
 # Select shipment mode
 # mode = st.selectbox("Select Mode", modes)
 mode = st.selectbox("Select Mode", list(modes.keys()))
@@ -77,19 +98,72 @@ route = st.selectbox("Select Route", list(road_freight_routes.keys())) if mode =
 
 # Generate file reference
 if st.button("Generate File Reference"):
-    file_ref = get_next_file_reference(mode, route)
+    with profiles.action("file_reference"):
+        file_ref = get_next_file_reference(mode, route, reference_data)
     st.session_state.setdefault("file_refs", []).append(file_ref)
+    st.session_state.setdefault("file_ref_routes", {})[file_ref] = (mode, route)
     st.success(f"Generated File Reference: {file_ref}")
 
+# Generate a batch of file references (e.g. a multi-consignment booking)
+batch_size = st.number_input("Number of References", min_value=1, max_value=500, value=1, step=1)
+if st.button(f"Generate {batch_size} File References", key="generate_file_reference_batch"):
+    new_refs = reserve_file_references(mode, route, int(batch_size), reference_data)
+    st.session_state.setdefault("file_refs", []).extend(new_refs)
+    st.session_state.setdefault("file_ref_routes", {}).update(dict.fromkeys(new_refs, (mode, route)))
+    st.success(f"Generated {len(new_refs)} File References: {new_refs[0]} to {new_refs[-1]}")
+
+profiler.lap("file_reference")
+
 # Select file reference
 file_refs = st.session_state.get("file_refs", [])
 selected_ref = st.selectbox("Select File Reference", file_refs if file_refs else ["No references yet"], index=0)
+# The mode and route it was generated for, recorded with its documents in the ledger
+selected_mode, selected_route = st.session_state.get("file_ref_routes", {}).get(selected_ref, (None, None))
+
+# Documents already uploaded for the reference (indexed catalog lookup, no directory scan)
+if file_refs:
+    with st.expander("Uploaded Documents"):
+        documents = get_catalog(UPLOAD_FOLDER).for_reference(selected_ref)
+        if documents:
+            st.table([{"Document": entry.original_name, "Uploaded": entry.uploaded_at, "Size (KB)": round(entry.size / 1024, 1),
+                       "Customer": entry.customer or ""} for entry in documents])
+            # Thumbnails rather than the full-resolution photos
+            photos = [entry for entry in documents if is_image(entry.path)]
+            if photos:
+                st.image([preview_path(os.path.join(UPLOAD_FOLDER, entry.path)) for entry in photos],
+                         caption=[entry.original_name for entry in photos], width=160)
+        else:
+            st.caption("No documents uploaded yet.")
 
 # Customer Selection/Input
 st.subheader("Customer Details")
-customer_option = st.radio("Choose Customer", ["Select from Registered Clients", "Enter Manually"])
-
-customer = st.selectbox("Select Customer", registered_clients.keys()) if customer_option == "Select from Registered Clients" else st.text_input("Enter Customer Name")
+customer_option = st.radio("Choose Customer", ["Select from Registered Clients", "Register New Client"])
+
+# Clients are searched server-side; only the matches for what's typed reach the selectbox
+clients = get_client_registry()
+if customer_option == "Select from Registered Clients":
+    client_query = st.text_input("Search Clients", placeholder="Name or customer ID")
+    matches = clients.search(client_query)
+    client = st.selectbox("Select Customer", matches, format_func=lambda client: f"{client.name} ({client.customer_id})")
+    if client_query and not matches:
+        st.caption("No matching clients. Choose \"Register New Client\" to add one.")
+else:
+    new_client_name = st.text_input("Client Name")
+    client = clients.lookup(new_client_name) if new_client_name.strip() else None
+    if client:
+        st.caption(f"Already registered as {client.customer_id}.")
+    elif new_client_name.strip():
+        # Near-duplicates (typos, "Ltd" vs "Limited") must be confirmed before a new ID is allocated
+        similar = clients.similar(new_client_name)
+        if similar:
+            st.warning("Similar clients are already registered: " + ", ".join(f"{c.name} ({c.customer_id})" for c in similar))
+        confirmed = not similar or st.checkbox("This is a different client")
+        if st.button("Register Client", disabled=not confirmed):
+            client = clients.register(new_client_name)
+            st.success(f"Registered {client.name} as {client.customer_id}")
+customer = client.name if client else ""
+
+profiler.lap("customer")
 
 # # NHS Charge Sheet Data Entry
 # st.subheader("Enter Charges for Selected File Reference")
@@ -107,155 +181,82 @@ customer = st.selectbox("Select Customer", registered_clients.keys()) if custome
 # NHS Charge Sheet Data Entry
 st.subheader("Enter Charges for Selected File Reference")
 
-charge_fields = [
-    "Disbursement Fees", "Professional Handlers", "Agency", "Documentation Fee", "Storage (DHL)", 
-    "Border Agent Handling Fee", "Handling", "Airway Bill Fee", "Release Fee (DHL)", "GMS Charges", 
-    "ZIMRA Submission Fee", "ZIMRA Duty", "ZIMRA VAT", "Physical Inspection", "Special Attendance", 
-    "Presumptive Tax", "RIB Entry", "Warehouse Entry", "Consumption Entry", "Export Permits", 
-    "Phytosanitary Certificate", "CSA/SADC Certificate of Origin", "Port Health and EMA Inspection Fee", 
-    "AMA Certificate", "Courier (FedEx/DHL)", "Cargo Carriers", "Professional Handlers", 
-    "PE Charges at Port of Entry", "Other"
-]
-
+charge_schema = compile_schema(charge_fields)
 charge_data = {}
 for i, field in enumerate(charge_fields):
     charge_data[field] = st.number_input(f"{field} (USD)", min_value=0.0, format="%.2f", key=f"charge_{i}")
+charge_data = charge_schema.vector(charge_data)
 
+profiler.lap("charge_form")
 
-# Function to generate charge sheet with non-zero values only
-def generate_charge_sheet(reference, customer, charge_data):
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    
-    # Header
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(200, 8, f"Charge Out Sheet - {reference}", ln=True, align="C")
-    
-    pdf.set_font("Arial", "", 10)
-    pdf.cell(100, 5, f"Customer: {customer}", ln=True)
-    pdf.cell(100, 5, f"Customer ID: {registered_clients.get(customer)}", ln=True)
-    pdf.cell(100, 5, f"Date: {datetime.today().strftime('%d-%m-%Y')}", ln=True)
-    
-    pdf.ln(4)
-
-    # Table Headers
-    pdf.set_font("Arial", "B", 10)
-    pdf.cell(120, 6, "NHS Service", border=1)
-    pdf.cell(60, 6, "Charge (USD)", border=1, ln=True)
-
-    pdf.set_font("Arial", "", 10)
-    
-    total_amount = 0
-    for field, amount in charge_data.items():
-        if amount > 0:  # Only include non-zero charges
-            pdf.cell(120, 6, field, border=1)
-            pdf.cell(60, 6, f"${amount:.2f}", border=1, ln=True)
-            total_amount += amount
-
-    pdf.ln(4)
-
-    # Total Amount
-    pdf.set_font("Arial", "B", 10)
-    pdf.cell(120, 6, "TOTAL", border=1)
-    pdf.cell(60, 6, f"${total_amount:.2f}", border=1, ln=True)
-
-    pdf.ln(6)  
-
-    # Approval Section
-    pdf.set_font("Arial", "", 10)
-    pdf.cell(100, 5, "Compiled by: Operations", ln=True)
-    pdf.cell(100, 5, "Approver 1: ___________________", ln=True)
-    pdf.cell(100, 5, "Approver 2: ___________________", ln=True)
-
-    # Save PDF
-    charge_sheet_path = f"charge_sheets/Charge_Sheet_{reference.replace('/', '')}.pdf"
-    pdf.output(charge_sheet_path)
-    
-    return charge_sheet_path
-
-
-# Function to generate Sales Estimate Invoice PDF
-def generate_sales_estimate(reference, customer, charge_data):
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    
-    # Header
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(200, 8, "IFS SALES ESTIMATE INVOICE", ln=True, align="C")
-    
-    pdf.set_font("Arial", "", 10)
-    pdf.cell(100, 5, f"Customer: {customer}", ln=True)
-    pdf.cell(100, 5, f"Customer ID: {registered_clients.get(customer)}", ln=True)
-    pdf.cell(100, 5, f"Invoice Ref: {reference}", ln=True)
-    pdf.cell(100, 5, f"Date: {datetime.today().strftime('%d-%m-%Y')}", ln=True)
-
-    pdf.ln(4)
-
-    # Table Headers
-    pdf.set_font("Arial", "B", 10)
-    pdf.cell(120, 6, "Service Description", border=1)
-    pdf.cell(60, 6, "Amount (USD)", border=1, ln=True)
-
-    pdf.set_font("Arial", "", 10)
-
-    subtotal = 0
-    for field, amount in charge_data.items():
-        if amount > 0:
-            pdf.cell(120, 6, field, border=1)
-            pdf.cell(60, 6, f"${amount:.2f}", border=1, ln=True)
-            subtotal += amount
-
-    pdf.ln(4)
-
-    # VAT Calculation
-    vat = subtotal * 0.15  # Assuming 15% VAT rate
-    total = subtotal + vat
-
-    pdf.set_font("Arial", "B", 10)
-    pdf.cell(120, 6, "TOTAL EXCL. VAT", border=1)
-    pdf.cell(60, 6, f"${subtotal:.2f}", border=1, ln=True)
-
-    pdf.cell(120, 6, "VAT @ 15%", border=1)
-    pdf.cell(60, 6, f"${vat:.2f}", border=1, ln=True)
-
-    pdf.cell(120, 6, "TOTAL", border=1)
-    pdf.cell(60, 6, f"${total:.2f}", border=1, ln=True)
-
-    pdf.ln(10)
-    
-    # Payment Terms & Notes (Based on Template)
-    pdf.set_font("Arial", "", 10)
-    pdf.multi_cell(0, 6, "This Sales Estimate is valid for 30 days. Payment should be made in full before service is rendered.", border=0)
-
-    # Save PDF
-    sales_estimate_path = f"invoices/Sales_Estimate_{reference.replace('/', '')}.pdf"
-    pdf.output(sales_estimate_path)
-    
-    return sales_estimate_path
-
-
+# Previews are rendered and downloaded from memory only; otherwise a copy is archived in the background
+preview_only = st.checkbox("Preview only (don't save a copy)")
 
 # Generate Charge Sheet Button
 if st.button("Generate Charge Sheet"):
-    if selected_ref and customer:
-        charge_sheet_path = generate_charge_sheet(selected_ref, customer, charge_data)
-        st.success(f"Charge Sheet Generated: {charge_sheet_path}")
-        with open(charge_sheet_path, "rb") as f:
-            st.download_button("Download Charge Sheet", f, file_name=f"Charge_Sheet_{selected_ref}.pdf", mime="application/pdf")
-    else:
-        st.error("Select a file reference and customer.")
+    with profiles.action("charge_sheet"):
+        if selected_ref and customer:
+            charge_sheet_pdf, cached = render_document("charge_sheet", selected_ref, customer, charge_data, disk=not preview_only)
+            charge_sheet_path = charge_sheet_output_path(selected_ref)
+            if preview_only:
+                st.success("Charge Sheet Generated (preview)")
+            else:
+                issued = get_ledger().record("charge_sheet", selected_ref, customer, charge_data,
+                                             mode=selected_mode, route=selected_route)
+                if cached and document_on_disk(charge_sheet_pdf, charge_sheet_path):
+                    st.success(f"Charge Sheet unchanged: {charge_sheet_path} (version {issued.version})")
+                else:
+                    save_document_in_background(charge_sheet_pdf, charge_sheet_path).add_done_callback(
+                        lambda _, path=charge_sheet_path: get_search_index().index_file(path))
+                    st.success(f"Charge Sheet Generated: {charge_sheet_path} (version {issued.version})")
+            st.download_button("Download Charge Sheet", charge_sheet_pdf, file_name=f"Charge_Sheet_{selected_ref}.pdf", mime="application/pdf")
+        else:
+            st.error("Select a file reference and customer.")
 
 # Generate Sales Estimate Button
 if st.button("Generate Sales Estimate Invoice"):
-    if selected_ref and customer:
-        sales_estimate_path = generate_sales_estimate(selected_ref, customer, charge_data)
-        st.success(f"Sales Estimate Generated: {sales_estimate_path}")
-        with open(sales_estimate_path, "rb") as f:
-            st.download_button("Download Sales Estimate", f, file_name=f"Sales_Estimate_{selected_ref}.pdf", mime="application/pdf")
-    else:
-        st.error("Select a file reference and customer.")
+    with profiles.action("sales_estimate"):
+        if selected_ref and customer:
+            sales_estimate_pdf, cached = render_document("sales_estimate", selected_ref, customer, charge_data, disk=not preview_only)
+            sales_estimate_path = sales_estimate_output_path(selected_ref)
+            if preview_only:
+                st.success("Sales Estimate Generated (preview)")
+            else:
+                issued = get_ledger().record("sales_estimate", selected_ref, customer, charge_data,
+                                             mode=selected_mode, route=selected_route)
+                if cached and document_on_disk(sales_estimate_pdf, sales_estimate_path):
+                    st.success(f"Sales Estimate unchanged: {sales_estimate_path} (version {issued.version})")
+                else:
+                    save_document_in_background(sales_estimate_pdf, sales_estimate_path).add_done_callback(
+                        lambda _, path=sales_estimate_path: get_search_index().index_file(path))
+                    st.success(f"Sales Estimate Generated: {sales_estimate_path} (version {issued.version})")
+            st.download_button("Download Sales Estimate", sales_estimate_pdf, file_name=f"Sales_Estimate_{selected_ref}.pdf", mime="application/pdf")
+        else:
+            st.error("Select a file reference and customer.")
+
+# Every issued version of the reference's documents, re-rendered from the ledger on demand
+issued_documents = get_ledger().versions(selected_ref) if file_refs else []
+if issued_documents:
+    with st.expander("Issued Documents"):
+        st.table([{"Document": document.document_type.replace("_", " ").title(), "Version": document.version,
+                   "Issued": document.issued_at, "Customer": document.customer,
+                   "Total (USD)": f"{document.total_cents / 100:,.2f}"} for document in issued_documents])
+        reissue = st.selectbox("Re-render", issued_documents, format_func=lambda document:
+                               f"{document.document_type.replace('_', ' ').title()} v{document.version} ({document.issued_at})")
+        if st.button("Re-render from ledger"):
+            st.download_button("Download", get_ledger().rerender(reissue.id), mime="application/pdf",
+                               file_name=f"{reissue.document_type.title()}_{selected_ref}_v{reissue.version}.pdf")
+
+cache_stats = document_cache.stats()
+st.caption(f"Document cache: {cache_stats['hits']} hits ({cache_stats['disk_hits']} from disk), {cache_stats['misses']} misses")
+
+profiler.lap("documents")
+observe("app_rerun", profiler.finish()["total"])
+profiles.finish_rerun()
+with st.expander("Rerun timings"):
+    st.markdown(profiler.summary_markdown())
+    for paths in profiles.captures:
+        st.caption(f"Profile: {paths[0]} (+ .folded, .txt, .pstats)")
 
 
 # 🚀 Final Enhancements
@@ -1,6 +1,7 @@
 import streamlit as st
 import os
 from file_reference import generate_file_reference, save_file_reference
+from upload_storage import save_upload, get_upload_queue, render_upload_jobs, session_uploader
 
 # # Streamlit UI
 # st.title("📂 Clearing & Forwarding - File Reference Generator")
@@ -78,17 +79,30 @@ if route:
 
 # Process file upload if required
 uploaded_file = st.file_uploader("Upload a file", type=["pdf", "jpg", "png"])
-if uploaded_file:
-    # Generate the file reference and save the file (code from previous step)
+
+# Each upload is processed once: every later rerun (e.g. "Refresh status") still
+# sees the same file in the uploader, so it's keyed by its file_id
+processed_uploads = st.session_state.setdefault("processed_uploads", {})
+if uploaded_file and uploaded_file.file_id not in processed_uploads:
+    # The reference is allocated inline, not queued: it names the stored file and
+    # its uploads/<reference>/ folder, so the save below can't happen without it
+    # (one round trip to Postgres, against the database insert that is queued)
     file_reference = generate_file_reference(mode, route)
-    filename = f"{file_reference}_{uploaded_file.name}"
-    save_path = os.path.join(UPLOAD_FOLDER, filename)
-    
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    
+    filename = f"{file_reference.replace('/', '')}_{uploaded_file.name}"
+
+    # Only the durable write happens here; cataloguing and the DB insert run as queued jobs
     try:
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.read())
-        st.success(f"File saved: {save_path}")
+        upload_queue = get_upload_queue()
+        stored = save_upload(uploaded_file, file_reference, filename, UPLOAD_FOLDER,
+                             uploader=session_uploader(st), queue=upload_queue)
+        job_id = upload_queue.enqueue("save_file_reference", {"mode": mode, "route": route, "reference": file_reference,
+                                                               "document_path": stored.path})
+        st.session_state.setdefault("upload_jobs", []).extend(stored.jobs + (job_id,))
+        processed_uploads[uploaded_file.file_id] = stored.path
     except Exception as e:
         st.error(f"Error saving file: {e}")
+if uploaded_file and uploaded_file.file_id in processed_uploads:
+    st.success(f"File saved: {processed_uploads[uploaded_file.file_id]}")
+
+# Background processing of uploads, polled on every rerun
+render_upload_jobs(st, st.session_state.get("upload_jobs", []))
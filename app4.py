@@ -1,6 +1,8 @@
 import streamlit as st
 import os
 from datetime import datetime
+from running_numbers import file_lock, atomic_write
+from upload_storage import save_upload, get_upload_queue, render_upload_jobs, session_uploader
 
 # Folder to store uploads
 UPLOAD_FOLDER = "uploads"
@@ -49,20 +51,21 @@ def get_running_number(month_year):
     if not os.path.exists(running_number_dir) and running_number_dir:
         os.makedirs(running_number_dir)
 
-    # Check if the file for the current month exists
-    if os.path.exists(running_number_file):
-        with open(running_number_file, "r") as file:
-            running_number = int(file.read())
-    else:
-        running_number = 0
-    
-    # Increment the running number
-    running_number += 1
-    
-    # Save the updated running number for the next use
-    with open(running_number_file, "w") as file:
-        file.write(str(running_number).zfill(3))  # Ensure 3 digits (e.g., 001, 002)
-    
+    # Read, increment and save under a file lock so concurrent sessions never share a number
+    with file_lock(running_number_file):
+        # Check if the file for the current month exists
+        if os.path.exists(running_number_file):
+            with open(running_number_file, "r") as file:
+                running_number = int(file.read())
+        else:
+            running_number = 0
+
+        # Increment the running number
+        running_number += 1
+
+        # Save the updated running number for the next use
+        atomic_write(running_number_file, str(running_number).zfill(3))  # Ensure 3 digits (e.g., 001, 002)
+
     return str(running_number).zfill(3)
 
 # Collect input from the user
@@ -81,21 +84,25 @@ if route:
 # Process file upload if required
 uploaded_file = st.file_uploader("Upload a file", type=["pdf", "jpg", "png"])
 
-if uploaded_file:
+# Each upload is processed once: every later rerun (e.g. "Refresh status") still
+# sees the same file in the uploader, so it's keyed by its file_id
+processed_uploads = st.session_state.setdefault("processed_uploads", {})
+if uploaded_file and uploaded_file.file_id not in processed_uploads:
     # Generate the file reference
     file_reference = generate_file_reference(mode, route)
     timestamp = datetime.now().strftime("%Y-%m-%dT%H%M%S.%f")  # Timestamp for uniqueness
-    filename = f"{file_reference}_{uploaded_file.name.split('.')[0]}_{timestamp}.{uploaded_file.name.split('.')[-1]}"
-    
-    # Create the directory if it does not exist
-    file_path = os.path.join(UPLOAD_FOLDER, file_reference)  # Corrected path construction
-    os.makedirs(file_path, exist_ok=True)  # This will create the directory if it doesn't exist
-    
-    # Save the uploaded file
-    save_path = os.path.join(file_path, filename)
+    filename = f"{file_reference.replace('/', '')}_{uploaded_file.name.split('.')[0]}_{timestamp}.{uploaded_file.name.split('.')[-1]}"
+
+    # Stream the uploaded file into uploads/<reference>/ (chunked, hashed, atomic rename)
     try:
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.read())
-        st.success(f"File saved: {save_path}")
+        stored = save_upload(uploaded_file, file_reference, filename, UPLOAD_FOLDER,
+                             uploader=session_uploader(st), queue=get_upload_queue())
+        st.session_state.setdefault("upload_jobs", []).extend(stored.jobs)
+        processed_uploads[uploaded_file.file_id] = stored.path
     except Exception as e:
         st.error(f"Error saving file: {e}")
+if uploaded_file and uploaded_file.file_id in processed_uploads:
+    st.success(f"File saved: {processed_uploads[uploaded_file.file_id]}")
+
+# Background processing of uploads (catalogue, thumbnails), polled on every rerun
+render_upload_jobs(st, st.session_state.get("upload_jobs", []))
@@ -0,0 +1,162 @@
+"""
+Batch rendering of charge sheets and sales estimates across a process pool.
+
+Python API:
+
+    from batch_render import render_batch
+    results = render_batch(jobs, workers=4)
+
+where each job is a dict with "reference", "customer" and "charge_data",
+and optionally the "mode" and "route" the reference was allocated for.
+
+CLI (one JSON job per line):
+
+    python batch_render.py jobs.jsonl --workers 4 --documents charge_sheet sales_estimate
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from documents import (
+    CHARGE_SHEETS_FOLDER, INVOICES_FOLDER,
+    generate_charge_sheet, generate_sales_estimate,
+    charge_sheet_output_path, sales_estimate_output_path,
+)
+
+# Document types the engine can render: generator, output path, default folder
+DOCUMENT_TYPES = {
+    "charge_sheet": (generate_charge_sheet, charge_sheet_output_path, CHARGE_SHEETS_FOLDER),
+    "sales_estimate": (generate_sales_estimate, sales_estimate_output_path, INVOICES_FOLDER),
+}
+
+
+def _render_job(job, documents, output_dirs):
+    """Renders every requested document for one job, isolating failures per document."""
+    results = []
+    for document in documents:
+        generator, _, _ = DOCUMENT_TYPES[document]
+        try:
+            path = generator(job["reference"], job["customer"], job["charge_data"], output_dirs[document],
+                             mode=job.get("mode"), route=job.get("route"))
+            results.append({"reference": job["reference"], "document": document, "path": path, "error": None})
+        except Exception:
+            results.append({"reference": job["reference"], "document": document, "path": None,
+                            "error": traceback.format_exc(limit=1).strip().splitlines()[-1]})
+    return results
+
+
+def _failed(job, documents, error):
+    return [{"reference": job.get("reference"), "document": document, "path": None, "error": error}
+            for document in documents]
+
+
+def render_batch(jobs, workers=None, documents=("charge_sheet", "sales_estimate"),
+                 output_dirs=None, progress=None):
+    """
+    Renders a stream of jobs across a process pool and returns one result
+    dict per (job, document) with its output path or error message.
+
+    jobs may be any iterable (it is consumed lazily, with a bounded number
+    of jobs in flight). progress, if given, is called as progress(done, total_so_far)
+    after each job finishes. A reference appearing twice in one batch is
+    rendered once; the repeat is reported as an error since both would
+    write to the same path.
+    """
+    unknown = set(documents) - set(DOCUMENT_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown document types: {', '.join(sorted(unknown))}")
+
+    output_dirs = {document: (output_dirs or {}).get(document, DOCUMENT_TYPES[document][2]) for document in documents}
+    for directory in output_dirs.values():
+        os.makedirs(directory, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 4
+    results = []
+    seen = set()
+    submitted = done = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+
+        def _collect(finished):
+            nonlocal done
+            for future in finished:
+                job = pending.pop(future)
+                try:
+                    results.extend(future.result())
+                except Exception as e:  # worker crashed or job could not be pickled
+                    results.extend(_failed(job, documents, f"{type(e).__name__}: {e}"))
+                done += 1
+                if progress:
+                    progress(done, submitted)
+
+        for job in jobs:
+            reference = job.get("reference")
+            if not reference or reference in seen:
+                error = "Missing reference" if not reference else "Duplicate reference in batch"
+                results.extend(_failed(job, documents, error))
+                continue
+            seen.add(reference)
+
+            pending[pool.submit(_render_job, job, documents, output_dirs)] = job
+            submitted += 1
+            if len(pending) >= max_in_flight:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(finished)
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            _collect(finished)
+
+    return results
+
+
+def read_jobs(path):
+    """Yields jobs from a JSON Lines file ("-" for stdin)."""
+    file = sys.stdin if path == "-" else open(path)
+    try:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render charge sheets and sales estimates in parallel.")
+    parser.add_argument("jobs", help='JSON Lines file of {"reference", "customer", "charge_data"} jobs '
+                        '(optionally "mode" and "route"), or "-" for stdin')
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--documents", nargs="+", choices=sorted(DOCUMENT_TYPES), default=["charge_sheet", "sales_estimate"])
+    parser.add_argument("--charge-sheets-dir", default=CHARGE_SHEETS_FOLDER)
+    parser.add_argument("--invoices-dir", default=INVOICES_FOLDER)
+    args = parser.parse_args(argv)
+
+    def report(done, submitted):
+        print(f"\rRendered {done}/{submitted} jobs", end="", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    results = render_batch(read_jobs(args.jobs), workers=args.workers, documents=args.documents,
+                           output_dirs={"charge_sheet": args.charge_sheets_dir, "sales_estimate": args.invoices_dir},
+                           progress=report)
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+
+    failures = [result for result in results if result["error"]]
+    for result in failures:
+        print(f"FAILED {result['reference']} {result['document']}: {result['error']}", file=sys.stderr)
+
+    rendered = len(results) - len(failures)
+    print(f"{rendered} documents rendered, {len(failures)} failed in {elapsed:.2f}s "
+          f"({rendered / elapsed if elapsed else 0:,.1f} docs/sec, {args.workers} workers)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Throughput of batch_render.render_batch (docs/sec) by worker count.
+
+Renders the same synthetic month-end batch of charge sheets and sales
+estimates once per worker count. Everything runs in a scratch working
+directory, so the ledger and client registry records of the benchmark
+documents never reach data/.
+
+    python benchmarks/bench_batch_render.py --jobs 400 --workers 1 2 4 8
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_render import render_batch
+
+CHARGE_LINES = [
+    "Disbursement Fees", "Professional Handlers", "Agency", "Documentation Fee", "Storage (DHL)",
+    "Border Agent Handling Fee", "Handling", "Airway Bill Fee", "ZIMRA Duty", "ZIMRA VAT",
+]
+
+
+def make_jobs(count, seed=0):
+    rng = random.Random(seed)
+    return [{
+        "reference": f"KA{i + 1:03}/03/2025",
+        "customer": rng.choice(["ABC Logistics", "XYZ Traders", "Global Cargo Ltd"]),
+        "charge_data": {line: round(rng.uniform(0, 500), 2) for line in rng.sample(CHARGE_LINES, rng.randint(3, len(CHARGE_LINES)))},
+    } for i in range(count)]
+
+
+def run(job_count, worker_counts):
+    jobs = make_jobs(job_count)
+    print(f"{'workers':>7}  {'docs':>6}  {'seconds':>8}  {'docs/sec':>9}")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)  # the ledger and client registry open relative to the working directory
+        try:
+            for workers in worker_counts:
+                output_dirs = {document: os.path.join(scratch, f"workers_{workers}", folder)
+                               for document, folder in (("charge_sheet", "charge_sheets"), ("sales_estimate", "invoices"))}
+                start = time.perf_counter()
+                results = render_batch(jobs, workers=workers, output_dirs=output_dirs)
+                elapsed = time.perf_counter() - start
+                failures = [result for result in results if result["error"]]
+                if failures:
+                    raise SystemExit(f"FAIL: {len(failures)} documents failed, e.g. {failures[0]['error']}")
+                print(f"{workers:>7}  {len(results):>6}  {elapsed:>8.2f}  {len(results) / elapsed:>9.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    run(args.jobs, args.workers)
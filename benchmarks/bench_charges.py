@@ -0,0 +1,65 @@
+"""
+Totals, VAT and per-field sums over many files: per-file dict loops vs ChargeMatrix.
+
+    python benchmarks/bench_charges.py --files 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from charges import ChargeMatrix, compile_schema, np
+from reference_data import DEFAULT_REFERENCE_DATA
+
+
+def make_files(schema, count, seed=0):
+    rng = random.Random(seed)
+    return [{field: round(rng.uniform(0, 800), 2) if rng.random() < 0.3 else 0.0 for field in schema.fields}
+            for _ in range(count)]
+
+
+def dict_loops(files):
+    totals, field_sums = [], {}
+    for charge_data in files:
+        subtotal = 0
+        for field, amount in charge_data.items():
+            if amount > 0:
+                subtotal += amount
+                field_sums[field] = field_sums.get(field, 0) + amount
+        totals.append(subtotal + subtotal * 0.15)
+    return totals, field_sums
+
+
+def run(count):
+    schema = compile_schema(DEFAULT_REFERENCE_DATA["charge_fields"])
+    files = make_files(schema, count)
+
+    start = time.perf_counter()
+    dict_loops(files)
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix = ChargeMatrix.stack(schema, [schema.vector(charge_data) for charge_data in files])
+    stack_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix.totals_cents()
+    matrix.vat_cents()
+    matrix.field_sums_cents()
+    matrix_seconds = time.perf_counter() - start
+
+    backend = "numpy" if np is not None else "pure Python"
+    print(f"{count:,} files x {len(schema)} fields ({backend})")
+    print(f"  dict loops (float)       {loop_seconds * 1000:>9.1f} ms")
+    print(f"  build ChargeMatrix       {stack_seconds * 1000:>9.1f} ms (one-off)")
+    print(f"  matrix totals/VAT/sums   {matrix_seconds * 1000:>9.1f} ms (exact cents)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=100_000)
+    args = parser.parse_args()
+    run(args.files)
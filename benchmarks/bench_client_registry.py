@@ -0,0 +1,75 @@
+"""
+Type-ahead latency of the client registry with many registered clients.
+
+Registers N synthetic client names in a scratch registry, then times what
+the customer selector does on each keystroke: a one-letter prefix, a
+multi-word prefix, a customer ID and a misspelt name, plus reopening the
+registry (loading the index) as a new process would.
+
+    python benchmarks/bench_client_registry.py --clients 20000
+"""
+import os
+import sys
+import time
+import random
+import string
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client_registry import ClientRegistry
+
+TRADES = ["Freight", "Logistics", "Traders", "Mining", "Agro", "Holdings", "Transport", "Motors", "Foods", "Pharma"]
+SUFFIXES = ["Ltd", "(Pvt) Ltd", "Limited", ""]
+
+
+def client_names(count, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))).title()
+        names.add(f"{word} {rng.choice(TRADES)} {rng.choice(SUFFIXES)}".strip())
+    return sorted(names)
+
+
+def timed(query, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows = query()
+    return (time.perf_counter() - start) / repeat, len(rows)
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "clients.db")
+        registry = ClientRegistry(db_path, seed=False)
+        names = client_names(count)
+        start = time.perf_counter()
+        for name in names:
+            registry.register(name)
+        print(f"Registered {count:,} clients in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        registry = ClientRegistry(db_path, seed=False)
+        print(f"Loaded the index in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        sample = names[count // 2]
+        misspelt = sample[:2] + sample[3:]
+        queries = {
+            "one letter": lambda: registry.search(sample[0]),
+            "word prefixes": lambda: registry.search(" ".join(word[:3] for word in sample.split()[:2])),
+            "customer ID": lambda: registry.search(registry.lookup(sample).customer_id),
+            f"misspelt ({misspelt})": lambda: registry.search(misspelt),
+            "near-duplicates": lambda: registry.similar(misspelt),
+        }
+        for label, query in queries.items():
+            seconds, rows = timed(query)
+            print(f"  {label:<36} {seconds * 1000:>8.2f} ms  ({rows} matches)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20_000)
+    args = parser.parse_args()
+    run(args.clients)
@@ -0,0 +1,75 @@
+"""
+Query latency of the document catalog with a large synthetic uploads history.
+
+Fills a scratch catalog with N documents spread over references, months,
+modes and customers (rows only; no files are written), then times the
+queries the app makes: one reference's documents, a month for one mode,
+and a customer's month.
+
+    python benchmarks/bench_document_catalog.py --documents 300000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_catalog import DocumentCatalog, CatalogEntry, PREFIX_MODES
+
+CUSTOMERS = [f"Client {i:03}" for i in range(200)]
+
+
+def fill(catalog, count, seed=0):
+    rng = random.Random(seed)
+    prefixes = sorted(PREFIX_MODES)
+    start = datetime(2023, 1, 1)
+    entries = []
+    for i in range(count):
+        uploaded = start + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))
+        prefix = rng.choice(prefixes)
+        reference = f"{prefix}{i // 4 % 1000:03}/{uploaded:%m/%Y}"
+        folder = reference.replace("/", "")
+        name = f"scan_{i}.pdf"
+        entries.append(CatalogEntry(f"{folder}/{name}", reference, folder, name, uploaded.isoformat(timespec="seconds"),
+                                    uploaded.strftime("%Y-%m"), PREFIX_MODES[prefix], rng.choice(CUSTOMERS), None,
+                                    rng.randrange(10_000, 2_000_000), f"{i:064x}", "application/pdf", 0))
+    with catalog._connection() as conn:
+        catalog._upsert(conn, entries)
+    return entries
+
+
+def timed(query, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows = query()
+    return (time.perf_counter() - start) / repeat, len(rows)
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = DocumentCatalog(tmp)
+        start = time.perf_counter()
+        entries = fill(catalog, count)
+        print(f"Catalogued {count:,} documents in {time.perf_counter() - start:.1f}s")
+
+        sample = entries[count // 2]
+        queries = {
+            "for_reference": lambda: catalog.for_reference(sample.reference),
+            "find(month, mode)": lambda: catalog.find(month=sample.month, mode=sample.mode),
+            "find(month, customer)": lambda: catalog.find(month=sample.month, customer=sample.customer),
+        }
+        for label, query in queries.items():
+            seconds, rows = timed(query, repeat=200 if label == "for_reference" else 20)
+            print(f"  {label:<22} {seconds * 1000:>8.2f} ms  ({rows} rows)")
+        catalog.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=300_000)
+    args = parser.parse_args()
+    run(args.documents)
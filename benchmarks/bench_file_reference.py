@@ -0,0 +1,130 @@
+"""
+Latency of file-reference allocation in file_reference.py as file_references grows.
+
+Times the same work on each path: allocate a reference and save its
+file_references row. "baseline" is the original code, a COUNT(*) over the
+mode and route in one connection, then the INSERT in another, each opened
+for the call. "pooled" is the same two statements on the connection pool,
+which separates the pooling gain from the numbering one. "counter" is
+create_file_reference: the counter-row bump and the INSERT in one pooled
+transaction. Table sizes go up to 1M rows. Needs a local Postgres stand-in,
+e.g.
+
+    docker run --rm -p 5432:5432 -e POSTGRES_PASSWORD=admin -e POSTGRES_DB=logistics_db postgres:16
+    python benchmarks/bench_file_reference.py --sizes 0 10000 100000 1000000
+
+All tables live in a scratch schema (fms_bench) that is dropped first.
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import file_reference
+
+SCHEMA = "fms_bench"
+MIGRATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "migrations", "001_file_reference_counters.sql")
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    return statistics.median(samples) * 1000, p95 * 1000
+
+
+def _baseline_reference(config, mode, route):
+    """The original generate_file_reference() then save_file_reference()."""
+    period = datetime.datetime.today().strftime("%m/%y")
+    conn = psycopg2.connect(**config)
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM file_references WHERE mode=%s AND route=%s", (mode, route))
+    reference = f"{file_reference.MODE_CODES[mode]}{cur.fetchone()[0] + 1:03}/{period}"
+    conn.close()
+
+    conn = psycopg2.connect(**config)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO file_references (mode, route, reference_id, document_path, date_created) VALUES (%s, %s, %s, %s, NOW())",
+                (mode, route, reference, None))
+    conn.commit()
+    conn.close()
+    return reference
+
+
+def _pooled_reference(mode, route):
+    """The original COUNT(*) then INSERT, on pooled connections."""
+    period = datetime.datetime.today().strftime("%m/%y")
+    with file_reference.db_cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM file_references WHERE mode=%s AND route=%s", (mode, route))
+        reference = f"{file_reference.MODE_CODES[mode]}{cur.fetchone()[0] + 1:03}/{period}"
+    file_reference.save_file_reference(mode, route, reference, None)
+    return reference
+
+
+def _time(allocate, samples):
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        allocate("Road Freight", "Beitbridge")
+        timings.append(time.perf_counter() - start)
+    return _percentiles(timings)
+
+
+def _grow_table(cur, current, target):
+    if target <= current:
+        return current
+    cur.execute(
+        "INSERT INTO file_references (mode, route, reference_id, document_path, date_created) "
+        "SELECT 'Road Freight', 'Beitbridge', 'KA' || n || '/01/20', NULL, NOW() - INTERVAL '1 year' "
+        "FROM generate_series(%s, %s) AS n",
+        (current + 1, target))
+    cur.execute("ANALYZE file_references")
+    return target
+
+
+def run(sizes, samples):
+    config = dict(file_reference.DB_CONFIG, options=f"-c search_path={SCHEMA}")
+    admin = psycopg2.connect(**file_reference.DB_CONFIG)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        with open(MIGRATION) as file:
+            cur.execute(file.read())
+
+    # Point the shared pool at the scratch schema
+    file_reference.DB_CONFIG = config
+
+    paths = (("baseline", lambda mode, route: _baseline_reference(config, mode, route)),
+             ("pooled", _pooled_reference),
+             ("counter", file_reference.create_file_reference))
+    print(f"{'rows':>10}" + "".join(f"  {name + ' p50':>13}  {name + ' p95':>13}" for name, _ in paths))
+    rows = 0
+    try:
+        for size in sizes:
+            with admin.cursor() as cur:
+                cur.execute(f"SET search_path TO {SCHEMA}")
+                rows = _grow_table(cur, rows, size)
+
+            # Every path inserts a row per sample; the table grows by a few hundred rows per size
+            results = [_time(allocate, samples) for _, allocate in paths]
+            rows += samples * len(paths)
+            print(f"{size:>10,}" + "".join(f"  {p50:>10.2f} ms  {p95:>10.2f} ms" for p50, p95 in results))
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        admin.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+    run(args.sizes, args.samples)
@@ -0,0 +1,60 @@
+"""
+Search latency of the full-text index over a synthetic document archive.
+
+Indexes N documents of shipping-document-like text (container numbers,
+AWBs, invoice numbers, charge lines) straight into a scratch index, then
+times ranked searches for rare identifiers, common words and prefixes.
+
+    python benchmarks/bench_search_index.py --documents 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import SearchIndex
+from reference_data import DEFAULT_REFERENCE_DATA
+
+WORDS = ("consignment shipper consignee cargo pallets gross weight declared value port entry border clearance "
+         "invoice freight handling storage release duty customs tariff agent manifest bill lading").split()
+
+
+def document_text(rng, i):
+    lines = [f"Container MSCU{rng.randrange(10 ** 7):07} AWB {rng.randrange(100, 999)}-{rng.randrange(10 ** 8):08}",
+             f"Invoice INV-{i:07}"]
+    lines += [f"{field}: ${rng.uniform(0, 900):.2f}" for field in rng.sample(DEFAULT_REFERENCE_DATA["charge_fields"], 8)]
+    lines += [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(20)]
+    return "\n".join(lines)
+
+
+def run(count):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SearchIndex(os.path.join(tmp, "search.db"))
+        conn = index._connection()
+        start = time.perf_counter()
+        for batch in range(0, count, 1000):
+            with conn:
+                for i in range(batch, min(batch + 1000, count)):
+                    folder = f"KA{i % 1000:03}0{1 + i % 9}2025"
+                    index._store(conn, f"uploads/{folder}/doc_{i}.pdf", "upload", 0, 0, document_text(rng, i))
+        print(f"Indexed {count:,} documents in {time.perf_counter() - start:.1f}s")
+
+        sample = document_text(random.Random(0), 0).split()
+        queries = [sample[1], sample[3], f"INV-{count // 2:07}", "customs clearance", "ZIMRA Duty", "MSCU12"]
+        for query in queries:
+            start = time.perf_counter()
+            for _ in range(20):
+                hits = index.search(query)
+            print(f"  {query!r:<24} {(time.perf_counter() - start) / 20 * 1000:>8.2f} ms  ({len(hits)} hits)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100_000)
+    args = parser.parse_args()
+    run(args.documents)
@@ -0,0 +1,155 @@
+"""
+Load test of the HTTP service: requests/sec and latency percentiles.
+
+Starts service.py in a separate process, on scratch data (running
+numbers, output folders, ledger, document cache), then runs each scenario
+from --clients threads, each reusing one keep-alive connection:
+
+    references          POST /references, one reference each
+    references_batch    POST /references/batch, 10 references each
+    charge_sheet        POST /documents with unique charges (every
+                        request renders a PDF; save=false)
+    charge_sheet_saved  the same, saved: ledger entry plus file write
+    charge_sheet_cached POST /documents repeating one request (cache hits)
+
+Pass --url to load an already running service instead (its real running
+numbers and ledger are used, so only against a scratch deployment).
+
+    python benchmarks/bench_service.py --clients 8 --seconds 5
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import http.client
+import multiprocessing
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ("references", "references_batch", "charge_sheet", "charge_sheet_saved", "charge_sheet_cached")
+
+
+def request_body(scenario, client, i):
+    if scenario == "references":
+        return "/references", {"mode": "Road Freight", "route": "Beitbridge"}
+    if scenario == "references_batch":
+        return "/references/batch", [{"mode": "Air Freight", "count": 5}, {"mode": "Export", "count": 5}]
+    if scenario == "charge_sheet_cached":
+        return "/documents", {"reference": "KA001/03/2025", "customer": "ABC Logistics",
+                              "charges": {"Agency": 100, "Handling": 25.5}, "save": False}
+    saved = scenario == "charge_sheet_saved"
+    return "/documents", {"reference": f"KA{client % 1000:03}/03/2025", "customer": "ABC Logistics",
+                          "charges": {"Agency": 100 + i, "Handling": 25.5 + saved, "ZIMRA Duty": client + i / 100},
+                          "save": saved}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_scenario(url, scenario, clients, seconds, keep_alive=True):
+    host, port = urlsplit(url).hostname, urlsplit(url).port
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(number):
+        mine, failed, i = [], 0, 0
+        conn = http.client.HTTPConnection(host, port)
+        while time.perf_counter() < deadline:
+            path, body = request_body(scenario, number, i)
+            i += 1
+            start = time.perf_counter()
+            conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            mine.append(time.perf_counter() - start)
+            if response.status != 200:
+                failed += 1
+            if not keep_alive:
+                conn.close()
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"  {scenario:<20} {len(latencies) / elapsed:>9,.0f} req/s   p50 {percentile(latencies, 0.5) * 1000:>7.2f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:>7.2f} ms   ({len(latencies):,} requests, {sum(errors)} errors)")
+
+
+def serve(port, scratch):
+    os.chdir(scratch)  # ledger, job queue and search index go to scratch/data
+    from service import Service
+    from document_cache import DocumentCache
+    Service(("127.0.0.1", port), data_file=os.path.join(scratch, "data", "running_numbers.json"),
+            upload_folder=os.path.join(scratch, "uploads"),
+            output_dirs={"charge_sheet": os.path.join(scratch, "charge_sheets"), "sales_estimate": os.path.join(scratch, "invoices")},
+            cache=DocumentCache(os.path.join(scratch, "cache")), quiet=True).serve_forever()
+
+
+def wait_until_up(url, timeout=30):
+    parts = urlsplit(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Service at {url} did not start")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="Load a running service instead of starting one")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--no-keep-alive", action="store_true", help="Open a new connection for every request")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        server = None
+        url = args.url
+        if url is None:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = multiprocessing.Process(target=serve, args=(port, scratch), daemon=True)
+            server.start()
+        try:
+            wait_until_up(url)
+            print(f"{url}, {args.clients} clients, {args.seconds:g}s per scenario, "
+                  f"{'new connection per request' if args.no_keep_alive else 'keep-alive'}")
+            for scenario in args.scenarios:
+                run_scenario(url, scenario, args.clients, args.seconds, not args.no_keep_alive)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Per-document render time before and after the shared DocumentTemplate layer.
+
+"before" is the original inline FPDF layout of generate_charge_sheet /
+generate_sales_estimate; "after" is render_charge_sheet /
+render_sales_estimate in documents.py. Both build the PDF bytes in memory,
+without the disk write or ledger record, so only the layout code differs.
+Every render still draws the whole page with a new FPDF; the template only
+saves rebuilding the fixed parts and fpdf2's handling of the legacy Arial
+and ln=True arguments, so expect a modest gain. The runs happen in a scratch
+working directory, so the client registry lookups never reach data/.
+
+    python benchmarks/bench_templates.py --documents 300
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fpdf import FPDF
+from pdf_templates import pdf_bytes
+from documents import render_charge_sheet, render_sales_estimate
+
+CHARGE_DATA = {
+    "Disbursement Fees": 120.0, "Professional Handlers": 85.5, "Agency": 60.0, "Documentation Fee": 25.0,
+    "Storage (DHL)": 0.0, "Handling": 40.0, "Airway Bill Fee": 35.0, "ZIMRA Duty": 410.75, "ZIMRA VAT": 96.3,
+}
+
+
+def legacy_charge_sheet(reference, customer, charge_data):
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(200, 8, f"Charge Out Sheet - {reference}", ln=True, align="C")
+    pdf.set_font("Arial", "", 10)
+    pdf.cell(100, 5, f"Customer: {customer}", ln=True)
+    pdf.cell(100, 5, f"Customer ID: {None}", ln=True)
+    pdf.cell(100, 5, f"Date: {datetime.today().strftime('%d-%m-%Y')}", ln=True)
+    pdf.ln(4)
+    pdf.set_font("Arial", "B", 10)
+    pdf.cell(120, 6, "NHS Service", border=1)
+    pdf.cell(60, 6, "Charge (USD)", border=1, ln=True)
+    pdf.set_font("Arial", "", 10)
+    total_amount = 0
+    for field, amount in charge_data.items():
+        if amount > 0:
+            pdf.cell(120, 6, field, border=1)
+            pdf.cell(60, 6, f"${amount:.2f}", border=1, ln=True)
+            total_amount += amount
+    pdf.ln(4)
+    pdf.set_font("Arial", "B", 10)
+    pdf.cell(120, 6, "TOTAL", border=1)
+    pdf.cell(60, 6, f"${total_amount:.2f}", border=1, ln=True)
+    pdf.ln(6)
+    pdf.set_font("Arial", "", 10)
+    pdf.cell(100, 5, "Compiled by: Operations", ln=True)
+    pdf.cell(100, 5, "Approver 1: ___________________", ln=True)
+    pdf.cell(100, 5, "Approver 2: ___________________", ln=True)
+    return pdf_bytes(pdf)
+
+
+def legacy_sales_estimate(reference, customer, charge_data):
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(200, 8, "IFS SALES ESTIMATE INVOICE", ln=True, align="C")
+    pdf.set_font("Arial", "", 10)
+    pdf.cell(100, 5, f"Customer: {customer}", ln=True)
+    pdf.cell(100, 5, f"Customer ID: {None}", ln=True)
+    pdf.cell(100, 5, f"Invoice Ref: {reference}", ln=True)
+    pdf.cell(100, 5, f"Date: {datetime.today().strftime('%d-%m-%Y')}", ln=True)
+    pdf.ln(4)
+    pdf.set_font("Arial", "B", 10)
+    pdf.cell(120, 6, "Service Description", border=1)
+    pdf.cell(60, 6, "Amount (USD)", border=1, ln=True)
+    pdf.set_font("Arial", "", 10)
+    subtotal = 0
+    for field, amount in charge_data.items():
+        if amount > 0:
+            pdf.cell(120, 6, field, border=1)
+            pdf.cell(60, 6, f"${amount:.2f}", border=1, ln=True)
+            subtotal += amount
+    pdf.ln(4)
+    vat = subtotal * 0.15
+    total = subtotal + vat
+    pdf.set_font("Arial", "B", 10)
+    pdf.cell(120, 6, "TOTAL EXCL. VAT", border=1)
+    pdf.cell(60, 6, f"${subtotal:.2f}", border=1, ln=True)
+    pdf.cell(120, 6, "VAT @ 15%", border=1)
+    pdf.cell(60, 6, f"${vat:.2f}", border=1, ln=True)
+    pdf.cell(120, 6, "TOTAL", border=1)
+    pdf.cell(60, 6, f"${total:.2f}", border=1, ln=True)
+    pdf.ln(10)
+    pdf.set_font("Arial", "", 10)
+    pdf.multi_cell(0, 6, "This Sales Estimate is valid for 30 days. Payment should be made in full before service is rendered.", border=0)
+    return pdf_bytes(pdf)
+
+
+def _time(render, count):
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        render(f"KA{i + 1:03}/03/2025")
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, statistics.mean(samples) * 1000
+
+
+def run(count):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # the ledger and client registry open relative to the working directory
+        try:
+            cases = [
+                ("charge sheet", "before", lambda ref: legacy_charge_sheet(ref, "ABC Logistics", CHARGE_DATA)),
+                ("charge sheet", "after", lambda ref: render_charge_sheet(ref, "ABC Logistics", CHARGE_DATA)),
+                ("sales estimate", "before", lambda ref: legacy_sales_estimate(ref, "ABC Logistics", CHARGE_DATA)),
+                ("sales estimate", "after", lambda ref: render_sales_estimate(ref, "ABC Logistics", CHARGE_DATA)),
+            ]
+            print(f"{'document':<15} {'':<7} {'median ms':>10} {'mean ms':>9}")
+            for document, label, render in cases:
+                render("WARMUP/03/2025")
+                median, mean = _time(render, count)
+                print(f"{document:<15} {label:<7} {median:>10.3f} {mean:>9.3f}")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=300)
+    args = parser.parse_args()
+    run(args.documents)
@@ -0,0 +1,70 @@
+"""
+Peak RSS of saving an upload: whole-file read() vs upload_storage.save_upload.
+
+Each case runs in a fresh child process that saves a scratch file of the
+given size and reports how far its peak RSS rose above the baseline. The
+streamed copy should stay flat (about CHUNK_SIZE) as files grow, while
+read() grows with the file. POSIX only (uses the resource module).
+
+    python benchmarks/bench_upload_storage.py --sizes-mb 1 10 50 100
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import os, sys, json, time, resource
+sys.path.insert(0, {root!r})
+from upload_storage import save_upload
+
+source, uploads, method = sys.argv[1:4]
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+with open(source, "rb") as fileobj:
+    if method == "read":
+        os.makedirs(os.path.join(uploads, "KA001032025"), exist_ok=True)
+        with open(os.path.join(uploads, "KA001032025", "naive.bin"), "wb") as f:
+            f.write(fileobj.read())
+    else:
+        save_upload(fileobj, "KA001/03/2025", "streamed.bin", uploads, max_file_bytes=1 << 40, max_reference_bytes=1 << 40)
+elapsed = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+print(json.dumps({{"rss_growth": (peak - baseline) * scale, "seconds": elapsed}}))
+"""
+
+
+def run(sizes_mb):
+    child = CHILD.format(root=ROOT)
+    print(f"{'size':>8}  {'read() peak RSS +':>18}  {'save_upload peak RSS +':>23}  {'save_upload MB/s':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in sizes_mb:
+            source = os.path.join(tmp, f"source_{size_mb}.bin")
+            with open(source, "wb") as file:
+                for _ in range(size_mb):
+                    file.write(os.urandom(1024 * 1024))
+
+            results = {}
+            for method in ("read", "stream"):
+                uploads = tempfile.mkdtemp(dir=tmp)
+                output = subprocess.run([sys.executable, "-c", child, source, uploads, method],
+                                        check=True, capture_output=True, text=True).stdout
+                results[method] = json.loads(output)
+            os.remove(source)
+
+            mb = 1024 * 1024
+            print(f"{size_mb:>6} MB  {results['read']['rss_growth'] / mb:>15.1f} MB  "
+                  f"{results['stream']['rss_growth'] / mb:>20.1f} MB  "
+                  f"{size_mb / results['stream']['seconds']:>16.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 10, 50, 100])
+    args = parser.parse_args()
+    run(args.sizes_mb)
@@ -0,0 +1,82 @@
+"""
+End-to-end time of the variance engine over a synthetic month of files.
+
+Writes our charges and NHS charges for N references to scratch CSVs (NHS
+differs on a few lines per file), then times loading, the vectorised
+variance pass, ranking and streaming every variance to CSV.
+
+    python benchmarks/bench_variance.py --files 50000
+"""
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from charges import np
+from variance import load_charge_sets, compute_variances
+from reference_data import DEFAULT_REFERENCE_DATA
+
+CUSTOMERS = [f"Client {i:03}" for i in range(200)]
+ROUTES = ["Beitbridge", "Mutare", "Plumtree", "Chirundu", ""]
+
+
+def write_charge_files(directory, count, seed=0):
+    rng = random.Random(seed)
+    fields = DEFAULT_REFERENCE_DATA["charge_fields"]
+    ours_path, nhs_path = os.path.join(directory, "ours.csv"), os.path.join(directory, "nhs.csv")
+    with open(ours_path, "w", newline="") as ours_file, open(nhs_path, "w", newline="") as nhs_file:
+        ours, nhs = csv.writer(ours_file), csv.writer(nhs_file)
+        header = ["reference", "customer", "route", *fields]
+        ours.writerow(header)
+        nhs.writerow(header)
+        for i in range(count):
+            amounts = [f"{rng.uniform(0, 800):.2f}" if rng.random() < 0.3 else "0" for _ in fields]
+            nhs_amounts = [f"{float(a) + rng.uniform(-50, 50):.2f}" if a != "0" and rng.random() < 0.1 else a for a in amounts]
+            meta = [f"KA{i:05}/03/2025", rng.choice(CUSTOMERS), rng.choice(ROUTES)]
+            ours.writerow(meta + amounts)
+            nhs.writerow(meta + nhs_amounts)
+    return ours_path, nhs_path
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as tmp:
+        ours_path, nhs_path = write_charge_files(tmp, count)
+
+        timings = {}
+        start = time.perf_counter()
+        ours = load_charge_sets(ours_path)
+        nhs = load_charge_sets(nhs_path, schema=ours.matrix.schema)
+        timings["load CSVs"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        report = compute_variances(ours, nhs)
+        timings["align + variances"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        report.top(50)
+        for group in ("customer", "route", "field"):
+            report.by_group(group)
+        timings["rank outliers"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open(os.path.join(tmp, "variances.csv"), "w", newline="") as file:
+            written = report.write_csv(file)
+        timings["stream CSV"] = time.perf_counter() - start
+
+    backend = "numpy" if np is not None else "pure Python"
+    print(f"{count:,} files, {written:,} non-zero variances ({backend})")
+    for step, seconds in timings.items():
+        print(f"  {step:<20} {seconds:>7.2f} s")
+    print(f"  {'total':<20} {sum(timings.values()):>7.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=50_000)
+    args = parser.parse_args()
+    run(args.files)
@@ -0,0 +1,141 @@
+"""
+Cold start of the Streamlit app: process start to first render, against a budget.
+
+Each run is a fresh Python process. The process imports Streamlit, loads
+app.py with AppTest and renders it once, the way a new replica serves its
+first session. The run is split into these phases:
+
+    interpreter   process start until the driver's first line
+    streamlit     importing streamlit (and AppTest)
+    first_run     the first rerun of app.py, including its own imports
+    total         process start to first render (what the budget applies to)
+
+The first rerun is also broken down by the app's "Rerun timings" sections.
+Every run shares one scratch directory, after a warm-up run that creates the
+databases, so the runs measure a new process against existing data (with
+a warm disk cache).
+
+The budget fails (exit 1) if the median total is over --budget, or if the
+first render loaded one of the optional backends that should only be
+imported on first use (fpdf, numpy, PIL, psycopg2). --importtime lists the
+slowest top-level imports of one extra run.
+
+    python benchmarks/cold_start.py --runs 5 --budget 1.5 --importtime
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+
+# Seconds from process start to first render (about 1.1s on a 1-CPU dev box)
+COLD_START_BUDGET = 1.5
+
+# Backends imported on first use only; a first render that loads one of them has regressed
+LAZY_MODULES = ("fpdf", "numpy", "PIL", "psycopg2")
+
+DRIVER = """
+import sys, time, json
+entered = time.time()
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+imported = time.time()
+at = AppTest.from_file({app!r}, default_timeout=60).run()
+rendered = time.time()
+profiler = at.session_state["rerun_profiler"] if "rerun_profiler" in at.session_state else None
+print(json.dumps({{
+    "entered": entered, "imported": imported, "rendered": rendered,
+    "exception": [e.message for e in at.exception],
+    "sections": profiler.history[0] if profiler and profiler.history else {{}},
+    "loaded": [name for name in {lazy!r} if name in sys.modules],
+}}))
+"""
+
+
+def run_once(scratch, importtime=False):
+    """One cold start; returns the phase timings in seconds, plus what the driver reported."""
+    code = DRIVER.format(root=ROOT, app=APP, lazy=LAZY_MODULES)
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    started = time.time()
+    result = subprocess.run(command, cwd=scratch, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Cold start failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report.update({
+        "interpreter": report["entered"] - started,
+        "streamlit": report["imported"] - report["entered"],
+        "first_run": report["rendered"] - report["imported"],
+        "total": report["rendered"] - started,
+        "importtime": result.stderr if importtime else "",
+    })
+    return report
+
+
+def slowest_imports(importtime_log, count=12):
+    """(cumulative seconds, module) of the slowest top-level imports in a -X importtime log."""
+    imports = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # nested imports are indented under their importer
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=COLD_START_BUDGET, help="Seconds allowed for the median total")
+    parser.add_argument("--importtime", action="store_true", help="List the slowest imports of one more run")
+    parser.add_argument("--json", help="Also write the runs here")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        warm_up = run_once(scratch)
+        if warm_up["exception"]:
+            print(f"app.py raised on its first run: {warm_up['exception']}")
+            return 1
+        runs = [run_once(scratch) for _ in range(args.runs)]
+        traced = run_once(scratch, importtime=True) if args.importtime else None
+
+    print(f"{args.runs} cold starts of app.py (median / max, ms)")
+    for phase in ("interpreter", "streamlit", "first_run", "total"):
+        values = [run[phase] for run in runs]
+        print(f"  {phase:<22} {statistics.median(values) * 1000:>8.0f} {max(values) * 1000:>8.0f}")
+    print("  first run by section")
+    for section in runs[0]["sections"]:
+        values = [run["sections"].get(section, 0) for run in runs]
+        print(f"    {section:<20} {statistics.median(values) * 1000:>8.0f} {max(values) * 1000:>8.0f}")
+
+    if traced:
+        print("slowest top-level imports (ms, one run)")
+        for seconds, name in slowest_imports(traced["importtime"]):
+            print(f"  {name:<40} {seconds * 1000:>8.0f}")
+
+    problems = []
+    median_total = statistics.median(run["total"] for run in runs)
+    if median_total > args.budget:
+        problems.append(f"median cold start {median_total:.2f}s is over the {args.budget:g}s budget")
+    loaded = sorted({name for run in runs for name in run["loaded"]})
+    if loaded:
+        problems.append(f"the first render imported {', '.join(loaded)}, which should load on first use only")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if not problems:
+        print(f"ok: median {median_total:.2f}s within the {args.budget:g}s budget; no optional backend loaded")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump([{key: value for key, value in run.items() if key != "importtime"} for run in runs], file, indent=1)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
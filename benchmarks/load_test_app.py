@@ -0,0 +1,287 @@
+"""
+Concurrent-session load test of the Streamlit app (app.py), driven by AppTest.
+
+Each simulated clerk is an AppTest session in its own process. AppTest
+installs a process-global Runtime for the length of each run, so two
+sessions can't share a process. The processes share one scratch
+directory (running numbers, SQLite databases, uploads, output folders),
+as several app server processes on one machine would. That is the
+stricter test for numbering collisions: the file lock has to serialise
+across processes, not only across threads. Every clerk runs the day's
+workflow in a loop:
+
+    load          first run of the script
+    select_mode   mode (and route, for Road Freight)
+    reference     "Generate File Reference" and select it
+    customer      search the client registry; take the first match
+    charges       enter CHARGE_LINES charge lines, one rerun each
+    charge_sheet  "Generate Charge Sheet"
+    estimate      "Generate Sales Estimate Invoice"
+    upload        store a scanned document for the reference. This uses
+                  save_upload with the job queue, as the upload screens do,
+                  because AppTest can't drive st.file_uploader.
+
+Each --sessions level runs in turn, all in one scratch directory. Each
+reports workflows/sec, reruns/sec and per-step p50/p95/p99. The
+integrity checks cover:
+- script exceptions;
+- duplicate references, and gaps in each prefix's numbering;
+- charge sheets and estimates missing from disk or the ledger;
+- uploads missing from disk or the catalog once the job queue drains.
+The exit status is 1 if any check fails.
+
+    python benchmarks/load_test_app.py --sessions 1 5 10 20 --workflows 5
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest
+
+from rerun_profiler import percentile
+
+APP = os.path.join(ROOT, "app.py")
+
+STEPS = ("load", "select_mode", "reference", "customer", "charges", "charge_sheet", "estimate", "upload")
+
+# Workflows cycle through these, so several prefixes are numbered concurrently
+MODES = [("Road Freight", "Beitbridge"), ("Air Freight", None), ("Road Freight", "Mutare"), ("Sea Freight", None)]
+CUSTOMER_QUERIES = ["ABC", "xyz", "global"]
+CHARGE_LINES = 4
+
+# How long to wait for background saves and queued upload jobs before reporting files missing
+SETTLE_SECONDS = 60
+
+def _widget(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No widget labelled {label!r}")
+
+
+def _scan(reference):
+    return f"%PDF-1.4\n% scanned delivery note for {reference}\n".encode() + os.urandom(16 * 1024)
+
+
+class Clerk:
+    """One simulated session running the workflow."""
+
+    def __init__(self, number, timeout):
+        self.number = number
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.timings = defaultdict(list)
+        self.issued = []     # (reference, customer, upload path)
+        self.errors = []
+        self.reruns = 0
+
+    def _run(self, step, action):
+        start = time.perf_counter()
+        action()
+        self.timings[step].append(time.perf_counter() - start)
+        self.reruns += 1
+        if self.at.exception:
+            raise RuntimeError(f"{step}: {self.at.exception[0].message}")
+
+    def workflow(self, i):
+        from upload_storage import save_upload, timestamped_filename, get_upload_queue
+
+        at = self.at
+        mode, route = MODES[(self.number + i) % len(MODES)]
+        self._run("select_mode", lambda: _widget(at.selectbox, "Select Mode").select(mode).run())
+        if route:
+            self._run("select_mode", lambda: _widget(at.selectbox, "Select Route").select(route).run())
+
+        self._run("reference", lambda: _widget(at.button, "Generate File Reference").click().run())
+        reference = at.session_state["file_refs"][-1]
+        self._run("reference", lambda: _widget(at.selectbox, "Select File Reference").select(reference).run())
+
+        query = CUSTOMER_QUERIES[(self.number + i) % len(CUSTOMER_QUERIES)]
+        self._run("customer", lambda: _widget(at.text_input, "Search Clients").input(query).run())
+        customer = _widget(at.selectbox, "Select Customer").value.name
+
+        for line in range(CHARGE_LINES):
+            amount = round(10 + self.number * 7.5 + i * 3.25 + line, 2)
+            self._run("charges", lambda: at.number_input(key=f"charge_{(i + line) % 20}").set_value(amount).run())
+
+        for step, label in (("charge_sheet", "Generate Charge Sheet"), ("estimate", "Generate Sales Estimate Invoice")):
+            self._run(step, lambda: _widget(at.button, label).click().run())
+            if not any(reference.replace("/", "") in success.value for success in at.success):
+                raise RuntimeError(f"{step}: no confirmation for {reference} ({[e.value for e in at.error]})")
+
+        start = time.perf_counter()
+        stored = save_upload(io.BytesIO(_scan(reference)), reference, timestamped_filename("delivery_note.pdf"),
+                             "uploads", customer=customer, queue=get_upload_queue())
+        self.timings["upload"].append(time.perf_counter() - start)
+        self.issued.append((reference, customer, stored.path))
+
+    def work(self, workflows, start_barrier):
+        """Runs the workflows; returns the wall-clock (start, end) once every session has loaded."""
+        try:
+            self._run("load", self.at.run)
+        except Exception as e:
+            self.errors.append(f"session {self.number}: {type(e).__name__}: {e}")
+            start_barrier.abort()  # the other sessions stop waiting for this one
+            return None
+        start_barrier.wait()
+        started = time.time()
+        try:
+            for i in range(workflows):
+                self.workflow(i)
+        except Exception as e:
+            self.errors.append(f"session {self.number}: {type(e).__name__}: {e}")
+        return started, time.time()
+
+
+def _session(number, workflows, timeout, scratch, start_barrier, results):
+    os.chdir(scratch)
+    clerk = Clerk(number, timeout)
+    span = None
+    try:
+        span = clerk.work(workflows, start_barrier)
+    except threading.BrokenBarrierError:
+        clerk.errors.append(f"session {number}: another session failed to load")
+    finally:
+        from upload_storage import get_upload_queue
+        # Let the workers finish the job in hand; anything still queued is drained by the parent
+        get_upload_queue().stop_workers()
+        results.put({"number": number, "span": span, "timings": dict(clerk.timings), "issued": clerk.issued,
+                     "errors": clerk.errors, "reruns": clerk.reruns})
+
+
+def _wait_for(condition, timeout=SETTLE_SECONDS):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.2)
+    return condition()
+
+
+def check_integrity(issued, all_references):
+    """Problems found with what the sessions issued; [] if none."""
+    from documents import charge_sheet_output_path, sales_estimate_output_path
+    from document_catalog import get_catalog
+    from ledger import get_ledger
+    from upload_storage import get_upload_queue
+    from running_numbers import load_running_numbers
+
+    problems = []
+    duplicates = [reference for reference, count in Counter(all_references).items() if count > 1]
+    if duplicates:
+        problems.append(f"{len(duplicates)} duplicate references, e.g. {duplicates[:5]}")
+
+    # Every number from 1 to the stored counter should have been issued exactly once
+    counters = load_running_numbers(os.path.join("data", "running_numbers.json"))
+    issued_numbers = defaultdict(set)
+    for reference in all_references:
+        number, month_year = reference.split("/", 1)
+        prefix = number.rstrip("0123456789")
+        issued_numbers[f"{prefix}/{month_year}"].add(int(number[len(prefix):]))
+    for key, numbers in issued_numbers.items():
+        if numbers != set(range(1, counters.get(key, 0) + 1)):
+            problems.append(f"{key}: counter at {counters.get(key)}, but {len(numbers)} numbers issued (max {max(numbers)})")
+
+    paths = [path for reference, _, _ in issued
+             for path in (charge_sheet_output_path(reference), sales_estimate_output_path(reference))]
+    _wait_for(lambda: all(os.path.exists(path) for path in paths))
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        problems.append(f"{len(missing)} documents missing from disk, e.g. {missing[:3]}")
+
+    ledger = get_ledger()
+    unrecorded = [(reference, document_type) for reference, _, _ in issued
+                  for document_type in ("charge_sheet", "sales_estimate") if ledger.latest(reference, document_type) is None]
+    if unrecorded:
+        problems.append(f"{len(unrecorded)} documents missing from the ledger, e.g. {unrecorded[:3]}")
+
+    queue = get_upload_queue()
+    _wait_for(lambda: not ({"queued", "running"} & set(queue.counts())))
+    catalog = get_catalog("uploads")
+    lost = [path for _, _, path in issued if not os.path.exists(path)]
+    uncatalogued = [path for reference, _, path in issued
+                    if os.path.basename(path) not in {os.path.basename(entry.path) for entry in catalog.for_reference(reference)}]
+    if lost:
+        problems.append(f"{len(lost)} uploads missing from disk, e.g. {lost[:3]}")
+    if uncatalogued:
+        problems.append(f"{len(uncatalogued)} uploads missing from the catalog, e.g. {uncatalogued[:3]}")
+    failed_jobs = queue.counts().get("failed", 0)
+    if failed_jobs:
+        problems.append(f"{failed_jobs} upload jobs failed")
+    return problems
+
+
+def run_level(sessions, workflows, timeout, all_references):
+    # Spawned rather than forked: the parent has upload queue workers running after the first level
+    context = multiprocessing.get_context("spawn")
+    start_barrier = context.Barrier(sessions)
+    results = context.Queue()
+    processes = [context.Process(target=_session, args=(number, workflows, timeout, os.getcwd(), start_barrier, results),
+                                 name=f"clerk_{number}")
+                 for number in range(sessions)]
+    for process in processes:
+        process.start()
+    clerks = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    # The clock runs from when every session has loaded until the last one finishes
+    spans = [clerk["span"] for clerk in clerks if clerk["span"]]
+    elapsed = max(end for _, end in spans) - min(start for start, _ in spans) if spans else 0
+    issued = [tuple(item) for clerk in clerks for item in clerk["issued"]]
+    completed = len(issued)
+    reruns = sum(clerk["reruns"] for clerk in clerks)
+    all_references.extend(reference for reference, _, _ in issued)
+
+    print(f"\n{sessions} sessions x {workflows} workflows: {completed} completed, "
+          f"{completed / elapsed if elapsed else 0:,.2f} workflows/s, {reruns / elapsed if elapsed else 0:,.1f} reruns/s")
+    print(f"  {'step':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for step in STEPS:
+        samples = [seconds for clerk in clerks for seconds in clerk["timings"].get(step, ())]
+        if samples:
+            print(f"  {step:<14} {len(samples):>6} {percentile(samples, 50) * 1000:>9.1f} "
+                  f"{percentile(samples, 95) * 1000:>9.1f} {percentile(samples, 99) * 1000:>9.1f}")
+
+    problems = [error for clerk in clerks for error in clerk["errors"]] + check_integrity(issued, all_references)
+    for problem in problems:
+        print(f"  FAIL {problem}")
+    if not problems:
+        print(f"  integrity: ok ({len(all_references)} references, no duplicates or gaps, every document and upload stored)")
+    return {"sessions": sessions, "completed": completed, "workflows_per_second": completed / elapsed if elapsed else 0,
+            "problems": problems}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--workflows", type=int, default=3, help="Workflows per session at each level")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds allowed per rerun")
+    parser.add_argument("--json", help="Also write the per-level summary here")
+    args = parser.parse_args(argv)
+
+    cwd = os.getcwd()
+    summary = []
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)  # the app's data, uploads and output folders are relative
+        try:
+            all_references = []
+            for sessions in args.sessions:
+                summary.append(run_level(sessions, args.workflows, args.timeout, all_references))
+        finally:
+            os.chdir(cwd)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(summary, file, indent=1)
+    return 1 if any(level["problems"] for level in summary) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+Micro-benchmark suite for the hot paths, with a JSON history and regression gates.
+
+Cases (median seconds per call):
+
+    reference/keys=N        get_next_file_reference with N (prefix, month) keys
+                            already in running_numbers.json
+    charge_sheet/lines=N    generate_charge_sheet with N non-zero charge lines
+                            (render, ledger entry, atomic write)
+    sales_estimate/lines=N  generate_sales_estimate, likewise
+    upload/SIZE             save_upload of a SIZE file (stream, hash, fsync,
+                            catalog, blob link)
+    file_reference/rows=N   file_reference.create_file_reference with N rows
+                            already in file_references; needs psycopg2 and a
+                            local Postgres stand-in (see bench_file_reference.py),
+                            otherwise skipped
+
+Everything runs in a scratch directory. Each metric is compared with the
+median of the last --baseline-runs runs recorded on this machine; one that
+is slower by more than its threshold fails the run (exit status 1).
+--record appends the run to the history.
+
+    python benchmarks/suite.py --record
+    python benchmarks/suite.py --only upload charge_sheet --quick
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import itertools
+import statistics
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from reference_data import DEFAULT_REFERENCE_DATA
+from running_numbers import atomic_write
+
+HISTORY_FILE = os.path.join(ROOT, "benchmarks", "history.json")
+
+# Allowed slowdown against the baseline, as a fraction; the first matching
+# prefix wins. Disk- and database-bound cases are noisier than rendering.
+DEFAULT_THRESHOLD = 0.25
+THRESHOLDS = {
+    "upload/": 0.5,
+    "reference/": 0.5,
+    "file_reference/": 0.5,
+}
+
+# Recorded runs (on this machine) the baseline is the median of
+BASELINE_RUNS = 5
+
+# Each sample runs the case enough times to take at least this long
+MIN_SAMPLE_SECONDS = 0.05
+
+REFERENCE_KEYS = (0, 1_000, 10_000, 100_000)
+CHARGE_LINES = (1, 7, 14, len(DEFAULT_REFERENCE_DATA["charge_fields"]))
+UPLOAD_SIZES = {"1KB": 1024, "64KB": 64 * 1024, "1MB": 1024 ** 2, "10MB": 10 * 1024 ** 2, "100MB": 100 * 1024 ** 2}
+FILE_REFERENCE_ROWS = (0, 100_000)
+
+# --quick drops the slowest sizes
+QUICK_SKIP = {"reference/keys=100000", "upload/100MB", "file_reference/rows=100000"}
+
+
+class Skip(Exception):
+    """A case that can't run here (e.g. no Postgres)."""
+
+
+def measure(function, repeat=5, cleanup=None):
+    """Median seconds per call of function(), over repeat timed samples after a warm-up."""
+    function()
+    if cleanup:
+        cleanup()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if cleanup:
+            cleanup()
+        if elapsed >= MIN_SAMPLE_SECONDS or loops >= 1 << 16:
+            break
+        loops *= 2
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        samples.append((time.perf_counter() - start) / loops)
+        if cleanup:
+            cleanup()
+    return statistics.median(samples)
+
+
+def reference_cases(scratch, repeat):
+    from references import get_next_file_reference
+
+    for keys in REFERENCE_KEYS:
+        def case(keys=keys):
+            data_file = os.path.join(scratch, f"running_numbers_{keys}.json")
+            # Past months' counters for every prefix, as the file accumulates them
+            with open(data_file, "w") as file:
+                json.dump({f"P{i // 1200:04}/{i % 12 + 1:02}/{2000 + i // 12 % 100}": 999 for i in range(keys)}, file)
+            return measure(lambda: get_next_file_reference("Road Freight", "Beitbridge", data_file=data_file), repeat)
+        yield f"reference/keys={keys}", case
+
+
+def document_cases(scratch, repeat):
+    from documents import generate_charge_sheet, generate_sales_estimate
+
+    fields = DEFAULT_REFERENCE_DATA["charge_fields"]
+    numbers = itertools.count(1)
+    for name, generate in (("charge_sheet", generate_charge_sheet), ("sales_estimate", generate_sales_estimate)):
+        for lines in CHARGE_LINES:
+            def case(generate=generate, lines=lines):
+                charge_data = {field: (12.5 + i if i < lines else 0.0) for i, field in enumerate(fields)}
+                output_dir = os.path.join(scratch, "documents")
+                # A new reference each call, so every call appends to the ledger
+                return measure(lambda: generate(f"KA{next(numbers)}/03/2025", "ABC Logistics", charge_data, output_dir), repeat)
+            yield f"{name}/lines={lines}", case
+
+
+def upload_cases(scratch, repeat):
+    from upload_storage import save_upload
+
+    upload_folder = os.path.join(scratch, "uploads")
+    names = itertools.count(1)
+    for label, size in UPLOAD_SIZES.items():
+        def case(size=size):
+            source = os.path.join(scratch, "upload.bin")
+            with open(source, "wb") as file:
+                for offset in range(0, size, 1024 ** 2):
+                    file.write(os.urandom(min(1024 ** 2, size - offset)))
+
+            def save():
+                with open(source, "rb") as fileobj:
+                    save_upload(fileobj, "KA001/03/2025", f"upload_{next(names)}.bin", upload_folder,
+                                max_file_bytes=1 << 40, max_reference_bytes=1 << 40)
+            try:
+                return measure(save, repeat if size < 10 * 1024 ** 2 else 3,
+                               cleanup=lambda: shutil.rmtree(upload_folder, ignore_errors=True))
+            finally:
+                os.remove(source)
+        yield f"upload/{label}", case
+
+
+def file_reference_cases(scratch, repeat):
+    schema = "fms_suite"
+    state = {}
+
+    def connect():
+        if "admin" not in state:
+            try:
+                import psycopg2
+                import file_reference
+            except ImportError:
+                raise Skip("psycopg2 is not installed")
+            try:
+                admin = psycopg2.connect(connect_timeout=2, **file_reference.DB_CONFIG)
+            except psycopg2.OperationalError as e:
+                raise Skip(f"no Postgres at {file_reference.DB_CONFIG['host']}:{file_reference.DB_CONFIG['port']} "
+                           f"({str(e).strip().splitlines()[0]})")
+            admin.autocommit = True
+            with admin.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+                cur.execute(f"CREATE SCHEMA {schema}")
+                cur.execute(f"SET search_path TO {schema}")
+                with open(os.path.join(ROOT, "migrations", "001_file_reference_counters.sql")) as file:
+                    cur.execute(file.read())
+            # Point the shared pool at the scratch schema
+            file_reference.close_pool()
+            state.update(admin=admin, module=file_reference, config=file_reference.DB_CONFIG)
+            file_reference.DB_CONFIG = dict(file_reference.DB_CONFIG, options=f"-c search_path={schema}")
+        return state["admin"], state["module"]
+
+    def drop():
+        if "admin" in state:
+            state["module"].close_pool()
+            state["module"].DB_CONFIG = state["config"]
+            with state["admin"].cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            state["admin"].close()
+
+    try:
+        for rows in FILE_REFERENCE_ROWS:
+            def case(rows=rows):
+                admin, file_reference = connect()
+                with admin.cursor() as cur:
+                    cur.execute(f"SET search_path TO {schema}")
+                    cur.execute("TRUNCATE file_references, file_reference_counters")
+                    cur.execute(
+                        "INSERT INTO file_references (mode, route, reference_id, document_path, date_created) "
+                        "SELECT 'Road Freight', 'Beitbridge', 'KA' || n || '/01/20', NULL, NOW() - INTERVAL '1 year' "
+                        "FROM generate_series(1, %s) AS n", (rows,))
+                    cur.execute("ANALYZE file_references")
+                return measure(lambda: file_reference.create_file_reference("Road Freight", "Beitbridge"), repeat)
+            yield f"file_reference/rows={rows}", case
+    finally:
+        drop()
+
+
+SUITES = {
+    "reference": reference_cases,
+    "charge_sheet": document_cases,
+    "sales_estimate": document_cases,
+    "upload": upload_cases,
+    "file_reference": file_reference_cases,
+}
+
+
+def threshold_for(name, default=DEFAULT_THRESHOLD):
+    for prefix, threshold in THRESHOLDS.items():
+        if name.startswith(prefix):
+            return max(threshold, default)
+    return default
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def baseline(history, name, host, runs=BASELINE_RUNS):
+    """Median of the metric over the last runs recorded on host, or None."""
+    values = [run["results"][name] for run in history if run["host"] == host and name in run["results"]]
+    return statistics.median(values[-runs:]) if values else None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(only=None, quick=False, repeat=5):
+    """Runs the selected cases in a scratch directory; returns ({name: seconds}, {name: skip reason})."""
+    results, skipped = {}, {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)  # the ledger, catalog and client registry open relative to the working directory
+        try:
+            for suite in dict.fromkeys(SUITES.values()):
+                for name, case in suite(scratch, repeat):
+                    if only and not any(name.startswith(prefix) for prefix in only):
+                        continue
+                    if quick and name in QUICK_SKIP:
+                        continue
+                    try:
+                        results[name] = case()
+                    except Skip as e:
+                        skipped[name] = str(e)
+                    print(f"  {name:<28} {_format(results[name]) if name in results else 'skipped':>10}", file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+    return results, skipped
+
+
+def _format(seconds):
+    return f"{seconds * 1000:.3f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", nargs="+", metavar="PREFIX", help="Run only cases starting with these, e.g. upload")
+    parser.add_argument("--quick", action="store_true", help="Skip the slowest sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed samples per case")
+    parser.add_argument("--history", default=HISTORY_FILE)
+    parser.add_argument("--record", action="store_true", help="Append this run to the history")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown as a fraction (noisier cases may allow more)")
+    parser.add_argument("--baseline-runs", type=int, default=BASELINE_RUNS)
+    args = parser.parse_args(argv)
+
+    host = socket.gethostname()
+    history = load_history(args.history)
+    results, skipped = run(args.only, args.quick, args.repeat)
+
+    regressions = []
+    print(f"{'case':<28} {'median':>12} {'baseline':>12} {'change':>8}  status")
+    for name, seconds in results.items():
+        reference = baseline(history, name, host, args.baseline_runs)
+        if reference is None:
+            print(f"{name:<28} {_format(seconds):>12} {'-':>12} {'-':>8}  new")
+            continue
+        change = seconds / reference - 1
+        limit = threshold_for(name, args.threshold)
+        status = "ok"
+        if change > limit:
+            status = f"REGRESSED (limit +{limit:.0%})"
+            regressions.append(name)
+        print(f"{name:<28} {_format(seconds):>12} {_format(reference):>12} {change:>+8.1%}  {status}")
+    for name, reason in skipped.items():
+        print(f"{name:<28} {'':>12} {'':>12} {'':>8}  skipped: {reason}")
+
+    if args.record and results:
+        history.append({
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "host": host,
+            "python": platform.python_version(),
+            "results": results,
+        })
+        atomic_write(args.history, json.dumps(history, indent=1))
+        print(f"Recorded in {args.history} ({len(history)} runs).")
+
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
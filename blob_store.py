@@ -0,0 +1,169 @@
+"""
+Content-addressed blob store for uploaded shipment documents.
+
+Every distinct file is stored once under uploads/.blobs/<aa>/<bb>/<sha256>
+and each file reference's folder holds a hard link to it, so the folders
+still look and browse exactly as before while identical documents filed
+under several references (or re-uploaded with a new timestamp) take the
+space of one.
+
+A blob and its links are one file, so they share permissions too; uploads
+keep theirs. The app never writes a stored document in place (saves go to
+a temp file renamed under a new name), but editing an upload in place
+outside the app changes every reference linked to it.
+
+Migrate an existing uploads/ tree and report the bytes reclaimed with:
+
+    python blob_store.py --dedupe [--dry-run]
+"""
+import os
+import sys
+import hashlib
+import argparse
+import tempfile
+
+UPLOAD_FOLDER = "uploads"
+BLOB_DIR = os.path.join(UPLOAD_FOLDER, ".blobs")
+
+# Read size when hashing existing files
+CHUNK_SIZE = 1024 * 1024
+
+
+def blob_path(sha256, blob_dir=BLOB_DIR):
+    return os.path.join(blob_dir, sha256[:2], sha256[2:4], sha256)
+
+
+def hash_file(path):
+    """(sha256, size) of a file, read in CHUNK_SIZE pieces."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def link_into_store(path, sha256=None, blob_dir=BLOB_DIR):
+    """
+    Makes path a hard link to the blob for its content and returns the
+    number of bytes freed (its size if an identical blob already existed
+    and path was a separate copy, otherwise 0).
+
+    If the blob doesn't exist yet, path itself becomes the blob. If hard
+    links aren't supported the file is left as a plain copy.
+    """
+    if sha256 is None:
+        sha256, _ = hash_file(path)
+    blob = blob_path(sha256, blob_dir)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+
+    try:
+        os.link(path, blob)
+        return 0
+    except FileExistsError:
+        pass
+    except OSError:
+        return 0  # no hard links on this filesystem
+
+    if os.path.samefile(path, blob):
+        return 0
+
+    size = os.path.getsize(path)
+    folder = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".link_")
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        os.link(blob, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return 0
+    return size
+
+
+def iter_documents(upload_folder=UPLOAD_FOLDER):
+    """Yields the path of every stored document (hidden files and folders skipped)."""
+    for root, dirs, files in os.walk(upload_folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.startswith("."):
+                yield os.path.join(root, name)
+
+
+def _inode(path):
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+def dedupe_uploads(upload_folder=UPLOAD_FOLDER, blob_dir=None, dry_run=False):
+    """
+    Moves every document under upload_folder into the blob store, replacing
+    duplicates with hard links. Returns a summary dict with file, unique
+    content and byte counts.
+    """
+    blob_dir = blob_dir or os.path.join(upload_folder, ".blobs")
+    canonical = {}  # sha256 -> inode every copy will end up sharing
+    summary = {"files": 0, "unique": 0, "bytes_total": 0, "bytes_reclaimed": 0}
+
+    for path in iter_documents(upload_folder):
+        sha256, size = hash_file(path)
+        summary["files"] += 1
+        summary["bytes_total"] += size
+
+        if sha256 not in canonical:
+            summary["unique"] += 1
+            blob = blob_path(sha256, blob_dir)
+            canonical[sha256] = _inode(blob) if os.path.exists(blob) else _inode(path)
+
+        if dry_run:
+            if _inode(path) != canonical[sha256]:
+                summary["bytes_reclaimed"] += size
+        else:
+            summary["bytes_reclaimed"] += link_into_store(path, sha256, blob_dir)
+
+    return summary
+
+
+def collect_garbage(blob_dir=BLOB_DIR):
+    """Removes blobs no reference links to any more; returns bytes freed."""
+    freed = 0
+    for root, _, files in os.walk(blob_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_nlink == 1:
+                os.chmod(path, 0o644)  # earlier versions made blobs read-only, which Windows won't remove
+                os.remove(path)
+                freed += stat.st_size
+    return freed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Content-addressed storage for uploads/.")
+    parser.add_argument("--uploads", default=UPLOAD_FOLDER)
+    parser.add_argument("--dedupe", action="store_true", help="Move existing uploads into the blob store")
+    parser.add_argument("--dry-run", action="store_true", help="Report what --dedupe would reclaim without changing anything")
+    parser.add_argument("--gc", action="store_true", help="Delete blobs no longer linked from any reference")
+    args = parser.parse_args(argv)
+    blob_dir = os.path.join(args.uploads, ".blobs")
+
+    if args.dedupe:
+        summary = dedupe_uploads(args.uploads, blob_dir, dry_run=args.dry_run)
+        verb = "Would reclaim" if args.dry_run else "Reclaimed"
+        print(f"{summary['files']} files, {summary['unique']} unique "
+              f"({summary['bytes_total']:,} bytes). {verb} {summary['bytes_reclaimed']:,} bytes.")
+    if args.gc:
+        print(f"Removed unreferenced blobs: {collect_garbage(blob_dir):,} bytes freed.")
+    if not (args.dedupe or args.gc):
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,9 @@
 import streamlit as st
 import os
-import json
 from datetime import datetime
 from fpdf import FPDF
+from running_numbers import allocate_running_number
+from upload_storage import save_upload, timestamped_filename, get_upload_queue, render_upload_jobs, session_uploader, UploadQuotaExceeded
 
 # Directories
 DATA_DIR = "data"
@@ -25,20 +26,6 @@ road_freight_routes = {
     "Chirundu": "SY"
 }
 
-# Load running numbers from file
-def load_running_numbers():
-    data_file = os.path.join(DATA_DIR, "running_numbers.json")
-    if os.path.exists(data_file):
-        with open(data_file, "r") as file:
-            return json.load(file)
-    return {}
-
-# Save running numbers to file
-def save_running_numbers(running_numbers):
-    data_file = os.path.join(DATA_DIR, "running_numbers.json")
-    with open(data_file, "w") as file:
-        json.dump(running_numbers, file)
-
 # Function to get and update running number
 def get_next_file_reference(mode, route=None):
     """
@@ -53,20 +40,10 @@ def get_next_file_reference(mode, route=None):
     else:
         prefix = mode[:2].upper()  # Default to first 2 letters
 
-    # Load running numbers
-    running_numbers = load_running_numbers()
-
-    # Reset counter if a new month starts
+    # Allocate under a file lock (counter resets when a new month starts)
+    data_file = os.path.join(DATA_DIR, "running_numbers.json")
     key = f"{prefix}/{month_year}"
-    if key not in running_numbers:
-        running_numbers[key] = 1
-    else:
-        running_numbers[key] += 1
-
-    new_number = str(running_numbers[key]).zfill(3)  # Ensure 3-digit format (001, 002, ...)
-
-    # Save updated running numbers
-    save_running_numbers(running_numbers)
+    new_number = str(allocate_running_number(key, data_file)).zfill(3)  # Ensure 3-digit format (001, 002, ...)
 
     return f"{prefix}{new_number}/{month_year}"
 
@@ -96,19 +73,17 @@ uploaded_file = st.file_uploader("Upload Document", type=["pdf", "jpg", "png"])
 
 if uploaded_file and selected_ref and selected_ref != "No references yet":
     if st.button("Upload"):
-        # Ensure directory exists
-        file_path = os.path.join(UPLOAD_FOLDER, selected_ref.replace("/", ""))
-        os.makedirs(file_path, exist_ok=True)
-
-        # Save file with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"{uploaded_file.name.split('.')[0]}_{timestamp}.{uploaded_file.name.split('.')[-1]}"  # ✅ Modified filename
-        save_path = os.path.join(file_path, filename)
-
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.read())
-
-        st.success(f"File uploaded successfully: {save_path}")
+        try:
+            stored = save_upload(uploaded_file, selected_ref, timestamped_filename(uploaded_file.name), UPLOAD_FOLDER,
+                                 uploader=session_uploader(st), queue=get_upload_queue())
+        except UploadQuotaExceeded as e:
+            st.error(str(e))
+        else:
+            st.session_state.setdefault("upload_jobs", []).extend(stored.jobs)
+            st.success(f"File uploaded successfully: {stored.path}")
+
+# Background processing of uploads (catalogue, thumbnails), polled on every rerun
+render_upload_jobs(st, st.session_state.get("upload_jobs", []))
 
 # 📌 Charge Input Section
 st.subheader("Enter Charges for Selected File Reference")
@@ -0,0 +1,213 @@
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """
+    numpy, or None when it isn't installed (ChargeMatrix falls back to pure
+    Python). Imported on first use rather than with this module: numpy adds
+    ~90 ms to a cold start, and most reruns never build a matrix.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def __getattr__(name):
+    # Keeps "from charges import np" working for the bulk code that wants numpy itself
+    if name == "np":
+        return _numpy()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# VAT charged on sales estimates, in whole percent
+VAT_RATE_PERCENT = 15
+
+
+def to_cents(amount):
+    """Converts a USD amount (float, str or Decimal) to integer cents, rounding half up."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def vat_cents(subtotal_cents, rate_percent=VAT_RATE_PERCENT):
+    """VAT on a (non-negative) subtotal in cents, rounded half up to the cent."""
+    return (subtotal_cents * rate_percent + 50) // 100
+
+
+
+class ChargeSchema:
+    """
+    Compiled list of charge lines: each field gets a fixed integer slot, so
+    a file's charges can be held as a flat array and many files stacked
+    into a matrix with the same column order.
+    """
+
+    def __init__(self, fields):
+        fields = tuple(fields)
+        duplicates = sorted({field for field in fields if fields.count(field) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate charge fields: {', '.join(duplicates)}")
+        self.fields = fields
+        self.slots = {field: slot for slot, field in enumerate(fields)}
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __eq__(self, other):
+        return isinstance(other, ChargeSchema) and self.fields == other.fields
+
+    def __hash__(self):
+        return hash(self.fields)
+
+    def vector(self, charge_data):
+        """Builds a ChargeVector from a {field: amount} dict."""
+        unknown = [field for field in charge_data if field not in self.slots]
+        if unknown:
+            raise ValueError(f"Unknown charge fields: {', '.join(unknown)}")
+        cents = array("q", bytes(8 * len(self.fields)))
+        for field, amount in charge_data.items():
+            if amount:
+                cents[self.slots[field]] = to_cents(amount)
+        return ChargeVector(self, cents)
+
+
+@lru_cache(maxsize=64)
+def _compile(fields):
+    return ChargeSchema(fields)
+
+
+def compile_schema(fields):
+    """Returns the (cached) ChargeSchema for an ordered list of charge fields."""
+    return _compile(tuple(fields))
+
+
+class ChargeVector:
+    """One file's charges as exact integer cents, in schema slot order."""
+
+    __slots__ = ("schema", "cents")
+
+    def __init__(self, schema, cents):
+        if len(cents) != len(schema):
+            raise ValueError(f"Expected {len(schema)} charges, got {len(cents)}")
+        self.schema = schema
+        self.cents = cents
+
+    def items(self):
+        """(field, amount in USD) for every slot, in schema order."""
+        return [(field, cents / 100) for field, cents in zip(self.schema.fields, self.cents)]
+
+    def charged_items(self):
+        """(field, amount in USD) for the lines that appear on documents (amount > 0)."""
+        return [(field, cents / 100) for field, cents in zip(self.schema.fields, self.cents) if cents > 0]
+
+    def subtotal_cents(self):
+        return sum(cents for cents in self.cents if cents > 0)
+
+    def vat_cents(self, rate_percent=VAT_RATE_PERCENT):
+        return vat_cents(self.subtotal_cents(), rate_percent)
+
+    def total_cents(self, rate_percent=VAT_RATE_PERCENT):
+        subtotal = self.subtotal_cents()
+        return subtotal + vat_cents(subtotal, rate_percent)
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+def as_charge_vector(charge_data, schema=None):
+    """
+    Accepts a ChargeVector or a {field: amount} dict. Dicts are placed on
+    schema, or on a schema compiled from their own keys.
+    """
+    if isinstance(charge_data, ChargeVector):
+        return charge_data
+    schema = schema or compile_schema(charge_data.keys())
+    return schema.vector(charge_data)
+
+
+class ChargeMatrix:
+    """
+    Charges for many files stacked into a files x fields matrix of cents,
+    so totals, VAT and per-field sums are computed in one vectorised pass
+    (NumPy when installed, plain Python otherwise). As on the documents,
+    only positive amounts count towards totals.
+    """
+
+    def __init__(self, schema, rows):
+        self.schema = schema
+        self.rows = rows
+
+    @classmethod
+    def stack(cls, schema, vectors):
+        vectors = [as_charge_vector(vector, schema) for vector in vectors]
+        for vector in vectors:
+            if vector.schema != schema:
+                raise ValueError("All vectors must share the matrix schema")
+        return cls.from_rows(schema, [vector.cents for vector in vectors])
+
+    @classmethod
+    def from_rows(cls, schema, rows):
+        """Builds a matrix from per-file array('q') rows of cents in schema order."""
+        np = _numpy()
+        if np is not None:
+            matrix = np.frombuffer(b"".join(row.tobytes() for row in rows), dtype=np.int64)
+            return cls(schema, matrix.reshape(len(rows), len(schema)))
+        return cls(schema, list(rows))
+
+    def take(self, indexes):
+        """New matrix holding the given rows, in the given order."""
+        np = _numpy()
+        if np is not None:
+            return ChargeMatrix(self.schema, self.rows[np.asarray(indexes, dtype=np.intp)])
+        return ChargeMatrix(self.schema, [self.rows[i] for i in indexes])
+
+    def difference(self, other):
+        """Element-wise self - other, in cents (may be negative)."""
+        if other.schema != self.schema or len(other) != len(self):
+            raise ValueError("Matrices must share a schema and row count")
+        np = _numpy()
+        if np is not None:
+            return ChargeMatrix(self.schema, self.rows - other.rows)
+        return ChargeMatrix(self.schema, [array("q", (a - b for a, b in zip(mine, theirs)))
+                                          for mine, theirs in zip(self.rows, other.rows)])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row(self, index):
+        return ChargeVector(self.schema, array("q", self.rows[index]))
+
+    def subtotals_cents(self):
+        """Subtotal per file."""
+        np = _numpy()
+        if np is not None:
+            return np.where(self.rows > 0, self.rows, 0).sum(axis=1)
+        return [sum(cents for cents in row if cents > 0) for row in self.rows]
+
+    def vat_cents(self, rate_percent=VAT_RATE_PERCENT):
+        """VAT per file, rounded half up to the cent."""
+        subtotals = self.subtotals_cents()
+        np = _numpy()
+        if np is not None:
+            return (subtotals * rate_percent + 50) // 100
+        return [vat_cents(subtotal, rate_percent) for subtotal in subtotals]
+
+    def totals_cents(self, rate_percent=VAT_RATE_PERCENT):
+        """Subtotal plus VAT per file."""
+        subtotals = self.subtotals_cents()
+        np = _numpy()
+        if np is not None:
+            return subtotals + (subtotals * rate_percent + 50) // 100
+        return [subtotal + vat_cents(subtotal, rate_percent) for subtotal in subtotals]
+
+    def field_sums_cents(self):
+        """{field: total cents across all files}."""
+        np = _numpy()
+        if np is not None:
+            sums = np.where(self.rows > 0, self.rows, 0).sum(axis=0).tolist()
+        else:
+            sums = [sum(cents for cents in column if cents > 0) for column in zip(*self.rows)] or [0] * len(self.schema)
+        return dict(zip(self.schema.fields, sums))
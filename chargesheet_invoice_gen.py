@@ -1,8 +1,13 @@
 import streamlit as st
+import io
 import os
-import json
 from datetime import datetime
 from fpdf import FPDF
+from running_numbers import allocate_running_number
+from upload_storage import save_upload, timestamped_filename, get_upload_queue, render_upload_jobs, session_uploader, UploadQuotaExceeded
+from documents import generate_nhs_charge_sheet
+from variance import load_charge_sets, compute_variances
+from client_registry import get_client_registry
 
 # Directories
 DATA_DIR = "data"
@@ -27,23 +32,6 @@ road_freight_routes = {
     "Chirundu": "SY"
 }
 
-# Sample registered clients (Load from file if needed)
-registered_clients = ["ABC Logistics", "XYZ Traders", "Global Cargo Ltd"]
-
-# Load running numbers from file
-def load_running_numbers():
-    data_file = os.path.join(DATA_DIR, "running_numbers.json")
-    if os.path.exists(data_file):
-        with open(data_file, "r") as file:
-            return json.load(file)
-    return {}
-
-# Save running numbers to file
-def save_running_numbers(running_numbers):
-    data_file = os.path.join(DATA_DIR, "running_numbers.json")
-    with open(data_file, "w") as file:
-        json.dump(running_numbers, file)
-
 # Function to get and update running number
 def get_next_file_reference(mode, route=None):
     today = datetime.today()
@@ -55,18 +43,11 @@ def get_next_file_reference(mode, route=None):
     else:
         prefix = mode[:2].upper()
 
-    running_numbers = load_running_numbers()
+    # Allocate under a file lock (counter resets when a new month starts)
+    data_file = os.path.join(DATA_DIR, "running_numbers.json")
     key = f"{prefix}/{month_year}"
+    new_number = str(allocate_running_number(key, data_file)).zfill(3)  # Ensure 3-digit format (001, 002, ...)
 
-    # Reset counter if a new month starts
-    if key not in running_numbers:
-        running_numbers[key] = 1
-    else:
-        running_numbers[key] += 1
-
-    new_number = str(running_numbers[key]).zfill(3)  # Ensure 3-digit format (001, 002, ...)
-
-    save_running_numbers(running_numbers)
     return f"{prefix}{new_number}/{month_year}"
 
 # Streamlit UI
@@ -94,27 +75,33 @@ selected_ref = st.selectbox("Select File Reference", file_refs if file_refs else
 st.subheader("Customer Details")
 customer_option = st.radio("Choose Customer", ["Select from Registered Clients", "Enter Manually"])
 
+clients = get_client_registry()
 if customer_option == "Select from Registered Clients":
-    customer = st.selectbox("Select Customer", registered_clients)
+    client = st.selectbox("Select Customer", clients.search(st.text_input("Search Clients", placeholder="Name or customer ID")),
+                          format_func=lambda client: f"{client.name} ({client.customer_id})")
+    customer = client.name if client else ""
 else:
     customer = st.text_input("Enter Customer Name")
+    similar = clients.similar(customer) if customer.strip() and not clients.lookup(customer) else []
+    if similar:
+        st.warning("Similar clients are already registered: " + ", ".join(f"{c.name} ({c.customer_id})" for c in similar))
 
 # File Upload Section
 uploaded_file = st.file_uploader("Upload Document", type=["pdf", "jpg", "png"])
 
 if uploaded_file and selected_ref != "No references yet":
     if st.button("Upload"):
-        file_path = os.path.join(UPLOAD_FOLDER, selected_ref.replace("/", ""))
-        os.makedirs(file_path, exist_ok=True)
-
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"{uploaded_file.name.split('.')[0]}_{timestamp}.{uploaded_file.name.split('.')[-1]}"
-        save_path = os.path.join(file_path, filename)
-
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.read())
-
-        st.success(f"File uploaded successfully: {save_path}")
+        try:
+            stored = save_upload(uploaded_file, selected_ref, timestamped_filename(uploaded_file.name), UPLOAD_FOLDER, customer=customer or None,
+                                 uploader=session_uploader(st), queue=get_upload_queue())
+        except UploadQuotaExceeded as e:
+            st.error(str(e))
+        else:
+            st.session_state.setdefault("upload_jobs", []).extend(stored.jobs)
+            st.success(f"File uploaded successfully: {stored.path}")
+
+# Background processing of uploads (catalogue, thumbnails), polled on every rerun
+render_upload_jobs(st, st.session_state.get("upload_jobs", []))
 
 # 📌 Charge Input Section
 st.subheader("Enter Charges for Selected File Reference")
@@ -177,25 +164,31 @@ if discrepancies:
     for field, variance in discrepancies.items():
         st.write(f"**{field}:** Variance of ${variance:.2f}")
 
+# Bulk Variance Report (a month or quarter of file references at once)
+st.subheader("Bulk Variance Report")
+our_charges_file = st.file_uploader("Our Charges (CSV or JSONL)", type=["csv", "jsonl"], key="bulk_ours")
+nhs_charges_file = st.file_uploader("NHS Charges (CSV or JSONL)", type=["csv", "jsonl"], key="bulk_nhs")
+
+if our_charges_file and nhs_charges_file and st.button("Run Variance Report"):
+    try:
+        our_sets = load_charge_sets(our_charges_file)
+        report = compute_variances(our_sets, load_charge_sets(nhs_charges_file, schema=our_sets.matrix.schema))
+    except (ValueError, KeyError) as e:
+        st.error(f"Could not compare charges: {e}")
+    else:
+        st.write(f"{len(report.references)} references compared "
+                 f"({len(report.missing_from_nhs)} missing from NHS, {len(report.missing_from_ours)} missing from ours)")
+        st.write("**Worst variances**")
+        st.dataframe(report.top(50))
+        for group in ("customer", "route", "field"):
+            st.write(f"**Worst by {group}**")
+            st.dataframe(report.by_group(group)[:20])
+
+        variance_csv = io.StringIO()
+        report.write_csv(variance_csv)
+        st.download_button("Download All Variances", variance_csv.getvalue(), file_name="variances.csv", mime="text/csv")
+
 # Generate NHS Charge Sheet
 if st.button("Generate NHS Charge Sheet"):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(200, 10, f"NHS Charge Sheet - {selected_ref}", ln=True, align="C")
-
-    pdf.ln(10)
-    pdf.set_font("Arial", "", 12)
-    pdf.cell(200, 10, f"Customer: {customer}", ln=True)
-
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(100, 10, "NHS Service", border=1)
-    pdf.cell(100, 10, "Charge (USD)", border=1, ln=True)
-
-    for field, amount in nhs_charge_data.items():
-        pdf.cell(100, 10, field, border=1)
-        pdf.cell(100, 10, f"${amount:.2f}", border=1, ln=True)
-
-    charge_sheet_path = os.path.join(CHARGE_SHEETS_FOLDER, f"NHS_Charge_Sheet_{selected_ref.replace('/', '')}.pdf")
-    pdf.output(charge_sheet_path)
+    charge_sheet_path = generate_nhs_charge_sheet(selected_ref, customer, nhs_charge_data, CHARGE_SHEETS_FOLDER)
     st.success("NHS Charge Sheet Generated")
@@ -0,0 +1,313 @@
+"""
+Registry of clients and their TSLC customer IDs.
+
+Clients are rows in data/clients.db. register() hands out the next
+TSLC number inside a write transaction, so two sessions registering at
+once never get the same ID, and a name that is already registered
+(ignoring case, punctuation and spacing) returns the existing client.
+
+Type-ahead runs against an in-memory index rather than the database:
+
+    prefix    every word of every name (and every customer ID) in one
+              sorted list; a query matches clients with a word starting
+              with each of its words ("glo car" finds Global Cargo Ltd)
+    trigram   3-letter pieces of each name; clients sharing enough of
+              them with the query are typo-tolerant matches ("Globl
+              Cargo"), also used to warn about near-duplicates before a
+              new client is registered
+
+Clients registered by other processes are picked up on the next lookup
+(rows are only ever added). The clients in reference_data are seeded
+with their existing IDs.
+
+    python client_registry.py --search "global car"
+    python client_registry.py --import clients.csv
+    python client_registry.py --duplicates
+"""
+import os
+import re
+import sys
+import csv
+import bisect
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from collections import Counter, defaultdict, namedtuple
+
+from reference_data import load_reference_data
+
+CLIENTS_DB = os.path.join("data", "clients.db")
+
+CUSTOMER_ID_PREFIX = "TSLC"
+
+# Words ignored when comparing names for near-duplicates ("Global Cargo Ltd" vs "Global Cargo Limited")
+LEGAL_SUFFIXES = {"ltd", "limited", "pvt", "private", "pty", "inc", "llc", "plc", "co", "company", "corp"}
+
+# Trigram similarity (0-1) for typo-tolerant search matches and for near-duplicate warnings
+FUZZY_THRESHOLD = 0.45
+DUPLICATE_THRESHOLD = 0.6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    number      INTEGER PRIMARY KEY,   -- TSLC number
+    customer_id TEXT NOT NULL UNIQUE,
+    name        TEXT NOT NULL,
+    name_key    TEXT NOT NULL UNIQUE,  -- normalize(name)
+    created_at  TEXT NOT NULL
+);
+"""
+
+Client = namedtuple("Client", ["number", "customer_id", "name"])
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(name):
+    """Lower-case words of a name, single-spaced: "A.B.C  Logistics" -> "a b c logistics"."""
+    return " ".join(_WORD.findall(name.casefold()))
+
+
+def _match_key(key):
+    words = key.split()
+    return " ".join(word for word in words if word not in LEGAL_SUFFIXES) or key
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def format_customer_id(number):
+    return f"{CUSTOMER_ID_PREFIX}{number:04d}"
+
+
+class ClientIndex:
+    """In-memory prefix and trigram index over clients."""
+
+    def __init__(self):
+        self.clients = {}                     # number -> Client
+        self.by_key = {}                      # normalize(name) -> number
+        self._words = []                      # sorted (word, number)
+        self._trigrams = defaultdict(set)     # trigram -> numbers
+        self._grams = {}                      # number -> trigrams of its match key
+
+    def add(self, clients):
+        new_words = []
+        trigrams = self._trigrams
+        for client in clients:
+            number, key = client.number, normalize(client.name)
+            self.clients[number] = client
+            self.by_key[key] = number
+            new_words.extend((word, number) for word in {*key.split(), client.customer_id.casefold()})
+            grams = self._grams[number] = _trigrams(_match_key(key))
+            for gram in grams:
+                trigrams[gram].add(number)
+        if len(new_words) > 16:
+            self._words = sorted(self._words + new_words)
+        else:
+            for entry in new_words:
+                bisect.insort(self._words, entry)
+
+    def _starting_with(self, prefix):
+        start = bisect.bisect_left(self._words, (prefix,))
+        end = bisect.bisect_left(self._words, (prefix + "\uffff",))
+        return {number for _, number in self._words[start:end]}
+
+    def prefix(self, query):
+        """Numbers of clients with a word starting with each word of the query."""
+        words = normalize(query).split()
+        if not words:
+            return set(self.clients)
+        matches = self._starting_with(words[0])
+        for word in words[1:]:
+            if not matches:
+                break
+            matches &= self._starting_with(word)
+        return matches
+
+    def similar(self, name, threshold):
+        """[(similarity, number)] of clients whose names are close to name, best first."""
+        grams = _trigrams(_match_key(normalize(name)))
+        shared = Counter(number for gram in grams for number in self._trigrams.get(gram, ()))
+        scored = []
+        for number, count in shared.items():
+            # Dice similarity from the shared count; skips candidates that can't reach the threshold
+            similarity = 2 * count / (len(grams) + len(self._grams[number]))
+            if similarity >= threshold:
+                scored.append((similarity, number))
+        scored.sort(key=lambda item: (-item[0], self.clients[item[1]].name))
+        return scored
+
+
+class ClientRegistry:
+    """The client database plus its in-memory index; each thread gets its own connection."""
+
+    def __init__(self, db_path=CLIENTS_DB, seed=True):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._index = ClientIndex()
+        self._index_lock = threading.Lock()
+        self._loaded = 0  # highest client number in the index
+        self._connection().executescript(SCHEMA)
+        if seed:
+            self._seed(load_reference_data()["registered_clients"])
+        self._refresh()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _seed(self, clients):
+        """Adds the reference-data clients with the IDs they already have on issued documents."""
+        rows = []
+        for name, customer_id in clients.items():
+            match = re.fullmatch(rf"{CUSTOMER_ID_PREFIX}(\d+)", customer_id or "")
+            if match:
+                rows.append((int(match.group(1)), customer_id, name, normalize(name), datetime.now().isoformat(timespec="seconds")))
+        self._connection().executemany(
+            "INSERT OR IGNORE INTO clients (number, customer_id, name, name_key, created_at) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def _refresh(self):
+        """Adds clients registered since the last refresh (by any process) to the index."""
+        with self._index_lock:
+            rows = self._connection().execute(
+                "SELECT number, customer_id, name FROM clients WHERE number > ? ORDER BY number", (self._loaded,)).fetchall()
+            if rows:
+                self._index.add(Client(*row) for row in rows)
+                self._loaded = rows[-1][0]
+        return self._index
+
+    def register(self, name):
+        """
+        Returns the Client for name, allocating the next TSLC ID if it isn't
+        registered yet. Near-duplicates are not checked here; see similar().
+        """
+        name = " ".join(name.split())
+        key = normalize(name)
+        if not key:
+            raise ValueError("Client name is empty")
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")  # IDs are allocated one writer at a time
+        try:
+            row = conn.execute("SELECT number, customer_id, name FROM clients WHERE name_key = ?", (key,)).fetchone()
+            if row is None:
+                number = conn.execute("SELECT COALESCE(MAX(number), 0) + 1 FROM clients").fetchone()[0]
+                row = (number, format_customer_id(number), name)
+                conn.execute("INSERT INTO clients (number, customer_id, name, name_key, created_at) VALUES (?, ?, ?, ?, ?)",
+                             (*row, key, datetime.now().isoformat(timespec="seconds")))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._refresh()
+        return Client(*row)
+
+    def lookup(self, name):
+        """The registered Client with this name (ignoring case and punctuation), or None."""
+        index = self._refresh()
+        number = index.by_key.get(normalize(name or ""))
+        if number is None:
+            return None
+        return index.clients[number]
+
+    def customer_id(self, name):
+        client = self.lookup(name)
+        return client.customer_id if client else None
+
+    def search(self, query, limit=20):
+        """
+        Type-ahead matches for query, best first: names starting with the
+        query, then names with words starting with its words, then typo-
+        tolerant matches.
+        """
+        index = self._refresh()
+        key = normalize(query or "")
+        with self._index_lock:
+            numbers = index.prefix(key)
+            matches = sorted((index.clients[number] for number in numbers),
+                             key=lambda client: (not normalize(client.name).startswith(key), client.name.casefold()))
+            if len(matches) < limit and len(key) >= 3:
+                matches += [index.clients[number] for _, number in index.similar(key, FUZZY_THRESHOLD)
+                            if number not in numbers][:limit - len(matches)]
+        return matches[:limit]
+
+    def similar(self, name, threshold=DUPLICATE_THRESHOLD, limit=5):
+        """Registered clients whose names are close to name (other than name itself), closest first."""
+        index = self._refresh()
+        own = index.by_key.get(normalize(name or ""))
+        with self._index_lock:
+            return [index.clients[number] for _, number in index.similar(name, threshold)
+                    if number != own][:limit]
+
+    def duplicates(self, threshold=DUPLICATE_THRESHOLD):
+        """[(client, similar client, similarity)] for every pair of near-duplicate registered clients."""
+        index = self._refresh()
+        pairs = []
+        with self._index_lock:
+            for number, client in index.clients.items():
+                for similarity, other in index.similar(client.name, threshold):
+                    if other > number:
+                        pairs.append((client, index.clients[other], similarity))
+        return sorted(pairs, key=lambda pair: -pair[2])
+
+    def import_csv(self, path):
+        """Registers every name in the first column of a CSV file; returns how many were new."""
+        before = len(self._refresh().clients)
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.reader(file):
+                if row and normalize(row[0]) and normalize(row[0]) != "name":
+                    self.register(row[0])
+        return len(self._refresh().clients) - before
+
+    def __len__(self):
+        return len(self._refresh().clients)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry():
+    """The process-wide ClientRegistry, opened on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ClientRegistry()
+    return _registry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search, import or check the client registry.")
+    parser.add_argument("--db", default=CLIENTS_DB)
+    parser.add_argument("--search")
+    parser.add_argument("--register", metavar="NAME")
+    parser.add_argument("--import", dest="import_path", metavar="CSV", help="Register the names in the first column")
+    parser.add_argument("--duplicates", action="store_true", help="List near-duplicate client names")
+    args = parser.parse_args(argv)
+    registry = ClientRegistry(args.db)
+
+    if args.import_path:
+        print(f"Registered {registry.import_csv(args.import_path)} new clients.")
+    if args.register:
+        client = registry.register(args.register)
+        print(f"{client.customer_id}  {client.name}")
+    if args.search is not None:
+        for client in registry.search(args.search):
+            print(f"{client.customer_id}  {client.name}")
+    if args.duplicates:
+        for client, other, similarity in registry.duplicates():
+            print(f"{similarity:.2f}  {client.customer_id} {client.name!r}  ~  {other.customer_id} {other.name!r}")
+    if not (args.import_path or args.register or args.search is not None or args.duplicates):
+        print(f"{len(registry)} clients registered.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+from pdf_templates import TEMPLATE_VERSION
+from charges import as_charge_vector
+from running_numbers import atomic_write
+from client_registry import get_client_registry
+from documents import render_charge_sheet, render_sales_estimate, render_nhs_charge_sheet
+
+# Disk tier for rendered documents, sharded by the first two hex digits of the key
+CACHE_DIR = os.path.join("cache", "documents")
+
+# Memory tier budget (total PDF bytes kept in the LRU)
+MAX_MEMORY_BYTES = 64 * 1024 * 1024
+
+# Disk tier budget; when a write takes it over, the least recently used files
+# are removed until it is back under DISK_TRIM_TO of the budget
+MAX_DISK_BYTES = 512 * 1024 * 1024
+DISK_TRIM_TO = 0.9
+
+# Renderers by document type, and whether zero charges appear on the document
+RENDERERS = {
+    "charge_sheet": (render_charge_sheet, False),
+    "sales_estimate": (render_sales_estimate, False),
+    "nhs_charge_sheet": (render_nhs_charge_sheet, True),
+}
+
+
+def document_key(document_type, reference, customer, charge_data):
+    """
+    Stable hash of everything that affects the rendered document: type,
+    reference, customer and their registered customer ID (so registering a
+    client later doesn't serve the "Customer ID: None" copy), the charges
+    that are printed (in order), the template version and the date printed
+    on the document.
+    """
+    _, include_zero = RENDERERS[document_type]
+    vector = as_charge_vector(charge_data)
+    charges = [[field, cents] for field, cents in zip(vector.schema.fields, vector.cents) if include_zero or cents > 0]
+    payload = json.dumps([document_type, reference, customer, get_client_registry().customer_id(customer), charges,
+                          TEMPLATE_VERSION, datetime.today().strftime("%Y-%m-%d")], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DocumentCache:
+    """
+    Two-tier cache of rendered PDFs: a byte-bounded in-memory LRU in front
+    of a byte-bounded directory of <key>.pdf files. Safe to share between
+    Streamlit sessions (threads) in one process; the disk tier is shared
+    between processes.
+
+    Disk hits touch the file's mtime, so trimming the disk tier removes the
+    least recently used files first. Each process tracks the tier's size
+    from its own writes and rescans the directory when it trims, which
+    picks up what other processes wrote.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None  # scanned on the first write
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        if len(data) > self.max_memory_bytes:
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key, disk=True):
+        """Returns cached PDF bytes for key, or None. disk=False looks in memory only."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+            if not disk:
+                self.misses += 1
+                return None
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)  # recently used; trimmed last
+        except FileNotFoundError:  # never written, or trimmed (possibly by another process)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self._remember(key, data)
+            self.hits += 1
+            self.disk_hits += 1
+        return data
+
+    def put(self, key, data, disk=True):
+        """Caches data for key; disk=False keeps it in the memory tier only."""
+        with self._lock:
+            self._remember(key, data)
+        if not disk:
+            return
+        atomic_write(self._path(key), data)
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._trim_disk()
+
+    def _disk_entries(self):
+        """(mtime, path, size) of every file in the disk tier."""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(".tmp_"):  # an atomic_write in progress
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _trim_disk(self):
+        # Caller holds the disk lock
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, _, size in entries)
+        target = self.max_disk_bytes * DISK_TRIM_TO
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # already trimmed by another process
+            total -= size
+            self.disk_evictions += 1
+        self._disk_bytes = total
+
+    def get_or_render(self, key, render, disk=True):
+        """
+        Returns (pdf_bytes, hit), calling render() only on a miss. disk=False
+        neither reads nor writes the disk tier (previews stay off the filesystem).
+        """
+        data = self.get(key, disk)
+        if data is not None:
+            return data, True
+        data = render()
+        self.put(key, data, disk)
+        return data, False
+
+    def clear(self):
+        """Drops both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        with self._disk_lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self._disk_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+
+
+# Process-wide cache used by the app
+document_cache = DocumentCache()
+
+
+def render_document(document_type, reference, customer, charge_data, cache=None, disk=True):
+    """Renders a document through the cache, returning (pdf_bytes, hit); disk=False for previews."""
+    cache = cache or document_cache
+    render, _ = RENDERERS[document_type]
+    key = document_key(document_type, reference, customer, charge_data)
+    return cache.get_or_render(key, lambda: render(reference, customer, charge_data), disk)
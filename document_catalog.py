@@ -0,0 +1,334 @@
+"""
+SQLite catalog of every document stored under uploads/.
+
+One row per stored file with its file reference, original name, upload
+time, size, SHA-256, mime type, uploader, mode and customer, so listing a
+reference's documents (or a month's, a mode's or a customer's) is an
+indexed query instead of a directory scan. save_upload() records each new
+file in the same step that moves it into place; sync() brings the catalog
+up to date with files added or removed outside the app, re-hashing only
+files whose size or mtime changed.
+
+Both folder naming schemes are understood: "KY029032025" (reference
+KY029/03/2025) and the older "<mode or route>_<ddmmyy>", e.g.
+"Air Freight_010325".
+
+    python document_catalog.py --sync
+    python document_catalog.py --reference KY029/03/2025
+    python document_catalog.py --month 2025-03 --mode "Road Freight"
+"""
+import os
+import re
+import sys
+import sqlite3
+import argparse
+import mimetypes
+import threading
+from datetime import datetime
+from collections import namedtuple
+from contextlib import contextmanager
+
+from blob_store import UPLOAD_FOLDER, hash_file
+from reference_data import DEFAULT_REFERENCE_DATA
+
+# The catalog lives next to the files it describes (hidden files are never listed as documents)
+CATALOG_NAME = ".catalog.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path          TEXT PRIMARY KEY,   -- relative to the upload folder, "/"-separated
+    reference     TEXT NOT NULL,
+    folder        TEXT NOT NULL,
+    original_name TEXT NOT NULL,
+    uploaded_at   TEXT NOT NULL,      -- ISO 8601, local time
+    month         TEXT NOT NULL,      -- YYYY-MM of the file reference (upload month if unknown)
+    mode          TEXT,
+    customer      TEXT,
+    uploader      TEXT,
+    size          INTEGER NOT NULL,
+    sha256        TEXT NOT NULL,
+    mime_type     TEXT,
+    mtime_ns      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_reference ON documents (reference, uploaded_at);
+CREATE INDEX IF NOT EXISTS documents_folder ON documents (folder);
+CREATE INDEX IF NOT EXISTS documents_month ON documents (month, mode);
+CREATE INDEX IF NOT EXISTS documents_mode ON documents (mode, month);
+CREATE INDEX IF NOT EXISTS documents_customer ON documents (customer, month);
+CREATE INDEX IF NOT EXISTS documents_sha256 ON documents (sha256);
+"""
+
+COLUMNS = ("path", "reference", "folder", "original_name", "uploaded_at", "month", "mode",
+           "customer", "uploader", "size", "sha256", "mime_type", "mtime_ns")
+
+CatalogEntry = namedtuple("CatalogEntry", COLUMNS)
+
+# "KY029/03/2025" stored as "KY029032025"
+_REFERENCE_FOLDER = re.compile(r"^([A-Z]+)(\d{3,})(\d{2})(\d{4})$")
+# Older app versions: "<mode or route>_<ddmmyy>"
+_LEGACY_FOLDER = re.compile(r"^(.+)_(\d{2})(\d{2})(\d{2})$")
+# timestamped_filename(): "<stem>_<YYYYmmddHHMMSS>.<ext>"
+_TIMESTAMPED_NAME = re.compile(r"^(.*)_(\d{14})(\.[^.]*)?$")
+
+
+def _prefix_modes():
+    prefixes = {route_prefix: "Road Freight" for route_prefix in DEFAULT_REFERENCE_DATA["road_freight_routes"].values()}
+    prefixes.update({prefix: mode for mode, prefix in DEFAULT_REFERENCE_DATA["modes"].items() if prefix})
+    return prefixes
+
+
+PREFIX_MODES = _prefix_modes()
+
+
+def parse_folder(folder):
+    """
+    (reference, mode, month) for an uploads/ folder name. Parts that can't
+    be worked out are None.
+    """
+    match = _REFERENCE_FOLDER.match(folder)
+    if match:
+        prefix, number, month, year = match.groups()
+        return f"{prefix}{number}/{month}/{year}", PREFIX_MODES.get(prefix), f"{year}-{month}"
+
+    match = _LEGACY_FOLDER.match(folder)
+    if match:
+        name, _, month, year = match.groups()
+        if name in DEFAULT_REFERENCE_DATA["modes"]:
+            mode = name
+        elif name in DEFAULT_REFERENCE_DATA["road_freight_routes"]:
+            mode = "Road Freight"
+        else:
+            mode = None
+        return folder, mode, f"20{year}-{month}"
+
+    return folder, None, None
+
+
+def parse_filename(filename, folder):
+    """(original name, upload datetime or None) recovered from a stored file name."""
+    name = filename
+    if name.startswith(folder + "_"):  # legacy "<reference>_<original name>"
+        name = name[len(folder) + 1:]
+
+    match = _TIMESTAMPED_NAME.match(name)
+    if match:
+        stem, timestamp, ext = match.groups()
+        try:
+            return stem + (ext or ""), datetime.strptime(timestamp, "%Y%m%d%H%M%S")
+        except ValueError:
+            pass
+    return name, None
+
+
+class DocumentCatalog:
+    """
+    Catalog for one upload folder. Each thread gets its own SQLite
+    connection; the database runs in WAL mode so readers never wait on the
+    upload path.
+    """
+
+    def __init__(self, upload_folder=UPLOAD_FOLDER, db_path=None):
+        self.upload_folder = upload_folder
+        self.db_path = db_path or os.path.join(upload_folder, CATALOG_NAME)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.upload_folder).replace(os.sep, "/")
+
+    def _entry(self, path, size, sha256, mtime_ns, reference=None, original_name=None,
+               uploaded_at=None, customer=None, uploader=None):
+        relative = self._relative(path)
+        folder, _, filename = relative.rpartition("/")
+        folder_reference, mode, month = parse_folder(folder)
+        parsed_name, parsed_time = parse_filename(filename, folder)
+        uploaded_at = uploaded_at or parsed_time or datetime.fromtimestamp(mtime_ns / 1e9)
+        return CatalogEntry(
+            path=relative,
+            reference=reference or folder_reference,
+            folder=folder,
+            original_name=original_name or parsed_name,
+            uploaded_at=uploaded_at.isoformat(timespec="seconds"),
+            month=month or uploaded_at.strftime("%Y-%m"),
+            mode=mode,
+            customer=customer,
+            uploader=uploader,
+            size=size,
+            sha256=sha256,
+            mime_type=mimetypes.guess_type(filename)[0],
+            mtime_ns=mtime_ns,
+        )
+
+    @staticmethod
+    def _upsert(conn, entries):
+        # Customer and uploader are only known at upload time; a rescan mustn't erase them
+        conn.executemany(
+            f"INSERT INTO documents ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+            "ON CONFLICT (path) DO UPDATE SET reference = excluded.reference, folder = excluded.folder, "
+            "original_name = excluded.original_name, uploaded_at = excluded.uploaded_at, month = excluded.month, "
+            "mode = excluded.mode, customer = COALESCE(excluded.customer, documents.customer), "
+            "uploader = COALESCE(excluded.uploader, documents.uploader), size = excluded.size, "
+            "sha256 = excluded.sha256, mime_type = excluded.mime_type, mtime_ns = excluded.mtime_ns",
+            entries)
+
+    @contextmanager
+    def recording(self, path, size, sha256, **details):
+        """
+        Catalogs the file that the block puts at path, in one transaction:
+        the row is committed only if the block succeeds, and if the commit
+        fails the file is removed again. details are reference,
+        original_name, uploaded_at, customer and uploader.
+        """
+        conn = self._connection()
+        uploaded_at = details.pop("uploaded_at", None) or datetime.now()
+        placed = False
+        try:
+            with conn:
+                yield
+                placed = True
+                stat = os.stat(path)
+                self._upsert(conn, [self._entry(path, size, sha256, stat.st_mtime_ns, uploaded_at=uploaded_at, **details)])
+        except sqlite3.Error:
+            if placed and os.path.exists(path):
+                os.remove(path)
+            raise
+
+    def record(self, path, size=None, sha256=None, **details):
+        """Catalogs a file that is already in place (hashing it if sha256 isn't given)."""
+        if sha256 is None:
+            sha256, size = hash_file(path)
+        stat = os.stat(path)
+        with self._connection() as conn:
+            self._upsert(conn, [self._entry(path, stat.st_size if size is None else size, sha256,
+                                            stat.st_mtime_ns, **details)])
+
+    def remove(self, path):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM documents WHERE path = ?", (self._relative(path),))
+
+    def sync(self, full=False):
+        """
+        Brings the catalog in line with the upload folder: new files are
+        added, changed files (size or mtime differs) re-hashed and removed
+        files dropped. full=True re-hashes everything. Returns counts.
+        """
+        conn = self._connection()
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in conn.execute("SELECT path, size, mtime_ns FROM documents")}
+        stale = set(known)
+        changed = []
+        summary = {"files": 0, "added": 0, "updated": 0, "removed": 0}
+
+        folders = sorted(os.scandir(self.upload_folder), key=lambda entry: entry.name) if os.path.isdir(self.upload_folder) else []
+        for folder in folders:
+            if folder.name.startswith(".") or not folder.is_dir():
+                continue
+            for file in os.scandir(folder.path):
+                if file.name.startswith(".") or not file.is_file():
+                    continue
+                summary["files"] += 1
+                relative = f"{folder.name}/{file.name}"
+                stale.discard(relative)
+                stat = file.stat()
+                if not full and known.get(relative) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                sha256, size = hash_file(file.path)
+                changed.append(self._entry(file.path, size, sha256, stat.st_mtime_ns))
+                summary["updated" if relative in known else "added"] += 1
+
+        with conn:
+            self._upsert(conn, changed)
+            conn.executemany("DELETE FROM documents WHERE path = ?", ((path,) for path in stale))
+        summary["removed"] = len(stale)
+        return summary
+
+    def _query(self, where, params, limit=None):
+        sql = f"SELECT {', '.join(COLUMNS)} FROM documents WHERE {where} ORDER BY uploaded_at, path"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [CatalogEntry(*row) for row in self._connection().execute(sql, params)]
+
+    def for_reference(self, reference):
+        """Documents filed under a reference ("KY029/03/2025" or its folder name), oldest first."""
+        return self._query("reference = ? OR folder = ?", (reference, reference.replace("/", "")))
+
+    def find(self, month=None, mode=None, customer=None, limit=None):
+        """Documents matching every filter given, oldest first."""
+        filters, params = [], []
+        for column, value in (("month", month), ("mode", mode), ("customer", customer)):
+            if value is not None:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        return self._query(" AND ".join(filters) or "1", params, limit)
+
+    def duplicates(self, sha256):
+        """Every document with the given content hash."""
+        return self._query("sha256 = ?", (sha256,))
+
+    def stats(self):
+        count, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+        return {"documents": count, "bytes": size}
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(upload_folder=UPLOAD_FOLDER):
+    """The shared DocumentCatalog for an upload folder, opened on first use."""
+    key = os.path.abspath(upload_folder)
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = DocumentCatalog(upload_folder)
+        return _catalogs[key]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or rebuild the uploads/ document catalog.")
+    parser.add_argument("--uploads", default=UPLOAD_FOLDER)
+    parser.add_argument("--sync", action="store_true", help="Catalog new/changed files and drop removed ones")
+    parser.add_argument("--full", action="store_true", help="With --sync, re-hash every file")
+    parser.add_argument("--reference")
+    parser.add_argument("--month", help="YYYY-MM")
+    parser.add_argument("--mode")
+    parser.add_argument("--customer")
+    args = parser.parse_args(argv)
+    catalog = DocumentCatalog(args.uploads)
+
+    if args.sync:
+        summary = catalog.sync(full=args.full)
+        print(f"{summary['files']} files: {summary['added']} added, {summary['updated']} updated, "
+              f"{summary['removed']} removed.")
+
+    if args.reference:
+        entries = catalog.for_reference(args.reference)
+    elif args.month or args.mode or args.customer:
+        entries = catalog.find(args.month, args.mode, args.customer)
+    else:
+        stats = catalog.stats()
+        print(f"{stats['documents']} documents, {stats['bytes']:,} bytes catalogued.")
+        return 0
+
+    for entry in entries:
+        print(f"{entry.uploaded_at}  {entry.reference:<20} {entry.mode or '-':<14} {entry.size:>12,}  {entry.original_name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import os
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from pdf_templates import DocumentTemplate, pdf_bytes
+from charges import VAT_RATE_PERCENT, as_charge_vector
+from running_numbers import atomic_write
+from client_registry import get_client_registry
+from ledger import get_ledger
+from metrics import timed
+
+# Output directories for generated documents
+CHARGE_SHEETS_FOLDER = "charge_sheets"
+INVOICES_FOLDER = "invoices"
+
+# Background writer for documents persisted after they've been served
+_save_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="save_document")
+
+# Deterministic output paths, one file per reference and document type
+def charge_sheet_output_path(reference, output_dir=CHARGE_SHEETS_FOLDER):
+    return os.path.join(output_dir, f"Charge_Sheet_{reference.replace('/', '')}.pdf")
+
+
+def sales_estimate_output_path(reference, output_dir=INVOICES_FOLDER):
+    return os.path.join(output_dir, f"Sales_Estimate_{reference.replace('/', '')}.pdf")
+
+
+def nhs_charge_sheet_output_path(reference, output_dir=CHARGE_SHEETS_FOLDER):
+    return os.path.join(output_dir, f"NHS_Charge_Sheet_{reference.replace('/', '')}.pdf")
+
+
+# Templates are built once per process; each document only fills in its rows
+CHARGE_SHEET_TEMPLATE = DocumentTemplate(
+    headings=("NHS Service", "Charge (USD)"),
+    title_size=14,
+    footer_lines=("Compiled by: Operations", "Approver 1: ___________________", "Approver 2: ___________________"),
+)
+
+SALES_ESTIMATE_TEMPLATE = DocumentTemplate(
+    headings=("Service Description", "Amount (USD)"),
+    title_size=16,
+    footer_note="This Sales Estimate is valid for 30 days. Payment should be made in full before service is rendered.",
+    footer_gap=10,
+)
+
+# The NHS sheet keeps its original look: no gap above the table, bold rows and
+# fpdf's default 20mm page-break margin
+NHS_CHARGE_SHEET_TEMPLATE = DocumentTemplate(
+    headings=("NHS Service", "Charge (USD)"),
+    column_widths=(100, 100),
+    title_size=16, title_height=10, title_gap=10,
+    body_size=12, line_height=10, row_height=10,
+    table_gap=0, row_style="B", bottom_margin=20,
+)
+
+
+# Default customer_id: the client's registered ID at render time
+_REGISTERED = object()
+
+
+def _customer_id(customer, customer_id):
+    return get_client_registry().customer_id(customer) if customer_id is _REGISTERED else customer_id
+
+
+def _issued_pdf_bytes(pdf, date):
+    """pdf_bytes(); a given issue date is also the PDF's creation date, so re-renders match each other."""
+    if date and hasattr(pdf, "set_creation_date"):
+        pdf.set_creation_date(date)
+    return pdf_bytes(pdf)
+
+
+# Function to render charge sheet with non-zero values only
+# (date and customer_id default to today and the registered client's ID; the
+# ledger passes the values a past document was issued with, including a None ID)
+@timed("render_charge_sheet")
+def render_charge_sheet(reference, customer, charge_data, date=None, customer_id=_REGISTERED):
+    charges = as_charge_vector(charge_data)
+
+    pdf = CHARGE_SHEET_TEMPLATE.render(
+        f"Charge Out Sheet - {reference}",
+        [f"Customer: {customer}",
+         f"Customer ID: {_customer_id(customer, customer_id)}",
+         f"Date: {(date or datetime.today()).strftime('%d-%m-%Y')}"],
+        charges.charged_items(),  # Only include non-zero charges
+        totals=[("TOTAL", charges.subtotal_cents() / 100)],
+    )
+    return _issued_pdf_bytes(pdf, date)
+
+
+# Function to render Sales Estimate Invoice PDF
+# (totals_cents, (subtotal, VAT, total), is what the ledger recorded for a past
+# estimate; those issued before VAT was rounded half up printed other figures)
+@timed("render_sales_estimate")
+def render_sales_estimate(reference, customer, charge_data, date=None, customer_id=_REGISTERED, totals_cents=None):
+    charges = as_charge_vector(charge_data)
+
+    # VAT Calculation (exact cents, rounded half up)
+    subtotal = charges.subtotal_cents()
+    vat = charges.vat_cents()
+    total = subtotal + vat
+    if totals_cents:
+        subtotal, vat, total = totals_cents
+
+    pdf = SALES_ESTIMATE_TEMPLATE.render(
+        "IFS SALES ESTIMATE INVOICE",
+        [f"Customer: {customer}",
+         f"Customer ID: {_customer_id(customer, customer_id)}",
+         f"Invoice Ref: {reference}",
+         f"Date: {(date or datetime.today()).strftime('%d-%m-%Y')}"],
+        charges.charged_items(),
+        totals=[("TOTAL EXCL. VAT", subtotal / 100), (f"VAT @ {VAT_RATE_PERCENT}%", vat / 100), ("TOTAL", total / 100)],
+    )
+    return _issued_pdf_bytes(pdf, date)
+
+
+# Function to render the NHS charge sheet (every line, including zeros, for comparison;
+# the sheet prints no date, so date only sets the PDF's creation date)
+@timed("render_nhs_charge_sheet")
+def render_nhs_charge_sheet(reference, customer, nhs_charge_data, date=None):
+    pdf = NHS_CHARGE_SHEET_TEMPLATE.render(
+        f"NHS Charge Sheet - {reference}",
+        [f"Customer: {customer}"],
+        as_charge_vector(nhs_charge_data).items(),
+    )
+    return _issued_pdf_bytes(pdf, date)
+
+
+# Persistence is a separate step so downloads and previews can be served from memory
+def save_document(pdf_data, path):
+    """Atomically writes rendered PDF bytes to path and returns the path."""
+    atomic_write(path, pdf_data)
+    return path
+
+
+def document_on_disk(pdf_data, path):
+    """
+    True if path already holds exactly pdf_data. A cache hit alone doesn't
+    mean that: the file may be another render saved for the same reference
+    (e.g. for a different customer) since this one was cached.
+    """
+    try:
+        if os.path.getsize(path) != len(pdf_data):
+            return False
+        with open(path, "rb") as file:
+            return file.read() == pdf_data
+    except FileNotFoundError:
+        return False
+
+
+def save_document_in_background(pdf_data, path):
+    """Queues save_document on a background thread and returns its Future."""
+    return _save_executor.submit(save_document, pdf_data, path)
+
+
+# Render, record in the charge ledger and save in one step (used by batch rendering and scripts;
+# ledger defaults to data/ledger.db, benchmarks and tests pass a scratch one; mode and route are
+# the ones the reference was allocated for, if known)
+def generate_charge_sheet(reference, customer, charge_data, output_dir=CHARGE_SHEETS_FOLDER, ledger=None,
+                          mode=None, route=None):
+    pdf_data = render_charge_sheet(reference, customer, charge_data)
+    (ledger or get_ledger()).record("charge_sheet", reference, customer, charge_data, mode=mode, route=route)
+    return save_document(pdf_data, charge_sheet_output_path(reference, output_dir))
+
+
+def generate_sales_estimate(reference, customer, charge_data, output_dir=INVOICES_FOLDER, ledger=None,
+                            mode=None, route=None):
+    pdf_data = render_sales_estimate(reference, customer, charge_data)
+    (ledger or get_ledger()).record("sales_estimate", reference, customer, charge_data, mode=mode, route=route)
+    return save_document(pdf_data, sales_estimate_output_path(reference, output_dir))
+
+
+def generate_nhs_charge_sheet(reference, customer, nhs_charge_data, output_dir=CHARGE_SHEETS_FOLDER, ledger=None,
+                              mode=None, route=None):
+    pdf_data = render_nhs_charge_sheet(reference, customer, nhs_charge_data)
+    (ledger or get_ledger()).record("nhs_charge_sheet", reference, customer, nhs_charge_data, mode=mode, route=route)
+    return save_document(pdf_data, nhs_charge_sheet_output_path(reference, output_dir))
@@ -1,13 +1,17 @@
+import time
 import datetime
-import psycopg2
-
-DB_CONFIG = {
-    "dbname": "logistics_db",
-    "user": "postgres",
-    "password": "admin",
-    "host": "localhost",
-    "port": "5432",
-}
+import threading
+from contextlib import contextmanager
+
+from metrics import observe, timed
+from settings import DB_CONFIG
+
+# Connection pool bounds (shared by every caller in the process)
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 10
+
+# How long a caller waits for a pooled connection when all of them are in use
+POOL_WAIT_SECONDS = 30
 
 # Mapping modes to codes
 MODE_CODES = {
@@ -18,26 +22,119 @@ MODE_CODES = {
     "Export": "KE"
 }
 
-def generate_file_reference(mode, route):
-    """Generates a structured file reference."""
-    today = datetime.datetime.today().strftime("%m/%y")  # Example: "02/25"
+_pool = None
+_pool_lock = threading.Lock()
+
+# One slot per pooled connection: ThreadedConnectionPool.getconn() raises
+# PoolError when every connection is borrowed, so callers queue here instead
+_pool_slots = threading.BoundedSemaphore(POOL_MAX_CONNECTIONS)
+
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # psycopg2 is imported here, on first use, so importing this module doesn't require it
+                from psycopg2.pool import ThreadedConnectionPool
+                _pool = ThreadedConnectionPool(POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS, **DB_CONFIG)
+    return _pool
+
+
+def close_pool():
+    """Closes every pooled connection; the next get_pool() call opens a fresh pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def db_cursor():
+    """
+    Borrows a pooled connection and runs the block in one transaction,
+    waiting up to POOL_WAIT_SECONDS for one to be free.
+    """
+    pool = get_pool()
+    started = time.perf_counter()
+    if not _pool_slots.acquire(timeout=POOL_WAIT_SECONDS):
+        raise TimeoutError(f"No database connection free after {POOL_WAIT_SECONDS}s")
+    try:
+        conn = pool.getconn()
+        observe("db_getconn", time.perf_counter() - started)
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    yield cur
+        finally:
+            pool.putconn(conn)
+    finally:
+        _pool_slots.release()
+
+
+def _period():
+    return datetime.datetime.today().strftime("%m/%y")  # Example: "02/25"
+
+
+def _format_reference(mode, count, period):
     mode_code = MODE_CODES.get(mode, "XX")  # Default to XX if not found
+    return f"{mode_code}{count:03}/{period}"
+
+
+def _next_reference(cur, mode, route):
+    """
+    Bumps the (mode, route, month) counter row and formats the reference.
+    The row stays locked until the surrounding transaction ends, so
+    concurrent callers for the same counter are serialised.
+    """
+    period = _period()
+    cur.execute(
+        "INSERT INTO file_reference_counters (mode, route, period, last_value) VALUES (%s, %s, %s, 1) "
+        "ON CONFLICT (mode, route, period) DO UPDATE SET last_value = file_reference_counters.last_value + 1 "
+        "RETURNING last_value",
+        (mode, route or "", period))
+    count = cur.fetchone()[0]
+
+    return _format_reference(mode, count, period)
 
-    # Connect to DB and count existing files for the mode & route
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM file_references WHERE mode=%s AND route=%s", (mode, route))
-    count = cur.fetchone()[0] + 1
-    conn.close()
 
-    # Generate file reference
-    return f"{mode_code}{count:03}/{today}"
+@timed("db_generate_file_reference")
+def generate_file_reference(mode, route):
+    """Generates a structured file reference, using up its number."""
+    with db_cursor() as cur:
+        return _next_reference(cur, mode, route)
+
+
+@timed("db_peek_file_reference")
+def peek_file_reference(mode, route):
+    """
+    The reference generate_file_reference() would return next, for previews.
+    Reads the counter without bumping it, so another caller may still take
+    the number first.
+    """
+    period = _period()
+    with db_cursor() as cur:
+        cur.execute("SELECT last_value FROM file_reference_counters WHERE mode = %s AND route = %s AND period = %s",
+                    (mode, route or "", period))
+        row = cur.fetchone()
+    return _format_reference(mode, (row[0] if row else 0) + 1, period)
 
+
+@timed("db_save_file_reference")
 def save_file_reference(mode, route, file_reference, document_path):
     """Saves file reference to the database."""
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    cur.execute("INSERT INTO file_references (mode, route, reference_id, document_path, date_created) VALUES (%s, %s, %s, %s, NOW())",
-                (mode, route, file_reference, document_path))
-    conn.commit()
-    conn.close()
+    with db_cursor() as cur:
+        cur.execute("INSERT INTO file_references (mode, route, reference_id, document_path, date_created) VALUES (%s, %s, %s, %s, NOW())",
+                    (mode, route, file_reference, document_path))
+
+
+@timed("db_create_file_reference")
+def create_file_reference(mode, route, document_path=None):
+    """Allocates the next file reference and saves it in a single transaction."""
+    with db_cursor() as cur:
+        file_reference = _next_reference(cur, mode, route)
+        cur.execute("INSERT INTO file_references (mode, route, reference_id, document_path, date_created) VALUES (%s, %s, %s, %s, NOW())",
+                    (mode, route, file_reference, document_path))
+    return file_reference
@@ -0,0 +1,135 @@
+"""
+Thumbnails and recompressed viewing copies of uploaded photos.
+
+After an image lands in uploads/<reference>/, a background worker writes
+
+    uploads/<reference>/.variants/<name>.thumb.jpg   (fits THUMBNAIL_SIZE)
+    uploads/<reference>/.variants/<name>.view.jpg    (fits VIEW_SIZE)
+
+so the document browser can show a reference's photos without loading
+the full-resolution originals. Originals are only ever read. The hidden
+folder keeps variants out of quotas, the catalog and the blob store.
+
+Needs Pillow; without it no variants are made and callers fall back to
+the original file. Backfill an existing uploads/ tree with:
+
+    python image_variants.py --all
+"""
+import io
+import os
+import sys
+import argparse
+import mimetypes
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from running_numbers import atomic_write
+from blob_store import UPLOAD_FOLDER, iter_documents
+
+VARIANTS_FOLDER = ".variants"
+
+# Bounding boxes (pixels) and JPEG quality per variant
+VARIANTS = {
+    "thumb": ((320, 320), 70),
+    "view": ((1600, 1600), 82),
+}
+
+# Image types Pillow is asked to read
+IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp", "image/bmp", "image/tiff")
+
+# Decoding and resizing release the GIL, so a few threads keep several cores busy
+_variant_executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="image_variants")
+
+
+@lru_cache(maxsize=None)
+def _pillow():
+    """(Image, ImageOps) from Pillow, or (None, None) without it: variants are optional. Imported on first use."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None, None
+    return Image, ImageOps
+
+
+def is_image(path):
+    return mimetypes.guess_type(path)[0] in IMAGE_TYPES
+
+
+def variant_path(path, kind):
+    folder, name = os.path.split(path)
+    return os.path.join(folder, VARIANTS_FOLDER, f"{name}.{kind}.jpg")
+
+
+def _is_current(path, variant):
+    return os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(path)
+
+
+def make_variants(path, force=False):
+    """
+    Writes the missing or out-of-date variants of an image and returns
+    {kind: variant path}. Returns {} for non-images or without Pillow.
+    """
+    Image, ImageOps = _pillow()
+    if Image is None or not is_image(path):
+        return {}
+
+    targets = {kind: variant_path(path, kind) for kind in VARIANTS}
+    stale = [kind for kind, variant in targets.items() if force or not _is_current(path, variant)]
+    if not stale:
+        return targets
+
+    largest = max(VARIANTS[kind][0] for kind in stale)
+    with Image.open(path) as original:
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale, which is most of the cost for phone photos
+        original.draft("RGB", largest)
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    for kind in sorted(stale, key=lambda kind: VARIANTS[kind][0], reverse=True):
+        size, quality = VARIANTS[kind]
+        image.thumbnail(size, Image.LANCZOS)  # in place; largest first so each step shrinks the last
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+        atomic_write(targets[kind], buffer.getvalue())
+    return targets
+
+
+def make_variants_in_background(path):
+    """Queues make_variants on the worker pool and returns its Future (None if there's nothing to do)."""
+    if _pillow()[0] is None or not is_image(path):
+        return None
+    return _variant_executor.submit(make_variants, path)
+
+
+def preview_path(path, kind="thumb"):
+    """The variant to show for a stored document, or the original if there isn't one (yet)."""
+    variant = variant_path(path, kind)
+    return variant if _is_current(path, variant) else path
+
+
+def backfill(upload_folder=UPLOAD_FOLDER, force=False):
+    """Makes variants for every image under upload_folder; returns the number processed."""
+    images = [path for path in iter_documents(upload_folder) if is_image(path)]
+    for future in [_variant_executor.submit(make_variants, path, force) for path in images]:
+        future.result()
+    return len(images)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Make thumbnails and viewing copies of uploaded photos.")
+    parser.add_argument("--uploads", default=UPLOAD_FOLDER)
+    parser.add_argument("--all", action="store_true", help="Backfill every image under --uploads")
+    parser.add_argument("--force", action="store_true", help="Rebuild variants that are already up to date")
+    args = parser.parse_args(argv)
+
+    if _pillow()[0] is None:
+        print("Pillow is not installed; no variants can be made.")
+        return 1
+    if not args.all:
+        parser.print_help()
+        return 0
+    print(f"Processed {backfill(args.uploads, args.force)} images.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
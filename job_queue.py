@@ -0,0 +1,252 @@
+"""
+Persistent SQLite job queue for work that shouldn't block a Streamlit rerun.
+
+Jobs are rows in data/jobs.db with a kind, a JSON payload and a status
+(queued, running, done, failed). Worker threads in the app process, or a
+separate `python job_queue.py` process, claim the oldest ready job, run the
+handler registered for its kind and record the result. A failed attempt
+is retried with exponential backoff up to max_attempts; a job whose worker
+died is picked up again once its lease runs out. The UI polls job status
+by id.
+
+Handlers take the payload as keyword arguments:
+
+    @job_handler("make_variants")
+    def make_variants_job(path):
+        ...
+
+    queue.enqueue("make_variants", {"path": path})
+
+    python job_queue.py --workers 4
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from collections import namedtuple
+
+from metrics import timed
+
+JOBS_DB = os.path.join("data", "jobs.db")
+
+# Attempts per job before it is marked failed, and the delay before the
+# first retry (doubled after each further failure)
+MAX_ATTEMPTS = 5
+RETRY_DELAY_SECONDS = 2
+
+# A running job whose worker hasn't finished it within this time is handed out again
+LEASE_SECONDS = 300
+
+# How often idle workers look for new jobs (enqueues in the same process wake them at once)
+POLL_INTERVAL_SECONDS = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           INTEGER PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    payload      TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'queued',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after    REAL NOT NULL,
+    locked_until REAL,
+    last_error   TEXT,
+    result       TEXT,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after);
+"""
+
+Job = namedtuple("Job", ["id", "kind", "payload", "status", "attempts", "max_attempts",
+                         "last_error", "result", "created_at", "updated_at"])
+
+# Handlers by job kind
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """Registers the decorated function as the handler for jobs of this kind."""
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+class JobQueue:
+    """
+    Queue backed by one SQLite file; safe to share between threads (each
+    gets its own connection) and between processes (claims are a single
+    atomic UPDATE).
+    """
+
+    def __init__(self, db_path=JOBS_DB, poll_interval=POLL_INTERVAL_SECONDS):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._workers = []
+        self._workers_lock = threading.Lock()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, payload, max_attempts=MAX_ATTEMPTS, delay=0):
+        """Adds a job and returns its id."""
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO jobs (kind, payload, max_attempts, run_after, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, json.dumps(payload), max_attempts, now + delay, now, now))
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def claim(self):
+        """Marks the next ready job running and returns (id, kind, payload, attempts, max_attempts), or None."""
+        now = time.time()
+        row = self._connection().execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ?, updated_at = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+            "            OR (status = 'running' AND locked_until < ?) ORDER BY run_after, id LIMIT 1) "
+            "RETURNING id, kind, payload, attempts, max_attempts",
+            (now + LEASE_SECONDS, now, now, now)).fetchone()
+        if row is None:
+            return None
+        job_id, kind, payload, attempts, max_attempts = row
+        return job_id, kind, json.loads(payload), attempts, max_attempts
+
+    def complete(self, job_id, result=None):
+        self._connection().execute(
+            "UPDATE jobs SET status = 'done', result = ?, last_error = NULL, locked_until = NULL, updated_at = ? WHERE id = ?",
+            (json.dumps(result), time.time(), job_id))
+
+    def fail(self, job_id, error, attempts, max_attempts):
+        """Schedules a retry with backoff, or marks the job failed once its attempts are used up."""
+        now = time.time()
+        if attempts >= max_attempts:
+            self._connection().execute(
+                "UPDATE jobs SET status = 'failed', last_error = ?, locked_until = NULL, updated_at = ? WHERE id = ?",
+                (error, now, job_id))
+        else:
+            self._connection().execute(
+                "UPDATE jobs SET status = 'queued', last_error = ?, run_after = ?, locked_until = NULL, updated_at = ? WHERE id = ?",
+                (error, now + RETRY_DELAY_SECONDS * 2 ** (attempts - 1), now, job_id))
+
+    def run_one(self):
+        """Claims and runs one job; returns False if none was ready."""
+        claimed = self.claim()
+        if claimed is None:
+            return False
+        job_id, kind, payload, attempts, max_attempts = claimed
+        handler = HANDLERS.get(kind)
+        if handler is None:
+            self.fail(job_id, f"No handler for job kind {kind!r}", max_attempts, max_attempts)
+            return True
+        try:
+            with timed(f"job_{kind}"):
+                result = handler(**payload)
+        except Exception as e:
+            self.fail(job_id, f"{type(e).__name__}: {e}", attempts, max_attempts)
+        else:
+            self.complete(job_id, result)
+        return True
+
+    def _work(self):
+        while not self._stop.is_set():
+            if not self.run_one():
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def start_workers(self, count=2):
+        """Starts count daemon worker threads (once per queue; later calls are no-ops)."""
+        with self._workers_lock:
+            if self._workers:
+                return
+            self._stop.clear()
+            for i in range(count):
+                worker = threading.Thread(target=self._work, name=f"job_worker_{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def stop_workers(self, timeout=None):
+        with self._workers_lock:
+            self._stop.set()
+            self._wakeup.set()
+            for worker in self._workers:
+                worker.join(timeout)
+            self._workers = []
+
+    def get(self, job_id):
+        """The Job with this id, or None."""
+        jobs = self.jobs([job_id])
+        return jobs[0] if jobs else None
+
+    def jobs(self, job_ids):
+        """Jobs for the given ids, in the order given (unknown ids are skipped)."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return []
+        rows = self._connection().execute(
+            f"SELECT id, kind, payload, status, attempts, max_attempts, last_error, result, created_at, updated_at "
+            f"FROM jobs WHERE id IN ({', '.join('?' * len(job_ids))})", job_ids).fetchall()
+        by_id = {row[0]: Job(row[0], row[1], json.loads(row[2]), *row[3:7],
+                             None if row[7] is None else json.loads(row[7]), *row[8:]) for row in rows}
+        return [by_id[job_id] for job_id in job_ids if job_id in by_id]
+
+    def counts(self):
+        """{status: number of jobs}."""
+        return dict(self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def retry(self, job_id):
+        """Puts a failed job back on the queue with a fresh set of attempts."""
+        self._connection().execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, run_after = ?, updated_at = ? WHERE id = ? AND status = 'failed'",
+            (time.time(), time.time(), job_id))
+        self._wakeup.set()
+
+    def purge(self, older_than_seconds=7 * 24 * 3600):
+        """Deletes finished jobs last updated before the cut-off; returns how many."""
+        return self._connection().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?", (time.time() - older_than_seconds,)).rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued background jobs.")
+    parser.add_argument("--db", default=JOBS_DB)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--drain", action="store_true", help="Exit once no job is ready instead of waiting for more")
+    args = parser.parse_args(argv)
+
+    import upload_storage  # noqa: F401  (registers the upload job handlers)
+
+    queue = JobQueue(args.db)
+    if args.drain:
+        processed = 0
+        while queue.run_one():
+            processed += 1
+        print(f"Ran {processed} jobs. {queue.counts()}")
+        return 0
+
+    queue.start_workers(args.workers)
+    print(f"{args.workers} workers running on {args.db}. Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        queue.stop_workers()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+Append-only ledger of issued charge sheets and sales estimates.
+
+Every issued document is stored as structured rows in data/ledger.db: one
+ledger_documents row (type, reference, mode, route, customer, customer
+ID, issue date, version, subtotal, VAT, total) and one ledger_lines row per charge line,
+in the order the lines appear on the document. Reissuing a reference with
+different charges appends a new version; rows are never updated or
+deleted. Any past document can be re-rendered from the ledger exactly as
+issued. Monthly rollups (rollups.py) are kept up to date in the same
+transaction.
+
+    python ledger.py --reference KA001/03/2025
+    python ledger.py --rerender 12 --out Charge_Sheet_KA001032025_v2.pdf
+"""
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from collections import namedtuple
+
+import rollups
+from charges import VAT_RATE_PERCENT, as_charge_vector, compile_schema
+from client_registry import get_client_registry
+
+LEDGER_DB = os.path.join("data", "ledger.db")
+
+# Document types recorded, and whether VAT is charged on them
+DOCUMENT_TYPES = {
+    "charge_sheet": False,
+    "sales_estimate": True,
+    "nhs_charge_sheet": False,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger_documents (
+    id               INTEGER PRIMARY KEY,
+    document_type    TEXT NOT NULL,
+    reference        TEXT NOT NULL,
+    version          INTEGER NOT NULL,
+    customer         TEXT NOT NULL,
+    customer_id      TEXT,
+    issued_at        TEXT NOT NULL,   -- ISO 8601, local time
+    month            TEXT NOT NULL,   -- YYYY-MM of issued_at
+    subtotal_cents   INTEGER NOT NULL,
+    vat_rate_percent INTEGER NOT NULL,
+    vat_cents        INTEGER NOT NULL,
+    total_cents      INTEGER NOT NULL,
+    content_hash     TEXT NOT NULL,
+    mode             TEXT NOT NULL DEFAULT '',
+    route            TEXT NOT NULL DEFAULT '',   -- Road Freight only
+    UNIQUE (reference, document_type, version)
+);
+CREATE INDEX IF NOT EXISTS ledger_documents_customer ON ledger_documents (customer, month);
+CREATE INDEX IF NOT EXISTS ledger_documents_month ON ledger_documents (month, document_type);
+
+CREATE TABLE IF NOT EXISTS ledger_lines (
+    document_id  INTEGER NOT NULL REFERENCES ledger_documents (id),
+    position     INTEGER NOT NULL,
+    field        TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    PRIMARY KEY (document_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ledger_lines_field ON ledger_lines (field, document_id);
+
+CREATE TRIGGER IF NOT EXISTS ledger_documents_no_update BEFORE UPDATE ON ledger_documents
+BEGIN SELECT RAISE(ABORT, 'the charge ledger is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS ledger_documents_no_delete BEFORE DELETE ON ledger_documents
+BEGIN SELECT RAISE(ABORT, 'the charge ledger is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS ledger_lines_no_update BEFORE UPDATE ON ledger_lines
+BEGIN SELECT RAISE(ABORT, 'the charge ledger is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS ledger_lines_no_delete BEFORE DELETE ON ledger_lines
+BEGIN SELECT RAISE(ABORT, 'the charge ledger is append-only'); END;
+"""
+
+DOCUMENT_COLUMNS = ("id", "document_type", "reference", "version", "customer", "customer_id", "issued_at",
+                    "month", "subtotal_cents", "vat_rate_percent", "vat_cents", "total_cents", "mode", "route")
+
+# Columns added since the first release, added to older databases on open
+ADDED_COLUMNS = {
+    "mode": "TEXT NOT NULL DEFAULT ''",
+    "route": "TEXT NOT NULL DEFAULT ''",
+}
+
+LedgerDocument = namedtuple("LedgerDocument", DOCUMENT_COLUMNS)
+
+
+def _content_hash(document_type, reference, customer, customer_id, issued_on, vector):
+    payload = json.dumps([document_type, reference, customer, customer_id, issued_on,
+                          list(zip(vector.schema.fields, vector.cents))], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ChargeLedger:
+    """The ledger database; each thread gets its own connection."""
+
+    def __init__(self, db_path=LEDGER_DB):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA + rollups.SCHEMA)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(ledger_documents)")}
+        for column, definition in ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE ledger_documents ADD COLUMN {column} {definition}")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def record(self, document_type, reference, customer, charge_data, issued_at=None, customer_id=None,
+               mode=None, route=None):
+        """
+        Appends an issued document and returns its LedgerDocument. If the
+        latest version for the reference and type has the same customer,
+        customer ID, charges and issue date, that version is returned instead
+        of adding a duplicate; issued again on a later day, the document
+        prints another date and gets a new version.
+        mode and route are the ones the reference was allocated for; callers
+        that don't know them get the ones its prefix implies, where only
+        one route uses the prefix.
+        """
+        if document_type not in DOCUMENT_TYPES:
+            raise ValueError(f"Unknown document type: {document_type}")
+        vector = as_charge_vector(charge_data)
+        if mode is None:
+            mode, route = rollups.mode_and_route(reference)
+        customer_id = customer_id or get_client_registry().customer_id(customer)
+        issued_at = (issued_at or datetime.now()).replace(microsecond=0)
+        content_hash = _content_hash(document_type, reference, customer, customer_id, issued_at.date().isoformat(), vector)
+        subtotal = vector.subtotal_cents()
+        vat = vector.vat_cents() if DOCUMENT_TYPES[document_type] else 0
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")  # versions are allocated one writer at a time
+        try:
+            latest = conn.execute(
+                f"SELECT {', '.join(DOCUMENT_COLUMNS)}, content_hash FROM ledger_documents "
+                "WHERE reference = ? AND document_type = ? ORDER BY version DESC LIMIT 1",
+                (reference, document_type)).fetchone()
+            if latest and latest[-1] == content_hash:
+                conn.execute("COMMIT")
+                return LedgerDocument(*latest[:-1])
+
+            document = LedgerDocument(None, document_type, reference, latest[3] + 1 if latest else 1, customer,
+                                      customer_id, issued_at.isoformat(), issued_at.strftime("%Y-%m"), subtotal,
+                                      VAT_RATE_PERCENT if DOCUMENT_TYPES[document_type] else 0, vat, subtotal + vat,
+                                      mode, route or "")
+            document_id = conn.execute(
+                f"INSERT INTO ledger_documents ({', '.join(DOCUMENT_COLUMNS[1:])}, content_hash) "
+                f"VALUES ({', '.join('?' * len(DOCUMENT_COLUMNS))})", (*document[1:], content_hash)).lastrowid
+            conn.executemany(
+                "INSERT INTO ledger_lines (document_id, position, field, amount_cents) VALUES (?, ?, ?, ?)",
+                [(document_id, position, field, cents) for position, (field, cents) in
+                 enumerate(zip(vector.schema.fields, vector.cents))])
+
+            # Monthly rollups count the latest version only
+            if latest:
+                previous = LedgerDocument(*latest[:-1])
+                rollups.apply(conn, previous, conn.execute(
+                    "SELECT field, amount_cents FROM ledger_lines WHERE document_id = ?", (previous.id,)).fetchall(), sign=-1)
+            rollups.apply(conn, document, zip(vector.schema.fields, vector.cents))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return document._replace(id=document_id)
+
+    def _documents(self, where, params):
+        rows = self._connection().execute(
+            f"SELECT {', '.join(DOCUMENT_COLUMNS)} FROM ledger_documents WHERE {where} "
+            "ORDER BY issued_at, id", params)
+        return [LedgerDocument(*row) for row in rows]
+
+    def get(self, document_id):
+        documents = self._documents("id = ?", (document_id,))
+        return documents[0] if documents else None
+
+    def versions(self, reference, document_type=None):
+        """Every issued version for a reference (optionally one document type), oldest first."""
+        if document_type:
+            return self._documents("reference = ? AND document_type = ?", (reference, document_type))
+        return self._documents("reference = ?", (reference,))
+
+    def latest(self, reference, document_type):
+        versions = self.versions(reference, document_type)
+        return versions[-1] if versions else None
+
+    def find(self, customer=None, month=None, document_type=None):
+        """Documents matching every filter given, oldest first."""
+        filters, params = [], []
+        for column, value in (("customer", customer), ("month", month), ("document_type", document_type)):
+            if value is not None:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        return self._documents(" AND ".join(filters) or "1", params)
+
+    def charges(self, document_id):
+        """The ChargeVector a document was issued with (fields in document order)."""
+        lines = self._connection().execute(
+            "SELECT field, amount_cents FROM ledger_lines WHERE document_id = ? ORDER BY position",
+            (document_id,)).fetchall()
+        schema = compile_schema([field for field, _ in lines])
+        vector = schema.vector({})
+        for slot, (_, cents) in enumerate(lines):
+            vector.cents[slot] = cents
+        return vector
+
+    def field_history(self, field, customer=None, month=None):
+        """(reference, document type, version, issued_at, amount in cents) for every issue of one charge line."""
+        sql = ("SELECT d.reference, d.document_type, d.version, d.issued_at, l.amount_cents "
+               "FROM ledger_lines l JOIN ledger_documents d ON d.id = l.document_id WHERE l.field = ?")
+        params = [field]
+        if customer is not None:
+            sql += " AND d.customer = ?"
+            params.append(customer)
+        if month is not None:
+            sql += " AND d.month = ?"
+            params.append(month)
+        return self._connection().execute(sql + " ORDER BY d.issued_at, d.id", params).fetchall()
+
+    def rerender(self, document_id):
+        """Renders a past document again, exactly as issued; returns the PDF bytes."""
+        from documents import render_charge_sheet, render_sales_estimate, render_nhs_charge_sheet
+
+        document = self.get(document_id)
+        if document is None:
+            raise KeyError(f"No ledger document {document_id}")
+        charges = self.charges(document_id)
+        issued_at = datetime.fromisoformat(document.issued_at)
+        if document.document_type == "nhs_charge_sheet":
+            return render_nhs_charge_sheet(document.reference, document.customer, charges, date=issued_at)
+        # The customer ID as printed, None if the client wasn't registered then
+        if document.document_type == "sales_estimate":
+            # The recorded figures, which older estimates rounded differently
+            return render_sales_estimate(document.reference, document.customer, charges,
+                                         date=issued_at, customer_id=document.customer_id,
+                                         totals_cents=(document.subtotal_cents, document.vat_cents, document.total_cents))
+        return render_charge_sheet(document.reference, document.customer, charges,
+                                   date=issued_at, customer_id=document.customer_id)
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    """The process-wide ChargeLedger, opened on first use."""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = ChargeLedger()
+    return _ledger
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the charge ledger or re-render an issued document.")
+    parser.add_argument("--db", default=LEDGER_DB)
+    parser.add_argument("--reference")
+    parser.add_argument("--customer")
+    parser.add_argument("--month", help="YYYY-MM")
+    parser.add_argument("--rerender", type=int, metavar="DOCUMENT_ID")
+    parser.add_argument("--out", help="Output path for --rerender")
+    args = parser.parse_args(argv)
+    ledger = ChargeLedger(args.db)
+
+    if args.rerender:
+        document = ledger.get(args.rerender)
+        if document is None:
+            print(f"No ledger document {args.rerender}")
+            return 1
+        out = args.out or f"{document.document_type}_{document.reference.replace('/', '')}_v{document.version}.pdf"
+        with open(out, "wb") as file:
+            file.write(ledger.rerender(args.rerender))
+        print(f"Wrote {out}")
+        return 0
+
+    documents = ledger.versions(args.reference) if args.reference else ledger.find(args.customer, args.month)
+    for document in documents:
+        print(f"{document.id:>6}  {document.issued_at}  {document.document_type:<17} {document.reference:<16} "
+              f"v{document.version:<3} {document.customer:<24} ${document.total_cents / 100:>12,.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
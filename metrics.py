@@ -0,0 +1,246 @@
+"""
+Process-wide operation timers and counters in Prometheus text format.
+
+The hot paths record into one registry, so a slow day can be traced to
+the JSON counter file, FPDF rendering, disk writes or Postgres:
+
+    fms_operation_seconds{operation=...}      histogram of each call
+    fms_operation_errors_total{operation=...} calls that raised
+
+Operations:
+- running_numbers_lock_wait, allocate_running_number and
+  reserve_running_numbers: the JSON counter file;
+- render_charge_sheet, render_sales_estimate and render_nhs_charge_sheet:
+  FPDF;
+- atomic_write (documents, counters) and save_upload: disk;
+- job_<kind>: queued post-upload work;
+- app_rerun: whole Streamlit reruns;
+- db_getconn and db_*: the Postgres calls in file_reference.py.
+
+Histograms keep per-bucket counts, so p50/p99 can be worked out from the
+buckets (histogram_quantile) instead of only an average. Recording costs
+about a microsecond.
+
+There are two ways to read the metrics. The HTTP service answers
+GET /metrics. start_file_dump() rewrites data/metrics.prom every
+DUMP_INTERVAL seconds, for node_exporter's textfile collector; the
+Streamlit app does this. Each process has its own registry, so processes
+that share a machine should dump to different files.
+
+    with timed("render_charge_sheet"):
+        ...
+
+    @timed("save_upload")
+    def save_upload(...):
+        ...
+
+    python metrics.py data/metrics.prom
+"""
+import os
+import sys
+import time
+import bisect
+import argparse
+import threading
+from contextlib import contextmanager
+
+METRICS_FILE = os.path.join("data", "metrics.prom")
+DUMP_INTERVAL = 15
+
+# Upper bounds in seconds: sub-millisecond counter updates up to multi-second renders and fsyncs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, plus their sum and count, per label set."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [per-bucket counts (last is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def count(self, **labels):
+        counts = self._values.get(tuple(labels[name] for name in self.labelnames))
+        return sum(counts[0]) if counts else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + [("le", _number(float(bound)))], cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """The metrics of one process, rendered in Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.setdefault(metric.name, metric)
+        if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+            raise ValueError(f"Metric {metric.name} is already registered differently")
+        return existing
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{_labels(labels)} {_number(value)}" for name, labels, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=METRICS_FILE):
+        """Atomically replaces path with the current metrics."""
+        from running_numbers import atomic_write  # running_numbers records into this module
+        atomic_write(path, self.render())
+
+
+REGISTRY = Registry()
+
+OPERATION_SECONDS = REGISTRY.histogram("fms_operation_seconds", "Time spent per call, by operation.", ["operation"])
+OPERATION_ERRORS = REGISTRY.counter("fms_operation_errors_total", "Calls that raised, by operation.", ["operation"])
+UPLOAD_BYTES = REGISTRY.counter("fms_upload_bytes_total", "Bytes stored by save_upload().")
+
+
+def observe(operation, seconds):
+    """Records one timing for operation, for code that measures it itself."""
+    OPERATION_SECONDS.observe(seconds, operation=operation)
+
+
+@contextmanager
+def timed(operation):
+    """Times the block (or, as a decorator, each call) into fms_operation_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        OPERATION_ERRORS.inc(operation=operation)
+        raise
+    finally:
+        OPERATION_SECONDS.observe(time.perf_counter() - start, operation=operation)
+
+
+_dump_thread = None
+_dump_lock = threading.Lock()
+
+
+def start_file_dump(path=METRICS_FILE, interval=DUMP_INTERVAL, registry=REGISTRY):
+    """Rewrites path every interval seconds from a daemon thread (once per process; later calls are no-ops)."""
+    global _dump_thread
+
+    def dump_forever():
+        while True:
+            time.sleep(interval)
+            try:
+                registry.dump(path)
+            except OSError:
+                pass  # e.g. the disk is full; the next interval tries again
+
+    with _dump_lock:
+        if _dump_thread is None:
+            _dump_thread = threading.Thread(target=dump_forever, name="metrics_dump", daemon=True)
+            _dump_thread.start()
+    return _dump_thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a metrics dump as per-operation call counts and latencies.")
+    parser.add_argument("path", nargs="?", default=METRICS_FILE)
+    args = parser.parse_args(argv)
+
+    operations = {}
+    with open(args.path) as file:
+        for line in file:
+            if not line.startswith("fms_operation_seconds_"):
+                continue
+            name, value = line.rsplit(" ", 1)
+            labels = dict(pair.split("=", 1) for pair in name[name.index("{") + 1:-1].split(","))
+            stats = operations.setdefault(labels["operation"].strip('"'), {"buckets": []})
+            if name.startswith("fms_operation_seconds_bucket"):
+                stats["buckets"].append((float(labels["le"].strip('"')), float(value)))
+            else:
+                stats[name[len("fms_operation_seconds_"):name.index("{")]] = float(value)
+
+    def quantile(buckets, fraction):
+        """The upper bound of the bucket holding the fraction-th observation."""
+        total = buckets[-1][1]
+        return next(bound for bound, count in buckets if count >= fraction * total)
+
+    print(f"{'operation':<28} {'calls':>8} {'mean ms':>9} {'p50 ms <=':>10} {'p99 ms <=':>10}")
+    for operation, stats in sorted(operations.items(), key=lambda item: -item[1].get("sum", 0)):
+        if not stats.get("count"):
+            continue
+        print(f"{operation:<28} {stats['count']:>8,.0f} {stats['sum'] / stats['count'] * 1000:>9.2f} "
+              f"{quantile(stats['buckets'], 0.5) * 1000:>10g} {quantile(stats['buckets'], 0.99) * 1000:>10g}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
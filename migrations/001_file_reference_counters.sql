@@ -0,0 +1,35 @@
+-- Per-(mode, route, month) counters for file_reference.generate_file_reference,
+-- replacing the COUNT(*) scan over file_references.
+
+CREATE TABLE IF NOT EXISTS file_references (
+    id SERIAL PRIMARY KEY,
+    mode TEXT NOT NULL,
+    route TEXT,
+    reference_id TEXT NOT NULL,
+    document_path TEXT,
+    date_created TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS file_reference_counters (
+    mode TEXT NOT NULL,
+    route TEXT NOT NULL DEFAULT '',
+    period CHAR(5) NOT NULL,            -- "MM/YY", matches the reference suffix
+    last_value INTEGER NOT NULL,
+    PRIMARY KEY (mode, route, period)
+);
+
+CREATE INDEX IF NOT EXISTS file_references_reference_id_idx ON file_references (reference_id);
+CREATE INDEX IF NOT EXISTS file_references_mode_route_created_idx ON file_references (mode, route, date_created);
+
+-- Seed counters with the highest number already issued in each month so new
+-- references continue from there instead of colliding with existing ones.
+INSERT INTO file_reference_counters (mode, route, period, last_value)
+SELECT mode,
+       COALESCE(route, ''),
+       to_char(date_created, 'MM/YY'),
+       MAX(substring(reference_id FROM '^[A-Z]+([0-9]+)/')::INTEGER)
+FROM file_references
+WHERE reference_id ~ '^[A-Z]+[0-9]+/'
+GROUP BY 1, 2, 3
+ON CONFLICT (mode, route, period) DO UPDATE
+    SET last_value = GREATEST(file_reference_counters.last_value, EXCLUDED.last_value);
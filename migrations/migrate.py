@@ -0,0 +1,36 @@
+"""
+Applies the SQL migrations in this directory, in filename order, to the
+database in file_reference.DB_CONFIG. Each file runs in its own transaction
+and is recorded in schema_migrations so it is only applied once.
+
+    python migrations/migrate.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_reference import db_cursor
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def apply_migrations():
+    with db_cursor() as cur:
+        cur.execute("CREATE TABLE IF NOT EXISTS schema_migrations (name TEXT PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT NOW())")
+        cur.execute("SELECT name FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not name.endswith(".sql") or name in applied:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name)) as file:
+            sql = file.read()
+        with db_cursor() as cur:
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        print(f"Applied {name}")
+
+
+if __name__ == "__main__":
+    apply_migrations()
@@ -0,0 +1,38 @@
+import streamlit as st
+import rollups
+from ledger import get_ledger
+
+# Reads only the monthly rollup tables, so the page costs the same however long the history is
+st.title("Charges Report")
+
+ledger = get_ledger()
+available_months = rollups.available_months(ledger)
+if not available_months:
+    st.info("No charge sheets or estimates have been issued yet.")
+    st.stop()
+
+selected_months = st.multiselect("Months", available_months, default=available_months[:1])
+document_type = st.selectbox("Document", ["sales_estimate", "charge_sheet", "nhs_charge_sheet"],
+                             format_func=lambda name: name.replace("_", " ").title())
+group_by = st.multiselect("Group by", ["month", "mode", "route", "customer"], default=["month", "mode"])
+
+rows = rollups.totals(ledger, group_by, selected_months, document_type=document_type)
+overall = rollups.totals(ledger, (), selected_months, document_type=document_type)[0]
+
+columns = st.columns(4)
+columns[0].metric("Documents", overall["documents"] or 0)
+columns[1].metric("Subtotal (USD)", f"{(overall['subtotal_cents'] or 0) / 100:,.2f}")
+columns[2].metric("VAT (USD)", f"{(overall['vat_cents'] or 0) / 100:,.2f}")
+columns[3].metric("Total (USD)", f"{(overall['total_cents'] or 0) / 100:,.2f}")
+
+st.subheader("Totals")
+st.dataframe([{**{column: row[column] or "-" for column in group_by},
+               "Documents": row["documents"],
+               "Subtotal (USD)": row["subtotal_cents"] / 100,
+               "VAT (USD)": row["vat_cents"] / 100,
+               "Total (USD)": row["total_cents"] / 100} for row in rows], use_container_width=True)
+
+st.subheader("Charge Lines")
+st.dataframe([{"Charge": row["field"], "Times Charged": row["lines"], "Amount (USD)": row["amount_cents"] / 100}
+              for row in rollups.line_totals(ledger, selected_months, document_type=document_type)],
+             use_container_width=True)
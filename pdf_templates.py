@@ -0,0 +1,136 @@
+# Bump whenever a template's layout changes, so cached renders are not reused
+TEMPLATE_VERSION = 4
+
+
+def pdf_bytes(pdf):
+    """Returns the finished PDF as bytes without writing it anywhere."""
+    output = pdf.output(dest="S")
+    # PyFPDF returns a latin-1 str, fpdf2 a bytearray
+    return output.encode("latin-1") if isinstance(output, str) else bytes(output)
+
+
+_FPDF_API = None
+
+
+def _fpdf_api():
+    """
+    The FPDF class and the arguments this fpdf accepts for the layout's font
+    and "move to the next line" cells, resolved once per process.
+
+    fpdf2 maps Arial to its core Helvetica and replaces ln=True with
+    new_x/new_y, warning (with a stack walk) on every call that uses the old
+    forms; passing what it resolves them to draws the same page without that
+    overhead. PyFPDF only knows the old forms.
+    """
+    global _FPDF_API
+    if _FPDF_API is None:
+        from fpdf import FPDF  # imported on first render: fpdf2 (with fontTools and numpy) adds ~400 ms to a cold start
+        try:
+            from fpdf.enums import XPos, YPos
+            _FPDF_API = (FPDF, "helvetica", {"new_x": XPos.LMARGIN, "new_y": YPos.NEXT})
+        except ImportError:
+            _FPDF_API = (FPDF, "Arial", {"ln": True})
+    return _FPDF_API
+
+
+class DocumentTemplate:
+    """
+    Layout shared by the generated PDFs: a centred title, header lines, a
+    two-column charges table, optional totals and a static footer.
+
+    What doesn't change between documents (table headings, approval block,
+    payment terms, fonts and spacing) is laid out once per template as a
+    list of drawing operations, resolved against the installed fpdf on the
+    first render. Each render() still builds a new FPDF and draws every
+    element of the page; it saves rebuilding the fixed parts and fpdf2's
+    per-call handling of legacy arguments, not the drawing itself.
+    """
+
+    def __init__(self, headings, column_widths=(120, 60), title_size=14, title_height=8, title_gap=0,
+                 body_size=10, line_height=5, row_height=6, table_gap=4, row_style="", bottom_margin=15,
+                 footer_lines=(), footer_note=None, footer_gap=6):
+        self.headings = headings
+        self.column_widths = column_widths
+        self.title_size = title_size
+        self.title_height = title_height
+        self.title_gap = title_gap
+        self.body_size = body_size
+        self.line_height = line_height
+        self.row_height = row_height
+        self.table_gap = table_gap
+        self.row_style = row_style
+        self.bottom_margin = bottom_margin
+        self.footer_lines = footer_lines
+        self.footer_note = footer_note
+        self.footer_gap = footer_gap
+        self._prepared = None
+
+    def _prepare(self):
+        """Lays out the fixed parts for the installed fpdf; returns (FPDF, font, next-line kwargs, ops)."""
+        if self._prepared is None:
+            FPDF, font, next_line = _fpdf_api()
+            label_width, amount_width = self.column_widths
+
+            table_header_ops = [("ln", (self.table_gap,), {})] if self.table_gap else []
+            table_header_ops += [
+                ("set_font", (font, "B", self.body_size), {}),
+                ("cell", (label_width, self.row_height, self.headings[0]), {"border": 1}),
+                ("cell", (amount_width, self.row_height, self.headings[1]), {"border": 1, **next_line}),
+                ("set_font", (font, self.row_style, self.body_size), {}),
+            ]
+
+            footer_ops = []
+            if self.footer_lines or self.footer_note:
+                footer_ops += [("ln", (self.footer_gap,), {}), ("set_font", (font, "", self.body_size), {})]
+            for line in self.footer_lines:
+                footer_ops.append(("cell", (100, self.line_height, line), dict(next_line)))
+            if self.footer_note:
+                footer_ops.append(("multi_cell", (0, self.row_height, self.footer_note), {"border": 0}))
+
+            self._prepared = (FPDF, font, next_line, table_header_ops, footer_ops)
+        return self._prepared
+
+    @staticmethod
+    def _replay(pdf, ops):
+        for name, args, kwargs in ops:
+            getattr(pdf, name)(*args, **kwargs)
+
+    def _row(self, pdf, label, amount, next_line):
+        label_width, amount_width = self.column_widths
+        pdf.cell(label_width, self.row_height, label, border=1)
+        pdf.cell(amount_width, self.row_height, f"${amount:.2f}", border=1, **next_line)
+
+    def render(self, title, header_lines, rows, totals=()):
+        """
+        Draws one document and returns the FPDF object.
+        rows and totals are sequences of (label, amount) pairs.
+        """
+        FPDF, font, next_line, table_header_ops, footer_ops = self._prepare()
+        pdf = FPDF()
+        pdf.set_auto_page_break(auto=True, margin=self.bottom_margin)
+        pdf.add_page()
+
+        # Header
+        pdf.set_font(font, "B", self.title_size)
+        pdf.cell(200, self.title_height, title, align="C", **next_line)
+        if self.title_gap:
+            pdf.ln(self.title_gap)
+
+        pdf.set_font(font, "", self.body_size)
+        for line in header_lines:
+            pdf.cell(100, self.line_height, line, **next_line)
+
+        # Table
+        self._replay(pdf, table_header_ops)
+        for label, amount in rows:
+            self._row(pdf, label, amount, next_line)
+
+        # Totals
+        if totals:
+            pdf.ln(4)
+            pdf.set_font(font, "B", self.body_size)
+            for label, amount in totals:
+                self._row(pdf, label, amount, next_line)
+
+        self._replay(pdf, footer_ops)
+        return pdf
@@ -0,0 +1,58 @@
+import os
+import copy
+import json
+
+# Optional overrides, e.g. {"registered_clients": {...}}; keys not present keep their defaults
+REFERENCE_DATA_FILE = os.path.join("data", "reference_data.json")
+
+DEFAULT_REFERENCE_DATA = {
+    # Modes for selection, with their file reference prefixes
+    "modes": {
+        "Air Freight": "AA",
+        "Road Freight": "",
+        "Sea Freight": "SA",
+        "Bond": "KB",
+        "Export": "KE",
+        "Transit": "SE"
+    },
+    # Road Freight routes with specific prefixes
+    "road_freight_routes": {
+        "Beitbridge": "KA",
+        "Mutare": "KX",
+        "Plumtree": "KAA",
+        "Chirundu": "KAA"
+    },
+    # Sample registered clients
+    "registered_clients": {
+        "ABC Logistics": "TSLC0001",
+        "XYZ Traders": "TSLC0002",
+        "Global Cargo Ltd": "TSLC0003"
+    },
+    # NHS charge sheet lines
+    "charge_fields": [
+        "Disbursement Fees", "Professional Handlers", "Agency", "Documentation Fee", "Storage (DHL)",
+        "Border Agent Handling Fee", "Handling", "Airway Bill Fee", "Release Fee (DHL)", "GMS Charges",
+        "ZIMRA Submission Fee", "ZIMRA Duty", "ZIMRA VAT", "Physical Inspection", "Special Attendance",
+        "Presumptive Tax", "RIB Entry", "Warehouse Entry", "Consumption Entry", "Export Permits",
+        "Phytosanitary Certificate", "CSA/SADC Certificate of Origin", "Port Health and EMA Inspection Fee",
+        "AMA Certificate", "Courier (FedEx/DHL)", "Cargo Carriers",
+        "PE Charges at Port of Entry", "Other"
+    ],
+}
+
+# Client name -> Customer ID lookup used on generated documents.
+# Updated in place by load_reference_data() so importers see reloads.
+registered_clients = dict(DEFAULT_REFERENCE_DATA["registered_clients"])
+
+
+def load_reference_data(path=REFERENCE_DATA_FILE):
+    """Returns the reference tables, applying any overrides from path."""
+    data = copy.deepcopy(DEFAULT_REFERENCE_DATA)
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            overrides = json.load(file)
+        data.update({key: value for key, value in overrides.items() if key in data})
+
+    registered_clients.clear()
+    registered_clients.update(data["registered_clients"])
+    return data
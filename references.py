@@ -0,0 +1,42 @@
+"""
+File reference allocation shared by the Streamlit app and the HTTP service.
+
+A reference is "<prefix><running number>/<MM/YYYY>", e.g. KA001/03/2025:
+the prefix comes from the mode (or, for Road Freight, the route) in the
+reference data, and the running number is allocated from
+data/running_numbers.json under a file lock, restarting each month.
+"""
+import os
+from datetime import datetime
+
+from running_numbers import allocate_running_number, reserve_running_numbers
+from reference_data import load_reference_data
+
+DATA_FILE = os.path.join("data", "running_numbers.json")
+
+
+def reference_prefix(mode, route=None, reference_data=None):
+    """The file reference prefix for a mode and (Road Freight) route."""
+    reference_data = reference_data or load_reference_data()
+    modes, routes = reference_data["modes"], reference_data["road_freight_routes"]
+    if mode not in modes:
+        raise ValueError(f"Unknown mode: {mode}")
+    if route is not None and route not in routes:
+        raise ValueError(f"Unknown route: {route}")
+    return routes.get(route, modes[mode])
+
+
+def get_next_file_reference(mode, route=None, reference_data=None, data_file=DATA_FILE, today=None):
+    """Allocates the next file reference for mode (and route) this month."""
+    month_year = (today or datetime.today()).strftime("%m/%Y")
+    prefix = reference_prefix(mode, route, reference_data)
+    number = allocate_running_number(f"{prefix}/{month_year}", data_file)
+    return f"{prefix}{str(number).zfill(3)}/{month_year}"
+
+
+def reserve_file_references(mode, route=None, count=1, reference_data=None, data_file=DATA_FILE, today=None):
+    """Allocates count consecutive file references in one locked write."""
+    month_year = (today or datetime.today()).strftime("%m/%Y")
+    prefix = reference_prefix(mode, route, reference_data)
+    numbers = reserve_running_numbers(f"{prefix}/{month_year}", count, data_file)
+    return [f"{prefix}{str(number).zfill(3)}/{month_year}" for number in numbers]
@@ -0,0 +1,286 @@
+import io
+import os
+import sys
+import hmac
+import time
+import zlib
+import pstats
+import cProfile
+import threading
+from html import escape
+from datetime import datetime
+from contextlib import nullcontext
+from collections import Counter, deque
+
+# Where captures are written, how often the sampler takes a stack and how many functions the summary lists
+PROFILE_DIR = os.path.join("data", "profiles")
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 40
+
+# ?profile=...&token=... arms a session; $APP_PROFILE arms every session; $PROFILE_TOKEN guards the query parameter
+PROFILE_PARAM = "profile"
+PROFILE_ENV = "APP_PROFILE"
+PROFILE_TOKEN_ENV = "PROFILE_TOKEN"
+
+# One capture at a time per process: cProfile captures can't overlap in one thread, and from
+# Python 3.12 only one profiler may be active at all
+_capture_lock = threading.Lock()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list of numbers."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class RerunProfiler:
+    """
+    Lap timer for Streamlit reruns. Call start() at the top of the script,
+    lap("section") after each section and finish() at the end; the last
+    max_reruns reruns are kept for p50/p95 per section.
+    """
+
+    def __init__(self, max_reruns=200):
+        self.history = deque(maxlen=max_reruns)
+        self._current = None
+        self._started = self._last = 0.0
+
+    def start(self):
+        self._current = {}
+        self._started = self._last = time.perf_counter()
+
+    def lap(self, section):
+        now = time.perf_counter()
+        self._current[section] = self._current.get(section, 0.0) + now - self._last
+        self._last = now
+
+    def finish(self):
+        self._current["total"] = time.perf_counter() - self._started
+        self.history.append(self._current)
+        return self._current
+
+    def summary(self):
+        """Returns one row per section: name, reruns, last, p50 and p95 in milliseconds."""
+        sections = {}
+        for rerun in self.history:
+            for section, seconds in rerun.items():
+                sections.setdefault(section, []).append(seconds)
+
+        last = self.history[-1] if self.history else {}
+        return [{
+            "section": section,
+            "reruns": len(samples),
+            "last_ms": round(last.get(section, 0.0) * 1000, 2),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        } for section, samples in sections.items()]
+
+    def summary_markdown(self):
+        """summary() as a markdown table (st.table would import pandas, ~400 ms, on a process's first render)."""
+        rows = self.summary()
+        if not rows:
+            return ""
+        lines = ["| " + " | ".join(rows[0]) + " |", "|" + " --- |" * len(rows[0])]
+        lines += ["| " + " | ".join(str(value) for value in row.values()) + " |" for row in rows]
+        return "\n".join(lines)
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def flame_graph_svg(stacks, title="", width=1200, row_height=16):
+    """A self-contained SVG flame graph (root at the bottom) of {"root;...;leaf": samples}."""
+    root = [0, {}]  # samples, children by name
+    for stack, count in stacks.items():
+        node = root
+        node[0] += count
+        for name in stack.split(";"):
+            node = node[1].setdefault(name, [0, {}])
+            node[0] += count
+    depth = max((stack.count(";") + 1 for stack in stacks), default=0)
+    height = (depth + 2) * row_height
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+             f'<text x="4" y="12">{escape(title)} ({root[0]} samples)</text>']
+
+    def draw(node, x, level):
+        for name, child in sorted(node[1].items()):
+            w = child[0] / root[0] * width
+            if w >= 0.5:  # narrower frames can't be seen anyway
+                y = height - (level + 1) * row_height
+                label = name if len(name) * 7 < w - 4 else name[:max(0, int((w - 4) / 7) - 2)] + ".."
+                parts.append(f'<g><title>{escape(name)}: {child[0]} samples ({child[0] / root[0]:.1%})</title>'
+                             f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+                             f'fill="hsl({zlib.crc32(name.encode()) % 50 + 5},85%,{55 + zlib.crc32(name.encode()) % 15}%)"/>'
+                             + (f'<text x="{x + 2:.1f}" y="{y + row_height - 4}">{escape(label)}</text>' if len(label) > 2 else "")
+                             + "</g>")
+                draw(child, x, level + 1)
+            x += w
+
+    if root[0]:
+        draw(root, 0.0, 0)
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+class Capture:
+    """
+    Profiles the calling thread between start() and stop() (or as a with
+    block): cProfile counts every call, and a sampler thread records the
+    thread's stack every SAMPLE_INTERVAL seconds. stop() writes, under
+    profile_dir, <timestamp>_<label> with these extensions:
+        .pstats   cProfile stats (python -m pstats, snakeviz)
+        .txt      the top functions by cumulative and by own time
+        .folded   collapsed stacks, "root;...;leaf samples" per line
+                  (flamegraph.pl, speedscope, inferno)
+        .svg      a flame graph of the samples
+    The samples include cProfile's own overhead, which inflates
+    call-heavy Python code more than C calls and I/O waits.
+
+    One capture runs at a time per process. start() returns False, and
+    the capture does nothing, while another is running.
+    """
+
+    def __init__(self, label, profile_dir=PROFILE_DIR, interval=SAMPLE_INTERVAL, top=TOP_FUNCTIONS, on_stop=None):
+        self.label = label
+        self.profile_dir = profile_dir
+        self.interval = interval
+        self.top = top
+        self.on_stop = on_stop
+        self.active = False
+        self.paths = []
+
+    def start(self, root=None):
+        """Starts profiling; sampled stacks are cut at root (default: the caller's frame)."""
+        if not _capture_lock.acquire(blocking=False):
+            return False
+        self.active = True
+        self._root = root or sys._getframe(1)
+        self._thread_id = threading.get_ident()
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profile_sampler", daemon=True)
+        self._sampler.start()
+        self._started = time.perf_counter()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return True
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                return  # the profiled thread has ended
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                if frame is self._root:
+                    break
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        """Stops profiling, writes the files and returns their paths."""
+        if not self.active:
+            return self.paths
+        self._profile.disable()
+        elapsed = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+        self.active = False
+        try:
+            self.paths = self._write(elapsed)
+        finally:
+            _capture_lock.release()
+        if self.on_stop is not None:
+            self.on_stop(self.paths)
+        return self.paths
+
+    def _write(self, elapsed):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{self.label}")
+        title = f"{self.label}: {elapsed * 1000:,.0f} ms"
+
+        self._profile.dump_stats(f"{base}.pstats")
+        summary = io.StringIO()
+        summary.write(f"{title}\n\n")
+        stats = pstats.Stats(self._profile, stream=summary)
+        stats.sort_stats("cumulative").print_stats(self.top)
+        stats.sort_stats("tottime").print_stats(self.top)
+        with open(f"{base}.txt", "w") as file:
+            file.write(summary.getvalue())
+        with open(f"{base}.folded", "w") as file:
+            file.writelines(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+        with open(f"{base}.svg", "w") as file:
+            file.write(flame_graph_svg(self._stacks, title))
+        return [f"{base}.{extension}" for extension in ("svg", "folded", "txt", "pstats")]
+
+    def __enter__(self):
+        self.start(root=sys._getframe(1))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+class ProfileSwitch:
+    """
+    Admin toggle that profiles one session's next reruns or button actions
+    (see Capture), with no restart or code change. The query parameter
+    "?profile=3&token=..." profiles the next 3 reruns. "?profile=charge_sheet"
+    profiles the next run of that action, and "?profile=2,charge_sheet"
+    does both. The token must match $PROFILE_TOKEN; without PROFILE_TOKEN
+    the query parameter is ignored. $APP_PROFILE takes the same values and
+    arms every new session (e.g. on a staging server).
+
+    An action that runs inside a profiled rerun is already in that
+    rerun's profile, so it gets no capture of its own.
+    """
+
+    def __init__(self, environ=os.environ):
+        self.reruns = 0
+        self.actions = Counter()
+        self.captures = deque(maxlen=20)  # file paths of this session's recent captures
+        self._token = environ.get(PROFILE_TOKEN_ENV)
+        self._rerun = None
+        self._arm(environ.get(PROFILE_ENV))
+
+    def _arm(self, value):
+        for item in (value or "").split(","):
+            item = item.strip()
+            if item.isdigit():
+                self.reruns += int(item)
+            elif item:
+                self.actions[item] += 1
+
+    def arm_from_query(self, query_params):
+        """Arms from ?profile=...&token=...; True if it did (the caller should then drop the parameters)."""
+        value = query_params.get(PROFILE_PARAM)
+        if value is None or not self._token or not hmac.compare_digest(query_params.get("token", ""), self._token):
+            return False
+        self._arm(value)
+        return True
+
+    def start_rerun(self):
+        """Call at the top of the script: profiles this rerun if one is armed."""
+        self.finish_rerun()  # left running by st.rerun(), st.stop() or an exception
+        if self.reruns > 0:
+            capture = Capture("rerun", on_stop=self.captures.append)
+            if capture.start(root=sys._getframe(1)):
+                self.reruns -= 1
+                self._rerun = capture
+
+    def finish_rerun(self):
+        """Call at the end of the script."""
+        if self._rerun is not None:
+            self._rerun, capture = None, self._rerun
+            capture.stop()
+
+    def action(self, name):
+        """A with-block context that profiles this run of action name if it is armed."""
+        if self.actions[name] > 0 and self._rerun is None:
+            self.actions[name] -= 1
+            return Capture(name, on_stop=self.captures.append)
+        return nullcontext()
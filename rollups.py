@@ -0,0 +1,192 @@
+"""
+Monthly rollups of issued charges by mode, route and customer.
+
+Two summary tables live alongside the charge ledger (data/ledger.db):
+
+    rollup_totals  month x document type x mode x route x customer:
+                   documents, subtotal, VAT and total (cents)
+    rollup_lines   the same keys x charge line: lines charged and amount
+
+ChargeLedger.record() updates them in the same transaction that appends a
+document. Only the latest version of each document counts, so a reissue
+moves the old version's amounts out and the new ones in. Reports read
+only these tables, so they cost the same however long the history is.
+Rebuild them from the ledger (e.g. after a backfill) with:
+
+    python rollups.py --rebuild
+"""
+import re
+import sys
+import argparse
+
+from document_catalog import PREFIX_MODES
+from reference_data import DEFAULT_REFERENCE_DATA
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_totals (
+    month          TEXT NOT NULL,
+    document_type  TEXT NOT NULL,
+    mode           TEXT NOT NULL,
+    route          TEXT NOT NULL,
+    customer       TEXT NOT NULL,
+    documents      INTEGER NOT NULL,
+    subtotal_cents INTEGER NOT NULL,
+    vat_cents      INTEGER NOT NULL,
+    total_cents    INTEGER NOT NULL,
+    PRIMARY KEY (month, document_type, mode, route, customer)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_lines (
+    month         TEXT NOT NULL,
+    document_type TEXT NOT NULL,
+    mode          TEXT NOT NULL,
+    route         TEXT NOT NULL,
+    customer      TEXT NOT NULL,
+    field         TEXT NOT NULL,
+    lines         INTEGER NOT NULL,
+    amount_cents  INTEGER NOT NULL,
+    PRIMARY KEY (month, document_type, mode, route, customer, field)
+) WITHOUT ROWID;
+"""
+
+DIMENSIONS = ("month", "document_type", "mode", "route", "customer")
+
+
+def _route_prefixes():
+    routes = {}
+    for route, prefix in DEFAULT_REFERENCE_DATA["road_freight_routes"].items():
+        routes.setdefault(prefix, []).append(route)
+    return {prefix: names[0] for prefix, names in routes.items() if len(names) == 1}
+
+
+# Route for a file reference prefix, where only one route uses it (Plumtree and Chirundu share KAA)
+ROUTE_PREFIXES = _route_prefixes()
+
+_PREFIX = re.compile(r"^([A-Z]+)\d")
+
+
+def mode_and_route(reference):
+    """
+    (mode, route) implied by a file reference's prefix; "" where unknown.
+    Only for documents recorded without them: the ledger stores the mode and
+    route each reference was allocated for.
+    """
+    match = _PREFIX.match(reference)
+    prefix = match.group(1) if match else ""
+    return PREFIX_MODES.get(prefix, ""), ROUTE_PREFIXES.get(prefix, "")
+
+
+def _keys(document):
+    # Rows recorded before the ledger stored mode and route have mode ""
+    mode, route = (document.mode, document.route) if document.mode else mode_and_route(document.reference)
+    return document.month, document.document_type, mode, route, document.customer
+
+
+def apply(conn, document, lines, sign=1):
+    """
+    Adds (sign=1) or removes (sign=-1) one ledger document and its
+    [(field, cents)] lines from the rollups. Only positive amounts count,
+    as on the documents.
+    """
+    keys = _keys(document)
+    conn.execute(
+        "INSERT INTO rollup_totals (month, document_type, mode, route, customer, documents, subtotal_cents, vat_cents, total_cents) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (month, document_type, mode, route, customer) DO UPDATE SET "
+        "documents = documents + excluded.documents, subtotal_cents = subtotal_cents + excluded.subtotal_cents, "
+        "vat_cents = vat_cents + excluded.vat_cents, total_cents = total_cents + excluded.total_cents",
+        (*keys, sign, sign * document.subtotal_cents, sign * document.vat_cents, sign * document.total_cents))
+    conn.executemany(
+        "INSERT INTO rollup_lines (month, document_type, mode, route, customer, field, lines, amount_cents) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (month, document_type, mode, route, customer, field) DO UPDATE SET "
+        "lines = lines + excluded.lines, amount_cents = amount_cents + excluded.amount_cents",
+        [(*keys, field, sign, sign * cents) for field, cents in lines if cents > 0])
+    if sign < 0:
+        conn.execute("DELETE FROM rollup_totals WHERE documents = 0 AND month = ? AND document_type = ? AND mode = ? "
+                     "AND route = ? AND customer = ?", keys)
+        conn.execute("DELETE FROM rollup_lines WHERE lines = 0 AND month = ? AND document_type = ? AND mode = ? "
+                     "AND route = ? AND customer = ?", keys)
+
+
+def rebuild(ledger):
+    """Recomputes both rollup tables from the latest version of every ledger document."""
+    conn = ledger._connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM rollup_totals")
+        conn.execute("DELETE FROM rollup_lines")
+        latest = conn.execute(
+            "SELECT d.id FROM ledger_documents d WHERE d.version = (SELECT MAX(version) FROM ledger_documents "
+            "WHERE reference = d.reference AND document_type = d.document_type)").fetchall()
+        for (document_id,) in latest:
+            vector = ledger.charges(document_id)
+            apply(conn, ledger.get(document_id), zip(vector.schema.fields, vector.cents))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(latest)
+
+
+def _where(months, filters):
+    clauses, params = [], []
+    if months:
+        clauses.append(f"month IN ({', '.join('?' * len(months))})")
+        params.extend(months)
+    for column, value in filters.items():
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    return " AND ".join(clauses) or "1", params
+
+
+def totals(ledger, group_by=("month",), months=None, **filters):
+    """
+    Documents, subtotal, VAT and total (cents) per group, e.g.
+    group_by=("month", "mode") with document_type="sales_estimate".
+    """
+    columns = [column for column in group_by if column in DIMENSIONS]
+    where, params = _where(months, filters)
+    select = ", ".join(columns) + ", " if columns else ""
+    rows = ledger._connection().execute(
+        f"SELECT {select}SUM(documents), SUM(subtotal_cents), SUM(vat_cents), SUM(total_cents) FROM rollup_totals "
+        f"WHERE {where}" + (f" GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}" if columns else ""), params)
+    return [dict(zip((*columns, "documents", "subtotal_cents", "vat_cents", "total_cents"), row)) for row in rows]
+
+
+def line_totals(ledger, months=None, **filters):
+    """Amount (cents) and number of times charged per charge line, largest first."""
+    where, params = _where(months, filters)
+    rows = ledger._connection().execute(
+        f"SELECT field, SUM(lines), SUM(amount_cents) FROM rollup_lines WHERE {where} "
+        "GROUP BY field ORDER BY SUM(amount_cents) DESC", params)
+    return [{"field": field, "lines": lines, "amount_cents": amount} for field, lines, amount in rows]
+
+
+def available_months(ledger):
+    """Months with any rollup, newest first."""
+    return [month for (month,) in ledger._connection().execute("SELECT DISTINCT month FROM rollup_totals ORDER BY month DESC")]
+
+
+def main(argv=None):
+    from ledger import ChargeLedger, LEDGER_DB
+
+    parser = argparse.ArgumentParser(description="Monthly charge rollups.")
+    parser.add_argument("--db", default=LEDGER_DB)
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollups from the ledger")
+    parser.add_argument("--group-by", nargs="+", default=["month", "mode"], choices=DIMENSIONS)
+    args = parser.parse_args(argv)
+    ledger = ChargeLedger(args.db)
+
+    if args.rebuild:
+        print(f"Rebuilt rollups from {rebuild(ledger)} documents.")
+    for row in totals(ledger, args.group_by):
+        keys = "  ".join(f"{row[column] or '-':<16}" for column in args.group_by)
+        print(f"{keys}  {row['documents']:>6} docs  ${row['subtotal_cents'] / 100:>14,.2f}  "
+              f"VAT ${row['vat_cents'] / 100:>12,.2f}  total ${row['total_cents'] / 100:>14,.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+from metrics import observe, timed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Default store for running numbers, keyed by "{prefix}/{MM/YYYY}"
+DATA_FILE = os.path.join("data", "running_numbers.json")
+
+
+def _file_mode():
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Permissions open() gives a new file; temp files from mkstemp are 0600, so
+# files written through one are set to this before they're renamed into place
+FILE_MODE = _file_mode()
+
+
+# Hold an exclusive lock on "<path>.lock" for the duration of the block.
+# The lock is taken on a sidecar file so the data file itself can be
+# replaced atomically while the lock is held.
+@contextmanager
+def file_lock(path):
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Write text (or bytes) to a temp file in the same directory, fsync it and
+# rename it over the target, so a crash never leaves a truncated file behind.
+@timed("atomic_write")
+def atomic_write(path, text):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        os.chmod(tmp_path, FILE_MODE)
+        with os.fdopen(fd, "wb" if isinstance(text, (bytes, bytearray)) else "w") as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    fsync_directory(directory)
+
+
+# Flush a directory entry (e.g. a rename) to disk. No-op where directories
+# can't be opened (Windows).
+def fsync_directory(directory):
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def load_running_numbers(data_file=DATA_FILE):
+    """Reads the running numbers store, returning {} if it doesn't exist yet."""
+    if os.path.exists(data_file):
+        with open(data_file, "r") as file:
+            return json.load(file)
+    return {}
+
+
+def save_running_numbers(running_numbers, data_file=DATA_FILE):
+    """Atomically replaces the running numbers store."""
+    atomic_write(data_file, json.dumps(running_numbers))
+
+
+@contextmanager
+def locked_running_numbers(data_file=DATA_FILE):
+    """
+    Yields the running numbers dict under an exclusive lock and saves it
+    atomically when the block exits without an error.
+    """
+    started = time.perf_counter()
+    with file_lock(data_file):
+        observe("running_numbers_lock_wait", time.perf_counter() - started)
+        running_numbers = load_running_numbers(data_file)
+        yield running_numbers
+        save_running_numbers(running_numbers, data_file)
+
+
+@timed("allocate_running_number")
+def allocate_running_number(key, data_file=DATA_FILE):
+    """
+    Increments and returns the running number for key (e.g. "KA/03/2025").
+    Safe across threads, processes and Streamlit sessions sharing the file.
+    """
+    with locked_running_numbers(data_file) as running_numbers:
+        running_numbers[key] = running_numbers.get(key, 0) + 1
+        return running_numbers[key]
+
+
+@timed("reserve_running_numbers")
+def reserve_running_numbers(key, count, data_file=DATA_FILE):
+    """
+    Reserves a contiguous block of count running numbers for key in a single
+    locked read-modify-write and returns them as a range.
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1")
+    with locked_running_numbers(data_file) as running_numbers:
+        first = running_numbers.get(key, 0) + 1
+        running_numbers[key] = first + count - 1
+        return range(first, first + count)
+
+
+class RunningNumberBlock:
+    """
+    Per-worker pre-allocation of running numbers for one prefix. Each worker
+    reserves block_size numbers at a time for the current month and hands
+    them out from memory, so the shared file is only touched once per block.
+    A new month starts a new block. Numbers left unused when the worker
+    stops or the month ends are skipped, never reissued. Safe to share
+    between threads.
+    """
+
+    def __init__(self, prefix, block_size=50, data_file=DATA_FILE):
+        self.prefix = prefix
+        self.block_size = block_size
+        self.data_file = data_file
+        self._key = None
+        self._numbers = iter(())
+        self._lock = threading.Lock()
+
+    def next_number(self, today=None):
+        """Returns (key, number): the next running number and its "{prefix}/{MM/YYYY}" key."""
+        key = f"{self.prefix}/{(today or datetime.today()).strftime('%m/%Y')}"
+        with self._lock:
+            if key != self._key:
+                self._key, self._numbers = key, iter(())
+            number = next(self._numbers, None)
+            if number is None:
+                self._numbers = iter(reserve_running_numbers(key, self.block_size, self.data_file))
+                number = next(self._numbers)
+            return key, number
@@ -0,0 +1,459 @@
+"""
+Full-text search over uploaded PDFs and generated documents.
+
+Text is pulled out of every PDF under uploads/, charge_sheets/ and
+invoices/ (in parallel worker processes) into an SQLite FTS5 index in
+data/search.db, with each document tied to its file reference. update()
+only re-extracts files that are new or whose size or mtime changed, and
+drops files that were removed; new uploads and saved documents are
+indexed as they arrive.
+
+Extraction uses pypdf (an optional dependency, pip install pypdf). Only
+when it isn't installed does a small built-in reader pull the text
+operators out of the (Flate-compressed) content streams instead; that
+covers the documents this app generates and simple text-based PDFs, but
+not scans or text in embedded (CID) font encodings.
+
+Searches rank matches with bm25 (reference and file name matches weigh
+more than body text) and return the best `limit`. A query matching more
+than MAX_RANKED_MATCHES documents (a common word, not an identifier) is
+ranked among the newest MAX_RANKED_MATCHES of them only, which keeps it
+under 100 ms on a 100,000-document archive.
+
+    python search_index.py --update
+    python search_index.py "MSCU1234567"
+"""
+import os
+import re
+import sys
+import zlib
+import sqlite3
+import argparse
+import threading
+from functools import lru_cache
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from document_catalog import parse_folder
+
+SEARCH_DB = os.path.join("data", "search.db")
+
+# Folders indexed by default, and what their documents are
+SOURCES = {
+    "uploads": "upload",
+    "charge_sheets": "generated",
+    "invoices": "generated",
+}
+
+# bm25 column weights (reference, name, body): matches in the reference and
+# file name outrank matches in the body
+BM25_WEIGHTS = "4.0, 2.0, 1.0"
+
+# Matches scored per search. Finding and scoring a match costs 2-4 us (more
+# for multi-word queries), so ranking every document that contains a common
+# word would take 200-400 ms on a 100,000-document archive; 10,000 keeps such
+# queries around 50 ms (benchmarks/bench_search_index.py)
+MAX_RANKED_MATCHES = 10_000
+
+# Extracted text kept per document (enough for any multi-page shipping document)
+MAX_TEXT_CHARS = 200_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id        INTEGER PRIMARY KEY,
+    path      TEXT NOT NULL UNIQUE,
+    kind      TEXT NOT NULL,
+    reference TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_reference ON files (reference);
+CREATE VIRTUAL TABLE IF NOT EXISTS file_text USING fts5(reference, name, body, tokenize = 'unicode61');
+"""
+
+SearchHit = namedtuple("SearchHit", ["path", "kind", "reference", "snippet", "rank"])
+
+# Charge_Sheet_KA001032025.pdf, Sales_Estimate_..., NHS_Charge_Sheet_..., Invoice_...
+_GENERATED_NAME = re.compile(r"^(?:NHS_Charge_Sheet|Charge_Sheet|Sales_Estimate|Invoice)_(.+)\.pdf$", re.I)
+
+
+def document_reference(path):
+    """File reference a document belongs to, from its folder (uploads) or file name (generated)."""
+    folder, name = os.path.split(path)
+    match = _GENERATED_NAME.match(name)
+    if match:
+        return parse_folder(match.group(1))[0]
+    return parse_folder(os.path.basename(folder))[0]
+
+
+@lru_cache(maxsize=None)
+def _pypdf():
+    """
+    pypdf's PdfReader, or None when pypdf isn't installed (the built-in
+    extractor below is used instead). Imported on first extraction rather
+    than with this module, which the app imports on every cold start.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+    return PdfReader
+
+
+# --- Built-in extraction (without pypdf) ------------------------------------
+
+_STREAM_START = re.compile(rb"(?<!end)stream\r?\n")
+_OPERATOR_CHARS = frozenset(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ*'\"")
+_NUMBER_CHARS = frozenset(b"+-.0123456789")
+_ESCAPES = {ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b", ord("f"): b"\f"}
+
+
+def _content_streams(data):
+    """Yields the decoded bytes of every stream that isn't an image, font or object stream."""
+    for match in _STREAM_START.finditer(data):
+        end = data.find(b"endstream", match.end())
+        if end < 0:
+            break
+        header = data[max(0, match.start() - 512):match.start()]
+        header = header[header.rfind(b"obj") + 1:]
+        if any(marker in header for marker in (b"/Image", b"/ObjStm", b"/XRef", b"/FontFile", b"/Length1")):
+            continue
+        raw = data[match.end():end]
+        if b"/FlateDecode" in header:
+            try:
+                raw = zlib.decompressobj().decompress(raw)
+            except zlib.error:
+                continue
+        elif b"/Filter" in header:
+            continue  # DCT, LZW and friends never hold page text
+        if b"BT" in raw:
+            yield raw
+
+
+def _read_literal(content, i):
+    """Reads a (...) string starting at content[i]; returns (bytes, index after it)."""
+    out = bytearray()
+    depth = 0
+    n = len(content)
+    while i < n:
+        c = content[i]
+        if c == 0x5C:  # backslash
+            i += 1
+            if i >= n:
+                break
+            c = content[i]
+            if c in _ESCAPES:
+                out += _ESCAPES[c]
+            elif 0x30 <= c <= 0x37:
+                digits = content[i:i + 3]
+                length = 1
+                while length < len(digits) and 0x30 <= digits[length] <= 0x37:
+                    length += 1
+                out.append(int(digits[:length], 8) & 0xFF)
+                i += length - 1
+            elif c not in (0x0A, 0x0D):
+                out.append(c)
+        elif c == 0x28:
+            if depth:
+                out.append(c)
+            depth += 1
+        elif c == 0x29:
+            depth -= 1
+            if not depth:
+                return bytes(out), i + 1
+            out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    return bytes(out), i
+
+
+def _decode(text):
+    if text.startswith(b"\xfe\xff"):
+        return text[2:].decode("utf-16-be", "replace")
+    return text.decode("latin-1")
+
+
+def _text_from_content(content):
+    """Text shown by the Tj/TJ/'/\" operators of one content stream, a line per text move."""
+    lines, line, pending = [], [], []
+    i, n = 0, len(content)
+    while i < n:
+        c = content[i]
+        if c == 0x28:  # (literal string)
+            text, i = _read_literal(content, i)
+            pending.append(_decode(text))
+            continue
+        if c == 0x3C and content[i + 1:i + 2] != b"<":  # <hex string>
+            end = content.find(b">", i)
+            if end < 0:
+                break
+            hex_digits = re.sub(rb"\s", b"", content[i + 1:end])
+            if len(hex_digits) % 2:
+                hex_digits += b"0"
+            try:
+                pending.append(_decode(bytes.fromhex(hex_digits.decode("ascii"))))
+            except ValueError:
+                pass
+            i = end + 1
+            continue
+        if c == 0x25:  # % comment
+            end = content.find(b"\n", i)
+            i = n if end < 0 else end + 1
+            continue
+        if c in _NUMBER_CHARS:
+            start = i
+            while i < n and content[i] in _NUMBER_CHARS:
+                i += 1
+            try:
+                if pending and float(content[start:i]) < -200:  # wide kerning gap inside TJ = word space
+                    pending.append(" ")
+            except ValueError:
+                pass
+            continue
+        if c in _OPERATOR_CHARS:
+            start = i
+            while i < n and content[i] in _OPERATOR_CHARS:
+                i += 1
+            operator = content[start:i]
+            if operator in (b"Tj", b"TJ", b"'", b'"'):
+                if operator in (b"'", b'"') and line:
+                    lines.append("".join(line))
+                    line = []
+                line.extend(pending)
+            elif operator in (b"Td", b"TD", b"T*", b"Tm", b"ET") and line:
+                lines.append("".join(line))
+                line = []
+            pending = []
+            continue
+        i += 1
+    if line:
+        lines.append("".join(line))
+    return "\n".join(text.strip() for text in lines if text.strip())
+
+
+def extract_text(path):
+    """Plain text of a PDF ("" for scans and unreadable files)."""
+    PdfReader = _pypdf()
+    try:
+        if PdfReader is not None:
+            reader = PdfReader(path)
+            text = "\n".join(page.extract_text() or "" for page in reader.pages)
+        else:
+            with open(path, "rb") as file:
+                data = file.read()
+            text = "\n".join(_text_from_content(content) for content in _content_streams(data))
+    except Exception:
+        return ""
+    return text[:MAX_TEXT_CHARS]
+
+
+def _extract(job):
+    path, kind, size, mtime_ns = job
+    return path, kind, size, mtime_ns, extract_text(path)
+
+
+# --- Index ------------------------------------------------------------------
+
+def _fts_query(text):
+    """User input -> FTS5 query: every word must appear, the last one as a prefix (type-ahead)."""
+    terms = [term for term in re.split(r"\s+", text.strip()) if term]
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    if quoted:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _snippet(body, terms, width=60):
+    """
+    The text around the first query term found in body, with the term in
+    bold. (FTS5's snippet() scores every match in the document, which is
+    slow for common words in long documents.)
+    """
+    lowered = body.lower()
+    for term in terms:
+        position = lowered.find(term.lower())
+        if position >= 0:
+            start, end = max(0, position - width), min(len(body), position + len(term) + width)
+            text = f"{body[start:position]}**{body[position:position + len(term)]}**{body[position + len(term):end]}"
+            return ("… " if start else "") + " ".join(text.split()) + (" …" if end < len(body) else "")
+    return " ".join(body[:2 * width].split())
+
+
+class SearchIndex:
+    """FTS5 index of document text; each thread gets its own connection."""
+
+    def __init__(self, db_path=SEARCH_DB, sources=None):
+        self.db_path = db_path
+        self.sources = dict(sources or SOURCES)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _store(conn, path, kind, size, mtime_ns, text):
+        row = conn.execute("SELECT id FROM files WHERE path = ?", (path,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM file_text WHERE rowid = ?", row)
+            conn.execute("UPDATE files SET kind = ?, reference = ?, size = ?, mtime_ns = ? WHERE id = ?",
+                         (kind, document_reference(path), size, mtime_ns, row[0]))
+            file_id = row[0]
+        else:
+            file_id = conn.execute("INSERT INTO files (path, kind, reference, size, mtime_ns) VALUES (?, ?, ?, ?, ?)",
+                                   (path, kind, document_reference(path), size, mtime_ns)).lastrowid
+        conn.execute("INSERT INTO file_text (rowid, reference, name, body) VALUES (?, ?, ?, ?)",
+                     (file_id, document_reference(path), os.path.basename(path), text))
+
+    @staticmethod
+    def _forget(conn, path):
+        row = conn.execute("SELECT id FROM files WHERE path = ?", (path,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM file_text WHERE rowid = ?", row)
+            conn.execute("DELETE FROM files WHERE id = ?", row)
+
+    def _kind(self, path):
+        path = os.path.abspath(path)
+        for folder, kind in self.sources.items():
+            if path.startswith(os.path.abspath(folder) + os.sep):
+                return kind
+        return "upload"
+
+    def index_file(self, path, kind=None):
+        """(Re-)indexes one PDF, or drops it from the index if it no longer exists."""
+        conn = self._connection()
+        with conn:
+            if not os.path.exists(path):
+                self._forget(conn, path)
+                return
+            stat = os.stat(path)
+            self._store(conn, path, kind or self._kind(path), stat.st_size, stat.st_mtime_ns, extract_text(path))
+
+    def _scan(self):
+        for folder, kind in self.sources.items():
+            for root, dirs, files in os.walk(folder):
+                dirs[:] = [d for d in dirs if not d.startswith(".")]
+                for name in files:
+                    if name.lower().endswith(".pdf") and not name.startswith("."):
+                        path = os.path.join(root, name)
+                        stat = os.stat(path)
+                        yield path, kind, stat.st_size, stat.st_mtime_ns
+
+    def update(self, workers=None):
+        """
+        Indexes new and changed PDFs (text extracted in parallel processes)
+        and drops removed ones. Returns counts.
+        """
+        conn = self._connection()
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in conn.execute("SELECT path, size, mtime_ns FROM files")}
+        stale = set(known)
+        pending = []
+        for path, kind, size, mtime_ns in self._scan():
+            stale.discard(path)
+            if known.get(path) != (size, mtime_ns):
+                pending.append((path, kind, size, mtime_ns))
+
+        summary = {"files": len(known) - len(stale) + sum(1 for job in pending if job[0] not in known),
+                   "indexed": len(pending), "removed": len(stale)}
+        if len(pending) == 1 or workers == 1:
+            self._store_all(conn, map(_extract, pending))
+        elif pending:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                self._store_all(conn, executor.map(_extract, pending, chunksize=8))
+        with conn:
+            for path in stale:
+                self._forget(conn, path)
+        return summary
+
+    def _store_all(self, conn, results, batch=200):
+        batch_rows = []
+        for result in results:
+            batch_rows.append(result)
+            if len(batch_rows) >= batch:
+                with conn:
+                    for row in batch_rows:
+                        self._store(conn, *row)
+                batch_rows = []
+        with conn:
+            for row in batch_rows:
+                self._store(conn, *row)
+
+    def search(self, text, limit=20, reference=None):
+        """Best matches first, with a highlighted snippet of the matching text."""
+        query = _fts_query(text)
+        if not query:
+            return []
+        if reference:
+            # Restrict to the reference's column as a phrase; cheaper than joining every match
+            query = f'reference : "{reference.replace(chr(34), chr(34) * 2)}" AND ({query})'
+        conn = self._connection()
+        try:
+            # bm25 is only evaluated for the rows the inner query emits: every match
+            # unless there are more than MAX_RANKED_MATCHES, then the newest of them
+            ranked = conn.execute(
+                f"SELECT rowid, score FROM (SELECT rowid, bm25(file_text, {BM25_WEIGHTS}) AS score FROM file_text "
+                "WHERE file_text MATCH ? ORDER BY rowid DESC LIMIT ?) ORDER BY score LIMIT ?",
+                (query, MAX_RANKED_MATCHES, limit)).fetchall()
+            if not ranked:
+                return []
+            placeholders = ", ".join("?" * len(ranked))
+            bodies = dict(conn.execute(f"SELECT rowid, body FROM file_text WHERE rowid IN ({placeholders})",
+                                       [rowid for rowid, _ in ranked]))
+        except sqlite3.OperationalError:
+            return []  # query FTS5 can't parse
+        files = {row[0]: row[1:] for row in conn.execute(
+            f"SELECT id, path, kind, reference FROM files WHERE id IN ({placeholders})", [rowid for rowid, _ in ranked])}
+        terms = text.split()
+        return [SearchHit(*files[rowid], _snippet(bodies.get(rowid, ""), terms), rank)
+                for rowid, rank in ranked if rowid in files]
+
+    def stats(self):
+        return {"documents": self._connection().execute("SELECT COUNT(*) FROM files").fetchone()[0]}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """The process-wide SearchIndex, opened on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SearchIndex()
+    return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the text of uploaded and generated PDFs.")
+    parser.add_argument("query", nargs="?")
+    parser.add_argument("--db", default=SEARCH_DB)
+    parser.add_argument("--update", action="store_true", help="Index new/changed PDFs and drop removed ones")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+    index = SearchIndex(args.db)
+
+    if args.update:
+        summary = index.update(args.workers)
+        print(f"{summary['files']} PDFs: {summary['indexed']} indexed, {summary['removed']} removed.")
+    if args.query:
+        for hit in index.search(args.query, args.limit):
+            print(f"{hit.reference:<20} {hit.path}\n    {hit.snippet}")
+    elif not args.update:
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""
+Local HTTP/JSON service for file references, documents and uploads.
+
+Lets the TMS and the accounting system allocate file references, issue
+charge sheets and sales estimates and store documents without going
+through the Streamlit UI. It runs the same code the app does: references.py
+for allocation, the document cache and charge ledger for documents, and
+save_upload() (with the persistent job queue) for uploads.
+
+Each connection is served by its own thread and kept alive between
+requests (HTTP/1.1; every response carries a Content-Length), so a client
+that reuses its connection pays for the TCP handshake once.
+
+    GET  /health
+    POST /references            {"mode": "Road Freight", "route": "Beitbridge", "count": 3}
+    POST /references/batch      [{"mode": "Air Freight"}, {"mode": "Export", "count": 10}, ...]
+    POST /documents             {"type": "charge_sheet", "reference": "KA001/03/2025",
+                                 "customer": "ABC Logistics", "charges": {"Agency": 120.50},
+                                 "mode": "Road Freight", "route": "Beitbridge", "save": true}
+                                ("mode" and "route", the reference's, are optional)
+                                (?format=pdf answers with the PDF itself)
+    POST /documents/batch       [{...}, {...}]
+    POST /uploads?reference=KA001/03/2025&filename=scan.pdf[&customer=...&uploader=...]
+                                (the request body is the file)
+    GET  /jobs?ids=12,13
+    GET  /metrics               operation timings and counters, Prometheus text format
+
+Batch endpoints answer with one result per item, in order; an item that
+fails has an "error" instead of failing the whole batch. Errors are JSON
+{"error": message} with a 4xx/5xx status.
+
+    python service.py --port 8750 --token "$SERVICE_TOKEN"
+"""
+import os
+import re
+import sys
+import hmac
+import json
+import math
+import base64
+import argparse
+import time
+import traceback
+from urllib.parse import urlsplit, parse_qsl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from charges import compile_schema
+from references import DATA_FILE, reference_prefix, reserve_file_references
+from reference_data import load_reference_data
+from document_cache import document_cache, render_document
+from documents import (CHARGE_SHEETS_FOLDER, INVOICES_FOLDER, charge_sheet_output_path, sales_estimate_output_path,
+                       document_on_disk, save_document)
+from ledger import get_ledger
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY
+from upload_storage import UPLOAD_FOLDER, UploadQuotaExceeded, save_upload, timestamped_filename, get_upload_queue
+
+DEFAULT_PORT = 8750
+
+# Largest JSON request body, references per allocation and items per batch
+MAX_JSON_BYTES = 10 * 1024 * 1024
+MAX_REFERENCES = 500
+MAX_BATCH_ITEMS = 500
+
+REQUEST_SECONDS = REGISTRY.histogram("fms_http_request_seconds", "Time to handle a service request, by route and status.",
+                                     ["route", "status"])
+
+# Document types the service issues, with their output paths
+DOCUMENT_TYPES = {
+    "charge_sheet": charge_sheet_output_path,
+    "sales_estimate": sales_estimate_output_path,
+}
+
+# "KA001/03/2025" (and the older "KA001/03/25"); anything else could escape the output folders.
+# Road Freight without a route has no prefix.
+REFERENCE_PATTERN = re.compile(r"[A-Z]{0,4}\d{1,6}/\d{2}/\d{2}(\d{2})?")
+
+
+class ServiceError(Exception):
+    """A request the service refuses, with the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RequestBody:
+    """File-like view of exactly Content-Length bytes of a request body."""
+
+    def __init__(self, rfile, length, name=""):
+        self.rfile = rfile
+        self.remaining = length
+        self.name = name
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+
+def _reference(value):
+    if not isinstance(value, str) or not REFERENCE_PATTERN.fullmatch(value):
+        raise ValueError(f"Invalid file reference: {value!r}")
+    return value
+
+
+def _object(request):
+    if not isinstance(request, dict):
+        raise ValueError("Expected a JSON object")
+    return request
+
+
+def _charges(server, charges):
+    """{field: amount in USD} on the reference data's charge lines."""
+    if not isinstance(charges, dict):
+        raise ValueError("charges must be an object of {charge line: amount}")
+    for field, amount in charges.items():
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+            raise ValueError(f"Charge for {field} must be a number")
+        if not math.isfinite(amount):  # json accepts NaN and Infinity, which have no cents value
+            raise ValueError(f"Charge for {field} must be a finite number")
+    return server.charge_schema.vector(charges)
+
+
+def _items(request):
+    if not isinstance(request, list):
+        raise ValueError("Expected a JSON array of requests")
+    if len(request) > MAX_BATCH_ITEMS:
+        raise ValueError(f"At most {MAX_BATCH_ITEMS} items per batch")
+    return request
+
+
+def _batch(function, server, items):
+    results = []
+    for item in _items(items):
+        try:
+            results.append(function(server, item))
+        except (ValueError, KeyError, TypeError) as e:
+            results.append({"error": _message(e)})
+    return results
+
+
+def _message(error):
+    return f"Missing field: {error.args[0]}" if isinstance(error, KeyError) else str(error)
+
+
+def allocate_references(server, request):
+    """{"mode", "route"?, "count"?} -> {"references": [...]}."""
+    request = _object(request)
+    count = int(request.get("count", 1))
+    if not 1 <= count <= MAX_REFERENCES:
+        raise ValueError(f"count must be between 1 and {MAX_REFERENCES}")
+    references = reserve_file_references(request["mode"], request.get("route"), count,
+                                         server.reference_data, server.data_file)
+    return {"references": references}
+
+
+def issue_document(server, request):
+    """
+    Renders (through the document cache) one charge sheet or sales estimate
+    and, unless "save" is false, records it in the charge ledger and writes
+    it to its output folder. Returns (details, PDF bytes).
+    """
+    request = _object(request)
+    document_type = request.get("type", "charge_sheet")
+    if document_type not in DOCUMENT_TYPES:
+        raise ValueError(f"Unknown document type: {document_type}")
+    reference, customer = _reference(request["reference"]), request["customer"]
+    if not isinstance(customer, str) or not customer.strip():
+        raise ValueError("customer must be a non-empty string")
+    charges = _charges(server, request.get("charges") or {})
+    mode, route = request.get("mode"), request.get("route")
+    if mode is not None and not reference.startswith(reference_prefix(mode, route, server.reference_data)):
+        raise ValueError(f"{reference} was not allocated for {' / '.join(filter(None, (mode, route)))}")
+
+    save = request.get("save", True)
+    pdf, cached = render_document(document_type, reference, customer, charges, server.document_cache, disk=save)
+    result = {"type": document_type, "reference": reference, "customer": customer, "size": len(pdf),
+              "total_cents": charges.total_cents() if document_type == "sales_estimate" else charges.subtotal_cents(),
+              "cached": cached}
+    if save:
+        issued = get_ledger().record(document_type, reference, customer, charges, mode=mode, route=route)
+        path = DOCUMENT_TYPES[document_type](reference, server.output_dirs[document_type])
+        # The file at path may be another customer's or charge set's render of the reference
+        if not (cached and document_on_disk(pdf, path)):
+            save_document(pdf, path)
+            get_upload_queue().enqueue("index_document", {"path": path})
+        result.update(path=path, document_id=issued.id, version=issued.version, customer_id=issued.customer_id)
+    return result, pdf
+
+
+def document_details(server, request):
+    """issue_document()'s details, with the PDF (base64) added if "include_pdf" is true."""
+    result, pdf = issue_document(server, request)
+    if request.get("include_pdf"):
+        result["pdf"] = base64.b64encode(pdf).decode("ascii")
+    return result
+
+
+def handle_health(server, query, body):
+    return {"status": "ok"}
+
+
+def handle_references(server, query, body):
+    return allocate_references(server, body)
+
+
+def handle_references_batch(server, query, body):
+    return _batch(allocate_references, server, body)
+
+
+def handle_documents(server, query, body):
+    if query.get("format") == "pdf":
+        return issue_document(server, body)[1]
+    return document_details(server, body)
+
+
+def handle_documents_batch(server, query, body):
+    return _batch(document_details, server, body)
+
+
+def handle_uploads(server, query, body):
+    """Streams the request body into uploads/<reference>/ via save_upload()."""
+    reference = _reference(query.get("reference"))
+    name = os.path.basename(query.get("filename") or "")
+    if not name or name.startswith("."):
+        raise ValueError("filename is required")
+    body.name = name
+    stored = save_upload(body, reference, timestamped_filename(name), server.upload_folder,
+                         customer=query.get("customer"), uploader=query.get("uploader"), queue=get_upload_queue())
+    return {"path": stored.path, "size": stored.size, "sha256": stored.sha256, "jobs": list(stored.jobs)}
+
+
+def handle_jobs(server, query, body):
+    try:
+        ids = [int(job_id) for job_id in query.get("ids", "").split(",") if job_id]
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of job ids")
+    return [job._asdict() for job in get_upload_queue().jobs(ids)]
+
+
+def handle_metrics(server, query, body):
+    return REGISTRY.render()
+
+
+# (method, path) -> (handler, request body: "json", "stream" or None)
+ROUTES = {
+    ("GET", "/health"): (handle_health, None),
+    ("POST", "/references"): (handle_references, "json"),
+    ("POST", "/references/batch"): (handle_references_batch, "json"),
+    ("POST", "/documents"): (handle_documents, "json"),
+    ("POST", "/documents/batch"): (handle_documents_batch, "json"),
+    ("POST", "/uploads"): (handle_uploads, "stream"),
+    ("GET", "/jobs"): (handle_jobs, None),
+    ("GET", "/metrics"): (handle_metrics, None),
+}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    # Headers and body go out in separate writes; with Nagle's algorithm the body would wait
+    # for the client's delayed ACK (~40 ms) on every kept-alive request
+    disable_nagle_algorithm = True
+    server_version = "FileManagementService/1.0"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        started = time.perf_counter()
+        body = RequestBody(self.rfile, int(self.headers.get("Content-Length") or 0))
+        try:
+            if self.headers.get("Transfer-Encoding"):
+                raise ServiceError(411, "Send a Content-Length; chunked request bodies are not supported")
+            if self.server.token and not hmac.compare_digest(
+                    self.headers.get("Authorization", ""), f"Bearer {self.server.token}"):
+                raise ServiceError(401, "Missing or invalid token")
+            route = ROUTES.get((method, url.path))
+            if route is None:
+                known = any(path == url.path for _, path in ROUTES)
+                raise ServiceError(405 if known else 404, f"No {method} {url.path}")
+            handler, body_kind = route
+            if body_kind == "json":
+                if body.remaining > MAX_JSON_BYTES:
+                    raise ServiceError(413, f"Request body is larger than {MAX_JSON_BYTES} bytes")
+                try:
+                    request = json.loads(body.read() or b"null")
+                except ValueError:
+                    raise ServiceError(400, "Request body is not valid JSON")
+            else:
+                request = body
+            payload = handler(self.server, dict(parse_qsl(url.query)), request)
+            status = 200
+        except ServiceError as e:
+            status, payload = e.status, {"error": str(e)}
+        except UploadQuotaExceeded as e:
+            status, payload = 413, {"error": str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            status, payload = 400, {"error": _message(e)}
+        except Exception as e:
+            self.log_error("%s", traceback.format_exc())
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+
+        # Whatever of the body wasn't read would be taken for the next request
+        if body.remaining:
+            self.close_connection = True
+        self._respond(status, payload)
+        # Unknown paths share one label, so stray requests can't grow the metric without bound
+        REQUEST_SECONDS.observe(time.perf_counter() - started, status=str(status),
+                                route=url.path if (method, url.path) in ROUTES else "other")
+
+    def _respond(self, status, payload):
+        if isinstance(payload, bytes):
+            data, content_type = payload, "application/pdf"
+        elif isinstance(payload, str):
+            data, content_type = payload.encode("utf-8"), METRICS_CONTENT_TYPE
+        else:
+            data, content_type = json.dumps(payload, separators=(",", ":")).encode("utf-8"), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class Service(ThreadingHTTPServer):
+    """The HTTP server plus the state its handlers share."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address=("127.0.0.1", DEFAULT_PORT), token=None, data_file=DATA_FILE,
+                 upload_folder=UPLOAD_FOLDER, output_dirs=None, cache=None, quiet=False):
+        super().__init__(address, ServiceHandler)
+        self.token = token
+        self.data_file = data_file
+        self.upload_folder = upload_folder
+        self.output_dirs = {"charge_sheet": CHARGE_SHEETS_FOLDER, "sales_estimate": INVOICES_FOLDER, **(output_dirs or {})}
+        self.document_cache = cache or document_cache
+        self.quiet = quiet
+        self.reference_data = load_reference_data()
+        self.charge_schema = compile_schema(self.reference_data["charge_fields"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve file references, documents and uploads over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token", default=os.environ.get("SERVICE_TOKEN"),
+                        help="Require 'Authorization: Bearer <token>' (default: $SERVICE_TOKEN)")
+    parser.add_argument("--quiet", action="store_true", help="Don't log each request")
+    args = parser.parse_args(argv)
+
+    service = Service((args.host, args.port), token=args.token, quiet=args.quiet)
+    print(f"Serving on http://{args.host}:{service.server_address[1]}. Ctrl+C to stop.")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,3 @@
-import psycopg2
-
 DB_CONFIG = {
     "dbname": "logistics_db",
     "user": "postgres",
@@ -9,4 +7,5 @@ DB_CONFIG = {
 }
 
 def get_db_connection():
+    import psycopg2  # only the DB-backed paths need it
     return psycopg2.connect(**DB_CONFIG)
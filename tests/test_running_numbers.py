@@ -0,0 +1,80 @@
+import os
+import stat
+from datetime import datetime
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from running_numbers import (FILE_MODE, RunningNumberBlock, allocate_running_number, atomic_write,
+                             load_running_numbers, reserve_running_numbers)
+
+PROCESSES = 8
+ALLOCATIONS = 400
+KEYS = ["KA/03/2025", "AA/03/2025"]
+
+
+def _allocate(args):
+    data_file, key = args
+    return key, allocate_running_number(key, data_file)
+
+
+def _reserve(args):
+    data_file, key, count = args
+    return key, list(reserve_running_numbers(key, count, data_file))
+
+
+def test_allocations_from_many_processes_have_no_duplicates_or_gaps(tmp_path):
+    data_file = str(tmp_path / "running_numbers.json")
+    jobs = [(data_file, KEYS[i % len(KEYS)]) for i in range(ALLOCATIONS)]
+
+    with ProcessPoolExecutor(max_workers=PROCESSES) as pool:
+        results = list(pool.map(_allocate, jobs, chunksize=1))
+
+    assert not [item for item, seen in Counter(results).items() if seen > 1]
+    for key, count in Counter(key for _, key in jobs).items():
+        assert sorted(number for k, number in results if k == key) == list(range(1, count + 1))
+        assert load_running_numbers(data_file)[key] == count
+
+
+def test_reserved_blocks_from_many_processes_tile_the_range(tmp_path):
+    data_file = str(tmp_path / "running_numbers.json")
+    jobs = [(data_file, "KE/03/2025", 1 + i % 7) for i in range(100)]
+
+    with ProcessPoolExecutor(max_workers=PROCESSES) as pool:
+        blocks = [numbers for _, numbers in pool.map(_reserve, jobs, chunksize=1)]
+
+    # Each block is contiguous, and together they cover 1..total exactly once
+    assert all(numbers == list(range(numbers[0], numbers[-1] + 1)) for numbers in blocks)
+    total = sum(count for _, _, count in jobs)
+    assert sorted(number for numbers in blocks for number in numbers) == list(range(1, total + 1))
+    assert load_running_numbers(data_file)["KE/03/2025"] == total
+
+
+def test_block_shared_between_threads_hands_out_each_number_once(tmp_path):
+    block = RunningNumberBlock("KA", block_size=7, data_file=str(tmp_path / "running_numbers.json"))
+    march = datetime(2025, 3, 14)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda _: block.next_number(today=march), range(500)))
+
+    assert {key for key, _ in results} == {"KA/03/2025"}
+    assert sorted(number for _, number in results) == list(range(1, 501))
+
+
+def test_block_starts_again_in_a_new_month(tmp_path):
+    data_file = str(tmp_path / "running_numbers.json")
+    block = RunningNumberBlock("KA", block_size=10, data_file=data_file)
+
+    assert block.next_number(today=datetime(2025, 3, 31)) == ("KA/03/2025", 1)
+    assert block.next_number(today=datetime(2025, 3, 31)) == ("KA/03/2025", 2)
+    assert block.next_number(today=datetime(2025, 4, 1)) == ("KA/04/2025", 1)
+    # March's unused numbers are skipped, not reissued
+    assert load_running_numbers(data_file) == {"KA/03/2025": 10, "KA/04/2025": 10}
+
+
+def test_atomic_write_gives_files_the_permissions_open_would(tmp_path):
+    path = str(tmp_path / "Charge_Sheet.pdf")
+    atomic_write(path, b"%PDF-1.3")
+    with open(str(tmp_path / "plain.pdf"), "wb") as file:
+        file.write(b"%PDF-1.3")
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == stat.S_IMODE(os.stat(tmp_path / "plain.pdf").st_mode) == FILE_MODE
@@ -0,0 +1,226 @@
+import os
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from collections import namedtuple
+
+from running_numbers import FILE_MODE, file_lock, fsync_directory
+from blob_store import link_into_store
+from document_catalog import get_catalog
+from image_variants import is_image, make_variants, make_variants_in_background
+from job_queue import JobQueue, job_handler
+from search_index import get_search_index
+from metrics import UPLOAD_BYTES, timed
+
+UPLOAD_FOLDER = "uploads"
+
+# Copy uploads in fixed-size chunks so memory use doesn't grow with file size
+CHUNK_SIZE = 1024 * 1024
+
+# Quotas
+MAX_FILE_BYTES = 200 * 1024 * 1024
+MAX_REFERENCE_BYTES = 2 * 1024 * 1024 * 1024
+
+# Worker threads started with the upload queue in each process
+UPLOAD_QUEUE_WORKERS = 2
+
+# jobs holds the ids of the queued post-processing jobs (empty when processed inline)
+StoredUpload = namedtuple("StoredUpload", ["path", "size", "sha256", "jobs"], defaults=((),))
+
+_upload_queue = None
+_upload_queue_lock = threading.Lock()
+
+
+class UploadQuotaExceeded(Exception):
+    """Raised when an upload is larger than the per-file or per-reference quota."""
+
+
+def reference_folder(reference, upload_folder=UPLOAD_FOLDER):
+    """uploads/<reference without slashes>, e.g. uploads/KA001032025."""
+    return os.path.join(upload_folder, reference.replace("/", ""))
+
+
+def timestamped_filename(original_name, now=None):
+    """"scan.pdf" -> "scan_20250301090500.pdf", as the upload screens have always named files."""
+    timestamp = (now or datetime.now()).strftime("%Y%m%d%H%M%S")
+    return f"{original_name.split('.')[0]}_{timestamp}.{original_name.split('.')[-1]}"
+
+
+def folder_usage(folder):
+    """Bytes used by the stored documents in folder (hidden/temp files excluded)."""
+    if not os.path.isdir(folder):
+        return 0
+    return sum(entry.stat().st_size for entry in os.scandir(folder)
+               if entry.is_file() and not entry.name.startswith("."))
+
+
+def _unused_path(folder, filename):
+    path = os.path.join(folder, filename)
+    stem, ext = os.path.splitext(filename)
+    counter = 1
+    while os.path.exists(path):
+        path = os.path.join(folder, f"{stem}_{counter}{ext}")
+        counter += 1
+    return path
+
+
+@timed("save_upload")
+def save_upload(fileobj, reference, filename, upload_folder=UPLOAD_FOLDER,
+                max_file_bytes=MAX_FILE_BYTES, max_reference_bytes=MAX_REFERENCE_BYTES,
+                customer=None, uploader=None, catalog=None, queue=None):
+    """
+    Streams fileobj into uploads/<reference>/<filename> and returns a
+    StoredUpload(path, size, sha256).
+
+    The data is copied in CHUNK_SIZE pieces into a temp file in the target
+    folder while the size and SHA-256 are computed in the same pass, then
+    fsynced and renamed into place, so a partial upload never appears under
+    its final name. An existing file with the same name is never
+    overwritten; a numeric suffix is added instead. The stored file is
+    linked into the content-addressed blob store and recorded in the
+    document catalog (with customer and uploader, if given) in the same
+    step; if the catalog can't be updated the file is removed again.
+    Photos then get their thumbnails made in the background.
+
+    With a JobQueue, only the durable write happens here: cataloguing,
+    blob linking, thumbnails and text indexing are queued as jobs (with
+    retries) and their ids returned in StoredUpload.jobs for the UI to
+    poll.
+
+    Raises UploadQuotaExceeded if the file or the reference's total would
+    exceed its quota.
+    """
+    folder = reference_folder(reference, upload_folder)
+    os.makedirs(folder, exist_ok=True)
+    used = folder_usage(folder)
+
+    if hasattr(fileobj, "seek"):
+        fileobj.seek(0)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".upload_")
+    try:
+        os.chmod(tmp_path, FILE_MODE)  # as if written with open(), not mkstemp's 0600
+        with os.fdopen(fd, "wb") as tmp_file:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_file_bytes:
+                    raise UploadQuotaExceeded(f"{filename} is larger than the {max_file_bytes // (1024 * 1024)} MB file limit")
+                if used + size > max_reference_bytes:
+                    raise UploadQuotaExceeded(f"Uploads for {reference} would exceed the {max_reference_bytes // (1024 * 1024)} MB limit")
+                digest.update(chunk)
+                tmp_file.write(chunk)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+
+        # Re-check the quota and pick the final name under the folder lock, so
+        # concurrent uploads to one reference can't both squeeze under it
+        with file_lock(os.path.join(folder, ".quota")):
+            if folder_usage(folder) + size > max_reference_bytes:
+                raise UploadQuotaExceeded(f"Uploads for {reference} would exceed the {max_reference_bytes // (1024 * 1024)} MB limit")
+            save_path = _unused_path(folder, filename)
+            sha256 = digest.hexdigest()
+            original_name = os.path.basename(getattr(fileobj, "name", "") or "") or filename
+            if queue is not None:
+                os.replace(tmp_path, save_path)
+                fsync_directory(folder)
+            else:
+                with (catalog or get_catalog(upload_folder)).recording(
+                        save_path, size, sha256, reference=reference, original_name=original_name,
+                        customer=customer, uploader=uploader):
+                    os.replace(tmp_path, save_path)
+                    # Identical content already stored for any reference is kept only once
+                    link_into_store(save_path, sha256, os.path.join(upload_folder, ".blobs"))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    UPLOAD_BYTES.inc(size)
+
+    if queue is not None:
+        jobs = [queue.enqueue("catalog_upload", {
+            "path": save_path, "upload_folder": upload_folder, "size": size, "sha256": sha256,
+            "reference": reference, "original_name": original_name, "customer": customer,
+            "uploader": uploader, "uploaded_at": datetime.now().isoformat(timespec="seconds"),
+        })]
+        if is_image(save_path):
+            jobs.append(queue.enqueue("make_variants", {"path": save_path}))
+        if save_path.lower().endswith(".pdf"):
+            jobs.append(queue.enqueue("index_document", {"path": save_path}))
+        return StoredUpload(save_path, size, sha256, tuple(jobs))
+
+    # Thumbnail and viewing copy for photos, off the request path
+    make_variants_in_background(save_path)
+
+    return StoredUpload(save_path, size, sha256)
+
+
+def get_upload_queue():
+    """The process-wide upload job queue, with its worker threads started on first use."""
+    global _upload_queue
+    if _upload_queue is None:
+        with _upload_queue_lock:
+            if _upload_queue is None:
+                queue = JobQueue()
+                queue.start_workers(UPLOAD_QUEUE_WORKERS)
+                _upload_queue = queue
+    return _upload_queue
+
+
+def session_uploader(st):
+    """
+    The signed-in user's email for the catalog's uploader column, or None
+    when the app isn't behind Streamlit's authentication (st.login) or the
+    viewer hasn't signed in. st is the streamlit module.
+    """
+    user = getattr(st, "user", None)
+    return (user.get("email") or None) if user is not None else None
+
+
+def render_upload_jobs(st, job_ids):
+    """
+    Shows the status of this session's upload jobs in an "Upload processing"
+    expander, with a button to rerun and poll again. st is the streamlit
+    module, passed in so this module doesn't import it.
+    """
+    jobs = get_upload_queue().jobs(job_ids)
+    if not jobs:
+        return
+    with st.expander("Upload processing"):
+        for job in jobs:
+            path = job.payload.get("path") or job.payload.get("document_path")
+            error = f" ({job.last_error})" if job.last_error else ""
+            st.write(f"{os.path.basename(path)}: {job.kind.replace('_', ' ')} {job.status}{error}")
+        st.button("Refresh status")
+
+
+# Post-upload jobs. Each is idempotent, so a retry after a partial run is safe.
+@job_handler("catalog_upload")
+def catalog_upload(path, upload_folder, size, sha256, **details):
+    """Links a stored upload into the blob store and records it in the document catalog."""
+    link_into_store(path, sha256, os.path.join(upload_folder, ".blobs"))
+    details["uploaded_at"] = datetime.fromisoformat(details["uploaded_at"])
+    get_catalog(upload_folder).record(path, size, sha256, **details)
+
+
+@job_handler("make_variants")
+def make_variants_job(path):
+    return make_variants(path)
+
+
+@job_handler("index_document")
+def index_document_job(path):
+    """Adds a PDF's text to the full-text search index."""
+    get_search_index().index_file(path)
+
+
+@job_handler("save_file_reference")
+def save_file_reference_job(mode, route, reference, document_path):
+    """Records an uploaded document against its file reference in PostgreSQL."""
+    from file_reference import save_file_reference
+    save_file_reference(mode, route, reference, document_path)
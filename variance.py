@@ -0,0 +1,273 @@
+"""
+Bulk NHS-vs-estimate variance engine.
+
+Loads our charges and the NHS charges for many file references, lines them
+up by reference and computes every (reference, charge line) variance in
+one vectorised pass over ChargeMatrix. Variance is NHS minus ours, as on
+the single-file comparison in chargesheet_invoice_gen.py.
+
+Input files are CSV (columns reference, customer, route, then one column
+per charge line) or JSON Lines ({"reference", "customer", "route",
+"charge_data"}).
+
+    python variance.py our_charges.csv nhs_charges.csv --top 25 --csv variances.csv
+"""
+import io
+import csv
+import sys
+import json
+import heapq
+import argparse
+from array import array
+
+from charges import ChargeMatrix, compile_schema, to_cents, np
+from reference_data import DEFAULT_REFERENCE_DATA
+
+META_COLUMNS = ("reference", "customer", "route")
+
+
+class ChargeSets:
+    """Charges for many files: parallel reference/customer/route lists and a ChargeMatrix."""
+
+    def __init__(self, references, customers, routes, matrix):
+        self.references = references
+        self.customers = customers
+        self.routes = routes
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.references)
+
+
+def _open_text(source):
+    if hasattr(source, "read"):
+        data = source.read()
+        return io.StringIO(data.decode("utf-8-sig") if isinstance(data, bytes) else data)
+    return open(source, newline="", encoding="utf-8-sig")
+
+
+def load_charge_sets(source, schema=None, format=None):
+    """
+    Reads a CSV or JSON Lines file (path or file-like object) into ChargeSets.
+    For CSV the schema defaults to the file's own charge columns; for JSON
+    Lines it defaults to the app's charge lines.
+    """
+    name = getattr(source, "name", source if isinstance(source, str) else "")
+    format = format or ("jsonl" if str(name).endswith((".jsonl", ".json")) else "csv")
+    references, customers, routes, rows = [], [], [], []
+
+    with _open_text(source) as file:
+        if format == "csv":
+            reader = csv.reader(file)
+            header = next(reader)
+            meta = {column: header.index(column) for column in META_COLUMNS if column in header}
+            if "reference" not in meta:
+                raise ValueError("CSV needs a 'reference' column")
+            fields = [column for column in header if column not in META_COLUMNS]
+            schema = schema or compile_schema(fields)
+            unknown = [field for field in fields if field not in schema.slots]
+            if unknown:
+                raise ValueError(f"Unknown charge columns: {', '.join(unknown)}")
+            columns = [(index, schema.slots[column]) for index, column in enumerate(header) if column in schema.slots]
+            for record in reader:
+                if not record:
+                    continue
+                cents = array("q", bytes(8 * len(schema)))
+                for index, slot in columns:
+                    value = record[index].strip()
+                    if value and value not in ("0", "0.0", "0.00"):
+                        cents[slot] = to_cents(value)
+                references.append(record[meta["reference"]])
+                customers.append(record[meta["customer"]] if "customer" in meta else "")
+                routes.append(record[meta["route"]] if "route" in meta else "")
+                rows.append(cents)
+        else:
+            schema = schema or compile_schema(DEFAULT_REFERENCE_DATA["charge_fields"])
+            for line in file:
+                if not line.strip():
+                    continue
+                job = json.loads(line)
+                references.append(job["reference"])
+                customers.append(job.get("customer") or "")
+                routes.append(job.get("route") or "")
+                rows.append(schema.vector(job["charge_data"]).cents)
+
+    return ChargeSets(references, customers, routes, ChargeMatrix.from_rows(schema, rows))
+
+
+class VarianceReport:
+    """
+    Variances (NHS minus ours, in cents) for every reference present in both
+    charge sets, plus the references found on only one side.
+    """
+
+    def __init__(self, references, customers, routes, ours, nhs, missing_from_nhs, missing_from_ours):
+        self.references = references
+        self.customers = customers
+        self.routes = routes
+        self.ours = ours
+        self.nhs = nhs
+        self.variances = nhs.difference(ours)
+        self.missing_from_nhs = missing_from_nhs
+        self.missing_from_ours = missing_from_ours
+
+    @property
+    def fields(self):
+        return self.variances.schema.fields
+
+    def _nonzero(self):
+        """(row, column) of every non-zero variance, in row-major order."""
+        if np is not None:
+            return zip(*(axis.tolist() for axis in np.nonzero(self.variances.rows)))
+        return ((i, j) for i, row in enumerate(self.variances.rows) for j, cents in enumerate(row) if cents)
+
+    def _cell(self, i, j):
+        variance = int(self.variances.rows[i][j])
+        return {
+            "reference": self.references[i],
+            "customer": self.customers[i],
+            "route": self.routes[i],
+            "field": self.fields[j],
+            "ours": int(self.ours.rows[i][j]) / 100,
+            "nhs": int(self.nhs.rows[i][j]) / 100,
+            "variance": variance / 100,
+        }
+
+    def top(self, count=25):
+        """The count largest variances by absolute value, worst first."""
+        if np is not None:
+            flat = np.abs(self.variances.rows).ravel()
+            count = min(count, int(np.count_nonzero(flat)))
+            if not count:
+                return []
+            best = np.argpartition(flat, -count)[-count:]
+            best = best[np.argsort(-flat[best], kind="stable")]
+            width = len(self.fields)
+            return [self._cell(int(index) // width, int(index) % width) for index in best]
+        cells = heapq.nlargest(count, self._nonzero(), key=lambda cell: abs(self.variances.rows[cell[0]][cell[1]]))
+        return [self._cell(i, j) for i, j in cells]
+
+    def by_group(self, group):
+        """
+        Absolute variance totals per customer, route or field, worst first,
+        with the number of variances and the largest single one.
+        """
+        if group not in ("customer", "route", "field"):
+            raise ValueError("group must be 'customer', 'route' or 'field'")
+        if not self.references:
+            return []
+
+        if np is not None:
+            absolute = np.abs(self.variances.rows)
+            if group == "field":
+                labels = list(self.fields)
+                sums = absolute.sum(axis=0)
+                counts = np.count_nonzero(absolute, axis=0)
+                worst = absolute.max(axis=0)
+            else:
+                column = self.customers if group == "customer" else self.routes
+                labels, inverse = np.unique(np.array(column, dtype=object), return_inverse=True)
+                labels = labels.tolist()
+                sums = np.zeros(len(labels), dtype=np.int64)
+                counts = np.zeros(len(labels), dtype=np.int64)
+                worst = np.zeros(len(labels), dtype=np.int64)
+                np.add.at(sums, inverse, absolute.sum(axis=1))
+                np.add.at(counts, inverse, np.count_nonzero(absolute, axis=1))
+                np.maximum.at(worst, inverse, absolute.max(axis=1))
+            totals = [{group: label, "count": int(count), "abs_variance": int(total), "worst": int(largest)}
+                      for label, count, total, largest in zip(labels, counts, sums, worst) if count]
+        else:
+            grouped = {}
+            for i, j in self._nonzero():
+                cents = abs(self.variances.rows[i][j])
+                label = self.fields[j] if group == "field" else (self.customers if group == "customer" else self.routes)[i]
+                entry = grouped.setdefault(label, {group: label, "count": 0, "abs_variance": 0, "worst": 0})
+                entry["count"] += 1
+                entry["abs_variance"] += cents
+                entry["worst"] = max(entry["worst"], cents)
+            totals = list(grouped.values())
+
+        ranked = sorted(totals, key=lambda entry: entry["abs_variance"], reverse=True)
+        for entry in ranked:
+            entry["abs_variance"] /= 100
+            entry["worst"] /= 100
+        return ranked
+
+    def iter_rows(self):
+        """Yields one dict per non-zero variance, in reference order."""
+        for i, j in self._nonzero():
+            yield self._cell(i, j)
+
+    def write_csv(self, file):
+        """Streams every non-zero variance to a CSV file object; returns the row count."""
+        writer = csv.DictWriter(file, fieldnames=["reference", "customer", "route", "field", "ours", "nhs", "variance"])
+        writer.writeheader()
+        written = 0
+        for row in self.iter_rows():
+            writer.writerow(row)
+            written += 1
+        return written
+
+
+def compute_variances(ours, nhs):
+    """Lines up two ChargeSets by reference and returns a VarianceReport."""
+    if ours.matrix.schema != nhs.matrix.schema:
+        raise ValueError("Both charge sets must be loaded with the same charge schema")
+
+    our_rows = {reference: i for i, reference in enumerate(ours.references)}
+    our_index, nhs_index = [], []
+    missing_from_ours = []
+    for j, reference in enumerate(nhs.references):
+        i = our_rows.pop(reference, None)
+        if i is None:
+            missing_from_ours.append(reference)
+        else:
+            our_index.append(i)
+            nhs_index.append(j)
+
+    return VarianceReport(
+        [ours.references[i] for i in our_index],
+        [ours.customers[i] or nhs.customers[j] for i, j in zip(our_index, nhs_index)],
+        [ours.routes[i] or nhs.routes[j] for i, j in zip(our_index, nhs_index)],
+        ours.matrix.take(our_index),
+        nhs.matrix.take(nhs_index),
+        missing_from_nhs=sorted(our_rows),
+        missing_from_ours=missing_from_ours,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank NHS-vs-estimate variances across many file references.")
+    parser.add_argument("ours", help="Our charges (CSV or JSON Lines)")
+    parser.add_argument("nhs", help="NHS charges (CSV or JSON Lines)")
+    parser.add_argument("--top", type=int, default=25, help="Number of worst variances to print")
+    parser.add_argument("--csv", help='Write every non-zero variance to this CSV file ("-" for stdout)')
+    args = parser.parse_args(argv)
+
+    ours = load_charge_sets(args.ours)
+    report = compute_variances(ours, load_charge_sets(args.nhs, schema=ours.matrix.schema))
+
+    if args.csv:
+        if args.csv == "-":
+            report.write_csv(sys.stdout)
+            return 0
+        with open(args.csv, "w", newline="") as file:
+            written = report.write_csv(file)
+        print(f"Wrote {written} variances to {args.csv}")
+
+    print(f"{len(report.references)} references compared "
+          f"({len(report.missing_from_nhs)} missing from NHS, {len(report.missing_from_ours)} missing from ours)")
+    print(f"\nTop {args.top} variances:")
+    for row in report.top(args.top):
+        print(f"  {row['reference']:<16} {row['customer']:<20} {row['field']:<35} "
+              f"ours ${row['ours']:>10.2f}  NHS ${row['nhs']:>10.2f}  variance ${row['variance']:>+10.2f}")
+    for group in ("customer", "route", "field"):
+        print(f"\nWorst by {group}:")
+        for entry in report.by_group(group)[:5]:
+            print(f"  {entry[group] or '(none)':<35} {entry['count']:>6} variances  "
+                  f"${entry['abs_variance']:>12.2f} total  ${entry['worst']:>10.2f} worst")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())